@@ -1,5 +1,10 @@
-# This will make sure the app is always imported when
-# Django starts so that shared_task will use this app.
-from .celery import app as celery_app
+# The celery app is created when it's first used: by the worker (celery -A app.celery), and by the tasks modules,
+# which register their tasks in it. Web processes don't import celery on start, only when they send a task.
+def __getattr__(name):
+    if name == "celery_app":
+        from .celery import app as celery_app
+        return celery_app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 __all__ = ('celery_app',)
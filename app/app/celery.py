@@ -1,5 +1,7 @@
 """"
     On this file we define an instance of the Celery app.
+    Tasks are registered with @app.task, importing this module, instead of @shared_task: It isn't imported when
+    Django starts (see app/__init__.py), so the web processes load celery only when they send a task.
     reference: https://docs.celeryproject.org/en/stable/django/first-steps-with-django.html
 """
 from __future__ import absolute_import, unicode_literals
@@ -8,11 +10,17 @@ import os
 
 from celery import Celery
 
+from common.task_metrics import connect_task_metrics
+
 
 # set the default Django settings module for the 'celery' program.
 #os.environ.setdefault("DJANGO_SETTINGS_MODULE", "quickpay.settings.local")
-print(f"Loading CELERY app with settings from {os.getenv('DJANGO_SETTINGS_MODULE')}")
-app = Celery("app")
+# gevent workers: make psycopg2 cooperative, so db queries don't block the other tasks
+if os.getenv("CELERY_WORKER_POOL") == "gevent":
+    from psycogreen.gevent import patch_psycopg
+    patch_psycopg()
+# Tasks enqueued in an enqueue_in_batches() block (i.e. in a request) are sent in batches
+app = Celery("app", task_cls="common.batched_task:BatchedTask")
 
 # Using a string here means the worker doesn't have to serialize
 # the configuration object to child processes.
@@ -22,3 +30,5 @@ app.config_from_object("django.conf:settings", namespace="CELERY")
 #print(f"CELERY CONFIG:\n {app.conf.humanize(with_defaults=False, censored=True)}")
 # Load task modules from all registered Django app configs.
 app.autodiscover_tasks()
+# Queue wait time, run time, retries and failures of the tasks
+connect_task_metrics()
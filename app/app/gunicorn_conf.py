@@ -0,0 +1,68 @@
+"""
+    Gunicorn settings, derived from the resources of the Fargate task (TASK_CPU and TASK_MEMORY_MIB env vars).
+    Any setting can be overridden with its GUNICORN_* env var.
+    reference: https://docs.gunicorn.org/en/stable/settings.html
+"""
+import math
+import os
+
+
+def env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def env_bool(name, default):
+    value = os.getenv(name)
+    return value.lower() in ("true", "1", "yes") if value else default
+
+
+# Task resources. 1024 cpu units = 1 vCPU.
+task_cpu = env_int("TASK_CPU", 256)
+task_memory_mib = env_int("TASK_MEMORY_MIB", 512)
+vcpus = task_cpu / 1024
+# Approximate memory used by each django process, and reserved for the master process and other containers
+worker_memory_mib = env_int("GUNICORN_WORKER_MEMORY_MIB", 96)
+reserved_memory_mib = env_int("GUNICORN_RESERVED_MEMORY_MIB", 128)
+
+# The app served, depending on the server mode
+server_mode = os.getenv("SERVER_MODE", "wsgi")
+if server_mode == "asgi":
+    wsgi_app = "app.asgi:application"
+else:
+    wsgi_app = "app.wsgi:application"
+
+# Workers: (2 x vCPUs) + 1 as recommended by gunicorn, as long as they fit in memory
+max_workers_by_cpu = math.ceil(2 * vcpus + 1)
+max_workers_by_memory = max((task_memory_mib - reserved_memory_mib) // worker_memory_mib, 1)
+workers = env_int("GUNICORN_WORKERS", min(max_workers_by_cpu, max_workers_by_memory))
+
+# Threads: keep serving other requests while a request waits on I/O (db, cache, queues).
+# With a fraction of a vCPU per task, the workers alone can't use it while they are blocked on I/O.
+# Async workers (uvicorn) handle concurrency in the event loop instead.
+threads = env_int("GUNICORN_THREADS", 1 if server_mode == "asgi" else 4)
+if server_mode == "asgi":
+    worker_class = os.getenv("GUNICORN_WORKER_CLASS") or "uvicorn.workers.UvicornWorker"
+else:
+    worker_class = os.getenv("GUNICORN_WORKER_CLASS") or ("gthread" if threads > 1 else "sync")
+
+# Restart workers after serving some requests to limit memory leaks.
+# The jitter avoids restarting all the workers at the same time.
+max_requests = env_int("GUNICORN_MAX_REQUESTS", 1000)
+max_requests_jitter = env_int("GUNICORN_MAX_REQUESTS_JITTER", max_requests // 10)
+
+# Keep connections from the load balancer open longer than the ALB idle timeout (60s),
+# otherwise gunicorn may close connections the ALB is reusing and cause 502 errors.
+keepalive = env_int("GUNICORN_KEEPALIVE", 75)
+timeout = env_int("GUNICORN_TIMEOUT", 60)
+graceful_timeout = env_int("GUNICORN_GRACEFUL_TIMEOUT", 30)
+
+# Load the app before forking workers: faster worker (re)starts and less memory thanks to copy-on-write.
+# Connections (db, cache) are opened lazily on the first request, so they are never shared between workers.
+preload_app = env_bool("GUNICORN_PRELOAD_APP", True)
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+# The heartbeat file is written often; keep it in memory instead of the container filesystem
+worker_tmp_dir = "/dev/shm"
+accesslog = "-"
+errorlog = "-"
@@ -10,6 +10,9 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.0/ref/settings/
 """
 import os
+import copy
+import json
+import math
 from pathlib import Path
 from distutils.util import strtobool
 
@@ -44,6 +47,7 @@ THIRD_PARTY_APPS = [
 
 LOCAL_APPS = [
     # Project apps go here
+    'common',
     'users',
 ]
 # https://docs.djangoproject.com/en/dev/ref/settings/#installed-apps
@@ -51,6 +55,10 @@ INSTALLED_APPS = DJANGO_APPS + THIRD_PARTY_APPS + LOCAL_APPS
 
 
 MIDDLEWARE = [
+    'common.middleware.health_check_middleware',  # Must be the first one to skip the rest
+    'common.middleware.request_profiling_middleware',
+    'common.middleware.task_batching_middleware',
+    'common.middleware.replica_routing_middleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -87,17 +95,94 @@ AUTH_USER_MODEL = "users.CustomUser"
 # Database
 # https://docs.djangoproject.com/en/4.0/ref/settings/#databases
 
+# Connection reuse is configured per stage with env vars:
+# - DB_CONN_MAX_AGE: Seconds to keep persistent connections open (0 closes them at the end of each request).
+# - DB_CONN_HEALTH_CHECKS: Check persistent connections are still usable before reusing them.
+# - DB_POOL_MAX_SIZE: Enables an in-process connection pool (per process) when > 0. Use it with DB_CONN_MAX_AGE=0.
+# - DB_POOL_MIN_SIZE: Idle connections kept open in the pool.
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "0"))
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.postgresql",
+        "ENGINE": "common.db.backends.postgresql",
         "NAME": os.environ.get("DB_NAME"),
         "USER": os.environ.get("DB_USER"),
         "PASSWORD": os.environ.get("DB_PASSWORD"),
         "HOST": os.environ.get("DB_HOST"),
         "PORT": os.environ.get("DB_PORT"),
+        "CONN_MAX_AGE": int(os.getenv("DB_CONN_MAX_AGE", "0")),
+        "CONN_HEALTH_CHECKS": strtobool(os.getenv("DB_CONN_HEALTH_CHECKS", "False")),
+        # Required when connecting through PgBouncer in transaction pooling mode
+        "DISABLE_SERVER_SIDE_CURSORS": strtobool(os.getenv("DB_DISABLE_SERVER_SIDE_CURSORS", "False")),
+        "OPTIONS": {
+            "pool": {
+                "min_size": min(DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE),
+                "max_size": DB_POOL_MAX_SIZE,
+            } if DB_POOL_MAX_SIZE > 0 else None,
+        },
     }
 }
 
+# Read replica (i.e. the reader endpoint of the Aurora cluster), enabled with DB_REPLICA_HOST.
+# Reads of GET requests go to the replica until they write. See common.db.routers
+DB_REPLICA_HOST = os.getenv("DB_REPLICA_HOST")
+DB_REPLICA_PIN_SECONDS = int(os.getenv("DB_REPLICA_PIN_SECONDS") or 5)
+DB_REPLICA_PIN_COOKIE_NAME = "db_primary"
+if DB_REPLICA_HOST:
+    DATABASES["replica"] = {
+        **copy.deepcopy(DATABASES["default"]),
+        "HOST": DB_REPLICA_HOST,
+        "PORT": os.getenv("DB_REPLICA_PORT") or DATABASES["default"]["PORT"],
+        # Connected directly, not through PgBouncer
+        "DISABLE_SERVER_SIDE_CURSORS": False,
+        # Tests use the default database
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_ROUTERS = ["common.db.routers.ReplicaRouter"]
+
+
+# Requests profiling: Server-Timing header and sampled logs with the time, db queries and cache calls of each request.
+# See common/request_profiling.py
+REQUEST_PROFILING = strtobool(os.getenv("REQUEST_PROFILING") or "False")
+# Fraction of the requests logged. Slow requests and requests with too many queries are always logged.
+REQUEST_PROFILING_SAMPLE_RATE = float(os.getenv("REQUEST_PROFILING_SAMPLE_RATE") or 0.01)
+REQUEST_PROFILING_SLOW_REQUEST_MS = int(os.getenv("REQUEST_PROFILING_SLOW_REQUEST_MS") or 1000)
+REQUEST_PROFILING_MAX_QUERIES = int(os.getenv("REQUEST_PROFILING_MAX_QUERIES") or 50)
+# The header is sent to all the clients, with the number of queries and timings of each request: Off in AWS
+REQUEST_PROFILING_SERVER_TIMING = strtobool(os.getenv("REQUEST_PROFILING_SERVER_TIMING") or "False")
+# Cache backends counting the cache hits and misses when profiling
+REDIS_CACHE_BACKEND = (
+    "common.request_profiling.ProfiledRedisCache" if REQUEST_PROFILING
+    else "django.core.cache.backends.redis.RedisCache"
+)
+LOCMEM_CACHE_BACKEND = (
+    "common.request_profiling.ProfiledLocMemCache" if REQUEST_PROFILING
+    else "django.core.cache.backends.locmem.LocMemCache"
+)
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.0/topics/cache/
+# A Redis cache is shared by all the processes. Otherwise, each process keeps its own in-memory cache (the default).
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL")
+if CACHE_REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": REDIS_CACHE_BACKEND,
+            "LOCATION": CACHE_REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": LOCMEM_CACHE_BACKEND,
+        }
+    }
+
+# Sessions
+# Use "django.contrib.sessions.backends.cached_db" to read sessions from the cache, while keeping them in the DB.
+SESSION_ENGINE = os.getenv("DJANGO_SESSION_ENGINE", "django.contrib.sessions.backends.db")
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
@@ -136,6 +221,16 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/4.0/howto/static-files/
 
 STATIC_URL = '/static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# Health checks
+# Liveness probes are answered by common.middleware.health_check_middleware
+HEALTH_CHECK_LIVENESS_PATH = "/status/"
+# Seconds to cache the results of readiness checks (database, cache and broker) in each process
+HEALTH_CHECK_CACHE_SECONDS = int(os.getenv("HEALTH_CHECK_CACHE_SECONDS", "5"))
+
+# Enable views simulating different workloads, for benchmarking the app server (see common/views.py)
+BENCHMARK_VIEWS = strtobool(os.getenv("BENCHMARK_VIEWS", "False"))
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.0/ref/settings/#default-auto-field
@@ -172,18 +267,86 @@ CELERY_TASK_SERIALIZER = "json"
 # We keep track of status and/or results in our own DB models as necessary.
 CELERY_TASK_IGNORE_RESULT = True
 # Queues and routes for celery tasks
+# Each queue is consumed by its own workers. Queues are defined in DEFAULT_WORKER_QUEUES (my_django_app/deployment_stage.py)
+# and created in SQS with CDK, which sets the url of each queue in the SQS_QUEUE_URLS env var.
 CELERY_TASK_DEFAULT_QUEUE = "default"
-SQS_DEFAULT_QUEUE_URL = f"http://broker:9324/000000000000/{CELERY_TASK_DEFAULT_QUEUE}"
-CELERY_BROKER_TRANSPORT = "sqs"
+CELERY_TASK_ROUTES = {
+    # Latency-sensitive tasks, i.e. those with users waiting for the results, go to "high_priority".
+    # Long-running tasks go to "bulk" so they don't delay the rest.
+    # i.e. "users.tasks.send_password_reset_email": {"queue": "high_priority"},
+    "users.tasks.test_task": {"queue": "default"},
+    # Bulk jobs (common.bulk)
+    "common.tasks.plan_bulk_job": {"queue": "bulk"},
+    "common.tasks.process_bulk_chunk": {"queue": "bulk"},
+}
+SQS_QUEUE_URLS = json.loads(os.getenv("SQS_QUEUE_URLS", "null")) or {
+    queue_name: f"http://broker:9324/000000000000/{queue_name}"
+    for queue_name in ["default", "high_priority", "bulk"]
+}
+SQS_DEFAULT_QUEUE_URL = SQS_QUEUE_URLS[CELERY_TASK_DEFAULT_QUEUE]
+# Visibility timeout of each queue, longer than its longest task. Set by CDK, defaults as in docker/broker/custom.conf
+SQS_VISIBILITY_TIMEOUTS = json.loads(os.getenv("SQS_VISIBILITY_TIMEOUTS", "null")) or {
+    "default": 3600,
+    "high_priority": 600,
+    "bulk": 10800,
+}
+# How workers poll SQS for messages
+SQS_POLLING_MODES = {
+    # Receive calls wait up to 20s (the SQS max) for messages to arrive, returning as soon as there is one.
+    # Tasks are picked up right away, and idle workers make ~3 calls per minute.
+    "long": {"wait_time_seconds": 20, "polling_interval": 0},
+    # Receive calls return right away, and workers sleep polling_interval seconds when the queue is empty.
+    # Tasks wait up to polling_interval seconds to be picked up.
+    "short": {"wait_time_seconds": 0, "polling_interval": 5},
+}
+SQS_POLLING_MODE = os.getenv("SQS_POLLING_MODE") or "long"
+# Messages received per call, up to 10. Workers receive up to prefetch_count (concurrency x prefetch multiplier)
+# messages per call, so the prefetch multiplier is derived from it. Use 1 for long-running tasks, so messages
+# don't wait in a busy worker while other workers are idle.
+SQS_RECEIVE_BATCH_SIZE = int(os.getenv("SQS_RECEIVE_BATCH_SIZE") or 10)
+# Worker pool, set for each workers service by CDK (BackendWorkersStack):
+# - prefork: A process per task being run. For CPU-bound tasks, with a process per vCPU.
+# - threads or gevent: Many tasks per process, running while others wait for I/O (db, http, aws). For I/O-bound tasks.
+# - solo: A single task at a time, in the worker process.
+CELERY_WORKER_POOL = os.getenv("CELERY_WORKER_POOL") or "prefork"
+# Concurrency derived from the vCPUs of the task (TASK_CPU, 1024 = 1 vCPU), or the cpu count locally
+WORKER_VCPUS = int(os.getenv("TASK_CPU")) / 1024 if os.getenv("TASK_CPU") else os.cpu_count()
+DEFAULT_WORKER_CONCURRENCY = {
+    "prefork": max(math.ceil(WORKER_VCPUS), 1),
+    "threads": max(math.ceil(WORKER_VCPUS * 8), 4),
+    "gevent": max(math.ceil(WORKER_VCPUS * 100), 50),
+    "solo": 1,
+}
+CELERY_WORKER_CONCURRENCY = int(
+    os.getenv("CELERY_WORKER_CONCURRENCY") or DEFAULT_WORKER_CONCURRENCY[CELERY_WORKER_POOL]
+)
+CELERY_WORKER_PREFETCH_MULTIPLIER = int(
+    os.getenv("CELERY_WORKER_PREFETCH_MULTIPLIER") or max(math.ceil(SQS_RECEIVE_BATCH_SIZE / CELERY_WORKER_CONCURRENCY), 1)
+)
+# Replace prefork processes after running some tasks, to release the memory they hold
+CELERY_WORKER_MAX_TASKS_PER_CHILD = int(os.getenv("CELERY_WORKER_MAX_TASKS_PER_CHILD") or 0) or None
+# kombu's SQS transport, capturing the messages of the batches of tasks sent with SendMessageBatch (common.task_batching)
+CELERY_BROKER_TRANSPORT = "common.sqs_transport:Transport"
 CELERY_BROKER_TRANSPORT_OPTIONS = {
-    "region": AWS_REGION_NAME,
+    # None uses the region of the boto3 session: AWS_REGION, set by ECS in the tasks.
+    # AWS_REGION_NAME isn't set in ECS, and its default is only meant for local development.
+    "region": os.getenv("AWS_REGION_NAME") or os.getenv("AWS_REGION"),
+    # Only applies to queues created by celery. The visibility timeout of each predefined queue is set in the queue
+    # (CDK QueuesStack and docker/broker/custom.conf), and must be longer than its longest task.
     "visibility_timeout": 3600,
-    "polling_interval": 5,
-    'predefined_queues': {  # We use an SQS queue created previously with CDK
-        CELERY_TASK_DEFAULT_QUEUE: {
-            'url': SQS_DEFAULT_QUEUE_URL  # Important: Set the queue URL with https:// here when using VPC endpoints
+    **SQS_POLLING_MODES[SQS_POLLING_MODE],
+    'predefined_queues': {  # We use SQS queues created previously with CDK
+        queue_name: {
+            'url': queue_url  # Important: Set the queue URL with https:// here when using VPC endpoints
         }
+        for queue_name, queue_url in SQS_QUEUE_URLS.items()
     }
 }
+# Send the tasks enqueued in a request in batches (SQS SendMessageBatch), after the response is ready
+TASK_ENQUEUE_BATCHING = strtobool(os.getenv("TASK_ENQUEUE_BATCHING", "True"))
+# Tasks metrics (common.task_metrics): Logged in CloudWatch Embedded Metric Format in this namespace, when set
+TASK_METRICS_NAMESPACE = os.getenv("TASK_METRICS_NAMESPACE")
+# Serve the tasks metrics for Prometheus in this port, when set
+TASK_METRICS_PROMETHEUS_PORT = int(os.getenv("TASK_METRICS_PROMETHEUS_PORT") or 0)
 # This setting makes the tasks to run synchronously. Useful for local debugging and CI tests.
 CELERY_TASK_ALWAYS_EAGER = strtobool(os.getenv("CELERY_TASK_ALWAYS_EAGER", "False"))
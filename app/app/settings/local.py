@@ -3,3 +3,6 @@ from .base import *
 
 
 EMAIL_BACKEND = "django.core.mail.backends.dummy.EmailBackend"
+
+# Server-Timing header of the profiled requests, in the browser dev tools
+REQUEST_PROFILING_SERVER_TIMING = strtobool(os.getenv("REQUEST_PROFILING_SERVER_TIMING") or "True")
@@ -3,10 +3,8 @@ from .stage import *
 
 
 # Set to your Domain here
-ALLOWED_HOSTS = [
+# The ALB uses the IP of the task while calling the health check endpoint, added on the first request
+ALLOWED_HOSTS = get_allowed_hosts([
     "scalabledjango.com",
     "www.scalabledjango.com",
-]
-# The ALB uses the IP while calling the health check endpoint
-if os.environ.get("AWS_EXECUTION_ENV"):
-    ALLOWED_HOSTS.append(gethostbyname(gethostname()))
+])
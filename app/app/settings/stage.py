@@ -1,17 +1,16 @@
 """ Staging Settings """
-from socket import gethostname, gethostbyname
+from django.core.exceptions import ImproperlyConfigured
+
+from common.hosts import get_allowed_hosts
 from .base import *
 
 DEBUG = strtobool(os.getenv("DJANGO_DEBUG", "False"))
 # Set to your Domain here
-ALLOWED_HOSTS = [
+# The ALB uses the IP of the task while calling the health check endpoint, added on the first request
+ALLOWED_HOSTS = get_allowed_hosts([
     "stage.scalabledjango.com",
-]
-# The ALB uses the IP while calling the health check endpoint
-if os.environ.get("AWS_EXECUTION_ENV"):
-    ALLOWED_HOSTS.append(gethostbyname(gethostname()))
+])
 
-print("Loading env vars..")
 # AWS Settings
 AWS_ACCOUNT_ID = os.getenv("AWS_ACCOUNT_ID")
 AWS_REGION_NAME = os.getenv("AWS_REGION_NAME")
@@ -20,10 +19,31 @@ AWS_SECRET_ACCESS_KEY = os.environ.get("AWS_SECRET_ACCESS_KEY")
 
 # Static files and Media are stored in S3 and served with CloudFront
 DEFAULT_FILE_STORAGE = 'storages.backends.s3boto3.S3Boto3Storage'
-STATICFILES_STORAGE = 'storages.backends.s3boto3.S3StaticStorage'
+# Hashed file names cached forever, uploaded with gzip and brotli variants. See common/storage.py
+STATICFILES_STORAGE = 'common.storage.CompressedManifestS3Storage'
+# Must match COMPRESSED_EXTENSIONS in StaticFilesStack, where the compressed variants are served
+STATICFILES_COMPRESSED_EXTENSIONS = [
+    ".css", ".js", ".map", ".json", ".svg", ".txt", ".html", ".xml", ".ttf", ".otf", ".eot",
+]
 AWS_STORAGE_BUCKET_NAME = os.getenv("AWS_STATIC_FILES_BUCKET_NAME")
 AWS_S3_CUSTOM_DOMAIN = os.getenv("AWS_STATIC_FILES_CLOUDFRONT_URL")
-print(f"Static files served from:{AWS_S3_CUSTOM_DOMAIN}")
+
+# Cache shared by all the tasks, stored in ElastiCache (Redis)
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL")
+CACHES = {
+    "default": {
+        "BACKEND": REDIS_CACHE_BACKEND,
+        "LOCATION": CACHE_REDIS_URL,
+        "KEY_PREFIX": "app",
+        "OPTIONS": {
+            # Fail fast instead of blocking requests if the cache is unreachable
+            "socket_connect_timeout": 1,
+            "socket_timeout": 1,
+        },
+    }
+}
+# Read sessions from the cache to take session reads off the database, keeping them in the database as well
+SESSION_ENGINE = os.getenv("DJANGO_SESSION_ENGINE", "django.contrib.sessions.backends.cached_db")
 
 # Redirects all non-HTTPS requests to HTTPS.
 SECURE_PROXY_SSL_HEADER = ("HTTP_X_FORWARDED_PROTO", "https")
@@ -31,15 +51,6 @@ SECURE_SSL_REDIRECT = False  # The TLS connection is terminated at the load bala
 
 # Override celery settings for SQS when running in AWS
 CELERY_BROKER_URL = "sqs://"  # Let celery get credentials from env vars or from queue settings
-SQS_DEFAULT_QUEUE_URL = os.getenv("SQS_DEFAULT_QUEUE_URL")
-CELERY_TASK_DEFAULT_QUEUE = SQS_DEFAULT_QUEUE_URL.split('/')[-1]  # Get the queue name
-CELERY_BROKER_TRANSPORT_OPTIONS = {
-    "region": AWS_REGION_NAME,
-    "visibility_timeout": 3600,
-    "polling_interval": 5,
-    'predefined_queues': {  # We use an SQS queue created previously with CDK
-        CELERY_TASK_DEFAULT_QUEUE: {
-            'url': SQS_DEFAULT_QUEUE_URL  # Important: Set the queue URL with https:// here when using VPC endpoints
-        }
-    }
-}
\ No newline at end of file
+# The queue urls are read in base settings from SQS_QUEUE_URLS, set by CDK
+if not os.getenv("SQS_QUEUE_URLS"):
+    raise ImproperlyConfigured("SQS_QUEUE_URLS is not set")
\ No newline at end of file
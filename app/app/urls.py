@@ -13,13 +13,16 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
-from django.urls import path
+from django.urls import include, path
 from django.views.generic import View
 from django.http import JsonResponse
+from common.health import ReadinessView
 
 
 # status endpoint for health checks
+# Liveness probes are answered by common.middleware.health_check_middleware before reaching this view
 class StatusView(View):
     def get(self, request, *args, **kwargs):
         return JsonResponse({"status": "OK"}, status=200)
@@ -28,6 +31,12 @@ class StatusView(View):
 urlpatterns = [
     # A status endpoint for health-checks
     path("status/", view=StatusView.as_view(), name="status"),
+    # Checks the database, the cache and the broker are reachable
+    path("status/ready/", view=ReadinessView.as_view(), name="status-ready"),
     # The django back-office interface
     path('admin/', admin.site.urls),
 ]
+
+if settings.BENCHMARK_VIEWS:
+    # Views simulating different workloads, to compare app server configurations
+    urlpatterns.append(path("", include("common.urls")))
@@ -1,50 +1,190 @@
-import boto3
+"""
+    Secrets Manager secrets, cached in the process.
+    - A client is created once per region and credentials, and reused by all the calls.
+    - Secrets are refreshed after a TTL, with jitter, so processes started together don't refresh them at the same time.
+    - If Secrets Manager fails while refreshing a secret (i.e. throttling or an outage), the cached value is returned
+      until max_stale_seconds, and the refresh is retried later. Other errors (i.e. the secret doesn't exist) are raised.
+    - get_secrets() fetches several secrets with BatchGetSecretValue: one call on cold start, instead of one per secret.
+    When a secret is rotated, the cached value is used until it's refreshed. Call get_secret(..., force_refresh=True)
+    when the cached value is rejected (i.e. the database password changed).
+"""
 import base64
-from botocore.exceptions import ClientError
-
-
-def get_secret(secret_name, region_name, aws_access_key_id=None, aws_secret_access_key=None):
-    # Create a Secrets Manager client
-    session = boto3.session.Session(
-        aws_access_key_id=aws_access_key_id,
-        aws_secret_access_key=aws_secret_access_key
-    )
-    client = session.client(
-        service_name='secretsmanager',
-        region_name=region_name
-    )
-
-    # We only handle the specific exceptions for the 'GetSecretValue' API.
-    # See https://docs.aws.amazon.com/secretsmanager/latest/apireference/API_GetSecretValue.html
-    try:
-        get_secret_value_response = client.get_secret_value(
-            SecretId=secret_name
-        )
-    except ClientError as e:
-        if e.response['Error']['Code'] == 'DecryptionFailureException':
-            # Secrets Manager can't decrypt the protected secret text using the provided KMS key.
-            # Deal with the exception here, and/or rethrow at your discretion.
-            raise e
-        elif e.response['Error']['Code'] == 'InternalServiceErrorException':
-            # An error occurred on the server side.
-            # Deal with the exception here, and/or rethrow at your discretion.
-            raise e
-        elif e.response['Error']['Code'] == 'InvalidParameterException':
-            # You provided an invalid value for a parameter.
-            # Deal with the exception here, and/or rethrow at your discretion.
-            raise e
-        elif e.response['Error']['Code'] == 'InvalidRequestException':
-            # You provided a parameter value that is not valid for the current state of the resource.
-            # Deal with the exception here, and/or rethrow at your discretion.
-            raise e
-        elif e.response['Error']['Code'] == 'ResourceNotFoundException':
-            # We can't find the resource that you asked for.
-            # Deal with the exception here, and/or rethrow at your discretion.
-            raise e
-    else:
-        # Decrypts secret using the associated KMS CMK.
-        # Depending on whether the secret is a string or binary, one of these fields will be populated.
-        if 'SecretString' in get_secret_value_response:
-            return get_secret_value_response['SecretString']
+import logging
+import random
+import threading
+import time
+
+import boto3
+from botocore.exceptions import ClientError, BotoCoreError
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL_SECONDS = 300
+# Secrets are refreshed after ttl * (1 - jitter) to ttl seconds
+DEFAULT_TTL_JITTER = 0.2
+# Cached values are returned while Secrets Manager fails, up to this age
+DEFAULT_MAX_STALE_SECONDS = 3600
+# Time to wait before trying to refresh a secret again, after a failed refresh
+RETRY_SECONDS = 30
+# Secrets per BatchGetSecretValue call
+MAX_BATCH_SECRETS = 20
+# Errors Secrets Manager may recover from. Cached values are returned while they happen.
+TRANSIENT_ERROR_CODES = {
+    "InternalServiceError",
+    "InternalServiceErrorException",
+    "ThrottlingException",
+    "RequestLimitExceeded",
+    "ServiceUnavailable",
+}
+
+
+class CachedSecret:
+
+    def __init__(self, value, version_id, fetched_at, refresh_at):
+        self.value = value
+        self.version_id = version_id
+        self.fetched_at = fetched_at
+        self.refresh_at = refresh_at
+
+
+class SecretsCache:
+    """ Secrets of a Secrets Manager client, cached in memory. Thread safe """
+
+    def __init__(
+            self,
+            client,
+            ttl_seconds=DEFAULT_TTL_SECONDS,
+            ttl_jitter=DEFAULT_TTL_JITTER,
+            max_stale_seconds=DEFAULT_MAX_STALE_SECONDS,
+    ):
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+        self.ttl_jitter = ttl_jitter
+        self.max_stale_seconds = max_stale_seconds
+        self._secrets = {}
+        self._lock = threading.Lock()
+
+    def get(self, secret_id, force_refresh=False):
+        """ The value of the secret: a str, or bytes for binary secrets """
+        cached = self._get_cached(secret_id)
+        if cached is not None and not force_refresh and time.monotonic() < cached.refresh_at:
+            return cached.value
+        try:
+            response = self.client.get_secret_value(SecretId=secret_id)
+        except (ClientError, BotoCoreError) as error:
+            return self._stale_value(secret_id, cached, error)
+        return self._store(secret_id, response).value
+
+    def get_many(self, secret_ids, force_refresh=False):
+        """ The values of the secrets, by secret id. Secrets not cached are fetched with BatchGetSecretValue """
+        values = {}
+        to_fetch = {}
+        now = time.monotonic()
+        for secret_id in dict.fromkeys(secret_ids):
+            cached = self._get_cached(secret_id)
+            if cached is not None and not force_refresh and now < cached.refresh_at:
+                values[secret_id] = cached.value
+            else:
+                to_fetch[secret_id] = cached
+        if not to_fetch:
+            return values
+        if not hasattr(self.client, "batch_get_secret_value"):
+            # Clients older than the BatchGetSecretValue API
+            for secret_id in to_fetch:
+                values[secret_id] = self.get(secret_id, force_refresh=force_refresh)
+            return values
+        fetch_ids = list(to_fetch)
+        for i in range(0, len(fetch_ids), MAX_BATCH_SECRETS):
+            values.update(self._batch_get(fetch_ids[i:i + MAX_BATCH_SECRETS], to_fetch))
+        return values
+
+    def invalidate(self, secret_id=None):
+        """ Remove a secret from the cache, or all of them """
+        with self._lock:
+            if secret_id is None:
+                self._secrets.clear()
+            else:
+                self._secrets.pop(secret_id, None)
+
+    def _batch_get(self, secret_ids, cached_by_id):
+        values = {}
+        try:
+            response = self.client.batch_get_secret_value(SecretIdList=secret_ids)
+        except (ClientError, BotoCoreError) as error:
+            return {secret_id: self._stale_value(secret_id, cached_by_id[secret_id], error) for secret_id in secret_ids}
+        for secret in response["SecretValues"]:
+            # Secrets may be requested by name or ARN
+            secret_id = secret["Name"] if secret["Name"] in cached_by_id else secret["ARN"]
+            values[secret_id] = self._store(secret_id, secret).value
+        for secret_error in response.get("Errors", []):
+            secret_id = secret_error["SecretId"]
+            error = ClientError(
+                {"Error": {"Code": secret_error["ErrorCode"], "Message": secret_error.get("Message", "")}},
+                "BatchGetSecretValue",
+            )
+            values[secret_id] = self._stale_value(secret_id, cached_by_id.get(secret_id), error)
+        return values
+
+    def _get_cached(self, secret_id):
+        with self._lock:
+            return self._secrets.get(secret_id)
+
+    def _store(self, secret_id, response):
+        # Depending on whether the secret is a string or binary, one of these fields is populated
+        if "SecretString" in response:
+            value = response["SecretString"]
         else:
-            return base64.b64decode(get_secret_value_response['SecretBinary'])
+            value = base64.b64decode(response["SecretBinary"])
+        now = time.monotonic()
+        ttl = self.ttl_seconds * (1 - random.uniform(0, self.ttl_jitter))
+        cached = CachedSecret(value, response.get("VersionId"), fetched_at=now, refresh_at=now + ttl)
+        with self._lock:
+            self._secrets[secret_id] = cached
+        return cached
+
+    def _stale_value(self, secret_id, cached, error):
+        """ The cached value while Secrets Manager fails, if not too old. Otherwise the error is raised """
+        now = time.monotonic()
+        if cached is None or not is_transient_error(error) or now - cached.fetched_at > self.max_stale_seconds:
+            raise error
+        logger.warning(f"Using the cached value of the secret {secret_id}, refreshing it failed: {error}")
+        with self._lock:
+            cached.refresh_at = now + RETRY_SECONDS * random.uniform(1, 1 + self.ttl_jitter)
+        return cached.value
+
+
+def is_transient_error(error):
+    if isinstance(error, ClientError):
+        return error.response["Error"]["Code"] in TRANSIENT_ERROR_CODES
+    # Connection errors and timeouts
+    return isinstance(error, BotoCoreError)
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_secrets_cache(region_name, aws_access_key_id=None, aws_secret_access_key=None):
+    """ The secrets cache of the region and credentials, with its client. Created on first use """
+    key = (region_name, aws_access_key_id, aws_secret_access_key)
+    with _caches_lock:
+        if key not in _caches:
+            session = boto3.session.Session(
+                aws_access_key_id=aws_access_key_id,
+                aws_secret_access_key=aws_secret_access_key
+            )
+            client = session.client(service_name="secretsmanager", region_name=region_name)
+            _caches[key] = SecretsCache(client)
+        return _caches[key]
+
+
+def get_secret(secret_name, region_name, aws_access_key_id=None, aws_secret_access_key=None, force_refresh=False):
+    cache = get_secrets_cache(region_name, aws_access_key_id, aws_secret_access_key)
+    return cache.get(secret_name, force_refresh=force_refresh)
+
+
+def get_secrets(secret_names, region_name, aws_access_key_id=None, aws_secret_access_key=None):
+    """ The values of several secrets, by name, fetched together """
+    cache = get_secrets_cache(region_name, aws_access_key_id, aws_secret_access_key)
+    return cache.get_many(secret_names)
@@ -0,0 +1,30 @@
+from django.contrib import admin
+from .models import BulkJob, BulkChunk
+
+
+class BulkChunkInline(admin.TabularInline):
+    model = BulkChunk
+    fields = ["first_id", "last_id", "size", "status", "attempts", "processed", "started_at", "finished_at"]
+    readonly_fields = fields
+    can_delete = False
+    extra = 0
+    max_num = 0
+    show_change_link = True
+
+
+@admin.register(BulkJob)
+class BulkJobAdmin(admin.ModelAdmin):
+    list_display = ["pk", "name", "status", "total_chunks", "progress", "created_at", "finished_at"]
+    list_filter = ["status", "name"]
+    readonly_fields = ["progress"]
+    inlines = [BulkChunkInline]
+
+    def progress(self, job):
+        return job.progress()
+
+
+@admin.register(BulkChunk)
+class BulkChunkAdmin(admin.ModelAdmin):
+    list_display = ["pk", "job", "first_id", "last_id", "status", "attempts", "processed", "finished_at"]
+    list_filter = ["status"]
+    list_select_related = ["job"]
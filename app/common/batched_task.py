@@ -0,0 +1,16 @@
+"""
+    Task class of the celery app (see app/celery.py). Kept apart from common.task_batching, which is imported by the
+    web processes on start (task_batching_middleware), so they don't import celery until they send a task.
+"""
+from celery import Task
+
+from .task_batching import add_to_batch
+
+
+class BatchedTask(Task):
+    """ Tasks are added to the current batch, if any, instead of being sent. See common.task_batching """
+
+    def apply_async(self, args=None, kwargs=None, **options):
+        if add_to_batch(self, args, kwargs, options):
+            return self.AsyncResult(options["task_id"])
+        return super().apply_async(args, kwargs, **options)
@@ -0,0 +1,185 @@
+"""
+    Process large querysets in workers: the rows are split in ranges of ids (chunks), and each chunk is processed by
+    a task in the bulk queue. Chunks are processed in parallel, so throughput grows with the number of bulk workers.
+    Progress is tracked in the database (BulkJob and BulkChunk), and failed chunks can be resumed.
+
+        @bulk_handler(queryset=lambda: CustomUser.objects.filter(is_active=True))
+        def update_users(users):
+            # users: the rows of a chunk
+            ...
+            return len(users)  # Rows processed
+
+        job = update_users.start(chunk_size=1000)
+
+    Handlers must be defined in a tasks module, so workers register them on start. Chunks may be processed more than
+    once (i.e. after a worker is stopped), so handlers must be idempotent.
+"""
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Q, F
+from django.utils import timezone
+
+from .models import BulkJob, BulkChunk
+
+
+DEFAULT_CHUNK_SIZE = 1000
+# Chunks are created and dispatched in pages while planning
+PLANNING_PAGE_SIZE = 100
+
+_handlers = {}
+
+
+class BulkHandler:
+
+    def __init__(self, func, queryset):
+        self.func = func
+        self.queryset = queryset  # Callable returning the queryset
+        self.name = f"{func.__module__}.{func.__name__}"
+
+    def __call__(self, queryset):
+        return self.func(queryset)
+
+    def start(self, chunk_size=DEFAULT_CHUNK_SIZE, max_attempts=3):
+        """ Create a job and start planning its chunks in a worker, once the current transaction is committed """
+        from .tasks import plan_bulk_job
+
+        job = BulkJob.objects.create(name=self.name, chunk_size=chunk_size, max_attempts=max_attempts)
+        transaction.on_commit(lambda: plan_bulk_job.delay(job.pk))
+        return job
+
+
+def bulk_handler(queryset):
+    def decorator(func):
+        handler = BulkHandler(func, queryset)
+        _handlers[handler.name] = handler
+        return handler
+    return decorator
+
+
+def get_stale_chunk_seconds():
+    """
+    Running chunks not finished after the visibility timeout of the bulk queue, longer than its longest task, are
+    considered lost (i.e. the worker was stopped), and run again
+    """
+    queue_name = settings.CELERY_TASK_ROUTES["common.tasks.process_bulk_chunk"]["queue"]
+    return settings.SQS_VISIBILITY_TIMEOUTS[queue_name]
+
+
+def get_handler(name):
+    return _handlers[name]
+
+
+def split_id_ranges(queryset, chunk_size, after_id=None):
+    """ Yield (first_id, last_id, size) ranges of up to chunk_size rows, with keyset pagination """
+    ids = queryset.order_by("pk").values_list("pk", flat=True)
+    while True:
+        page = ids if after_id is None else ids.filter(pk__gt=after_id)
+        chunk_ids = list(page[:chunk_size])
+        if not chunk_ids:
+            return
+        yield chunk_ids[0], chunk_ids[-1], len(chunk_ids)
+        after_id = chunk_ids[-1]
+
+
+def plan_job(job, dispatch):
+    """
+    Split the queryset of the job in chunks, calling dispatch(chunks) on each page of new chunks.
+    Planning continues after the last chunk already created, so it can be resumed.
+    """
+    handler = get_handler(job.name)
+    after_id = job.chunks.aggregate(after_id=Max("last_id"))["after_id"]
+    page = []
+    for first_id, last_id, size in split_id_ranges(handler.queryset(), job.chunk_size, after_id=after_id):
+        page.append(BulkChunk(job=job, first_id=first_id, last_id=last_id, size=size))
+        if len(page) == PLANNING_PAGE_SIZE:
+            dispatch(BulkChunk.objects.bulk_create(page))
+            page = []
+    if page:
+        dispatch(BulkChunk.objects.bulk_create(page))
+    BulkJob.objects.filter(pk=job.pk, status=BulkJob.PLANNING).update(
+        status=BulkJob.RUNNING,
+        total_chunks=job.chunks.count(),
+    )
+    finish_job_if_done(job.pk)
+
+
+def process_chunk(chunk_id):
+    """
+    Process the rows of a chunk. Returns the chunk, or None if it's already done or being processed.
+    Errors are saved in the chunk and raised.
+    """
+    now = timezone.now()
+    # Only one worker takes the chunk. SQS messages may be delivered more than once.
+    taken = BulkChunk.objects.filter(
+        Q(status__in=[BulkChunk.PENDING, BulkChunk.FAILED])
+        | Q(status=BulkChunk.RUNNING, started_at__lt=now - timedelta(seconds=get_stale_chunk_seconds())),
+        pk=chunk_id,
+    ).update(status=BulkChunk.RUNNING, attempts=F("attempts") + 1, started_at=now)
+    if not taken:
+        return None
+    chunk = BulkChunk.objects.select_related("job").get(pk=chunk_id)
+    handler = get_handler(chunk.job.name)
+    try:
+        processed = handler(handler.queryset().filter(pk__gte=chunk.first_id, pk__lte=chunk.last_id))
+    except Exception:
+        chunk.status = BulkChunk.FAILED
+        chunk.error = traceback.format_exc()
+        chunk.finished_at = timezone.now()
+        chunk.save(update_fields=["status", "error", "finished_at"])
+        if chunk.attempts >= chunk.job.max_attempts:
+            finish_job_if_done(chunk.job_id)
+        raise
+    chunk.status = BulkChunk.DONE
+    chunk.processed = processed if processed is not None else chunk.size
+    chunk.error = ""
+    chunk.finished_at = timezone.now()
+    chunk.save(update_fields=["status", "processed", "error", "finished_at"])
+    finish_job_if_done(chunk.job_id)
+    return chunk
+
+
+def finish_job_if_done(job_id):
+    """ Finish the job once planned and all its chunks are done or failed without attempts left """
+    job = BulkJob.objects.get(pk=job_id)
+    if job.status != BulkJob.RUNNING:
+        return
+    unfinished = job.chunks.filter(
+        Q(status__in=[BulkChunk.PENDING, BulkChunk.RUNNING])
+        | Q(status=BulkChunk.FAILED, attempts__lt=job.max_attempts)
+    )
+    if unfinished.exists():
+        return
+    failed = job.chunks.filter(status=BulkChunk.FAILED).exists()
+    BulkJob.objects.filter(pk=job_id, status=BulkJob.RUNNING).update(
+        status=BulkJob.FAILED if failed else BulkJob.DONE,
+        finished_at=timezone.now(),
+    )
+
+
+def chunks_to_resume(job):
+    """ Chunks not done: pending (i.e. lost messages), failed, or running for too long """
+    stale_started_at = timezone.now() - timedelta(seconds=get_stale_chunk_seconds())
+    return job.chunks.filter(
+        Q(status__in=[BulkChunk.PENDING, BulkChunk.FAILED])
+        | Q(status=BulkChunk.RUNNING, started_at__lt=stale_started_at)
+    )
+
+
+def resume_job(job, plan=False):
+    """
+    Dispatch the chunks not done again, giving failed chunks all their attempts again.
+    With plan=True, planning continues after the last chunk created. Use it only if the planning task was lost.
+    """
+    from .tasks import plan_bulk_job, dispatch_chunks
+
+    job.chunks.filter(status=BulkChunk.FAILED).update(attempts=0)
+    if job.status == BulkJob.FAILED:
+        BulkJob.objects.filter(pk=job.pk).update(status=BulkJob.RUNNING, finished_at=None)
+    chunks = list(chunks_to_resume(job))
+    dispatch_chunks(chunks)
+    if plan and job.status == BulkJob.PLANNING:
+        plan_bulk_job.delay(job.pk)
+    return chunks
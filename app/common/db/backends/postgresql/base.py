@@ -0,0 +1,121 @@
+"""
+    PostgreSQL backend with connection reuse features on top of django.db.backends.postgresql:
+    - CONN_HEALTH_CHECKS: persistent connections are checked (lazily) before being reused in a new request.
+      This is the same behaviour added to Django in 4.1, so this setting keeps working after upgrading.
+    - OPTIONS["pool"]: an optional in-process psycopg2 connection pool shared by all the threads of a process.
+      Connections are taken from the pool on connect and given back to it on close, instead of being closed.
+"""
+import os
+import threading
+
+from psycopg2 import pool as psycopg2_pool
+from django.db.backends.postgresql import base as postgresql_base
+
+
+# Pools are shared by all the threads of a process. They are never shared with forked processes (i.e. gunicorn
+# workers when using preload_app), as sockets can't be shared safely between processes.
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, conn_params, min_size, max_size):
+    key = (alias, os.getpid())
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = psycopg2_pool.ThreadedConnectionPool(min_size, max_size, **conn_params)
+        return _pools[key]
+
+
+def close_pools():
+    """ Close all the connections held by the pools of the current process """
+    with _pools_lock:
+        for (alias, pid), connection_pool in list(_pools.items()):
+            if pid == os.getpid():
+                connection_pool.closeall()
+                del _pools[(alias, pid)]
+
+
+class DatabaseWrapper(postgresql_base.DatabaseWrapper):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.health_check_enabled = self.settings_dict.get("CONN_HEALTH_CHECKS", False)
+        self.health_check_done = False
+        # The pool is disabled when not set or when set to an empty value
+        self.pool_options = self.settings_dict["OPTIONS"].get("pool") or None
+
+    @property
+    def pool(self):
+        # Note that psycopg2 pools keep up to min_size idle connections open, and close the ones above it on release.
+        # max_size is the limit of connections in use at the same time; it must be >= the threads per process.
+        return get_pool(
+            alias=self.alias,
+            conn_params=self.get_connection_params(),
+            min_size=self.pool_options.get("min_size", 1),
+            max_size=self.pool_options.get("max_size", 10),
+        )
+
+    def get_connection_params(self):
+        conn_params = super().get_connection_params()
+        # Not a psycopg2 connection parameter
+        conn_params.pop("pool", None)
+        return conn_params
+
+    def get_new_connection(self, conn_params):
+        if self.pool_options is None:
+            connection = super().get_new_connection(conn_params)
+        else:
+            connection = self._get_pooled_connection()
+        self.health_check_done = True
+        return connection
+
+    def _get_pooled_connection(self):
+        connection_pool = self.pool
+        connection = connection_pool.getconn()
+        # Idle connections in the pool may have been closed by the server (i.e. after a failover)
+        if self.health_check_enabled and not self._is_usable_connection(connection):
+            connection_pool.putconn(connection, close=True)
+            connection = connection_pool.getconn()
+        # Same session settings applied by the parent class to new connections
+        options = self.settings_dict["OPTIONS"]
+        try:
+            self.isolation_level = options["isolation_level"]
+        except KeyError:
+            self.isolation_level = connection.isolation_level
+        else:
+            if self.isolation_level != connection.isolation_level:
+                connection.set_session(isolation_level=self.isolation_level)
+        postgresql_base.psycopg2.extras.register_default_jsonb(conn_or_curs=connection, loads=lambda x: x)
+        return connection
+
+    @staticmethod
+    def _is_usable_connection(connection):
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            # Connections new to the pool aren't in autocommit: End the transaction opened by the probe, or
+            # the session settings (autocommit, isolation level) can't be changed
+            if not connection.autocommit:
+                connection.rollback()
+        except postgresql_base.Database.Error:
+            return False
+        return True
+
+    def _close(self):
+        if self.connection is not None and self.pool_options is not None:
+            with self.wrap_database_errors:
+                # The pool rollbacks any open transaction and drops broken connections
+                return self.pool.putconn(self.connection, close=bool(self.connection.closed))
+        return super()._close()
+
+    def close_if_unusable_or_obsolete(self):
+        super().close_if_unusable_or_obsolete()
+        # Called at the beginning and the end of each request. Check the connection again on its next usage.
+        self.health_check_done = False
+
+    def ensure_connection(self):
+        if self.connection is not None and self.health_check_enabled and not self.health_check_done:
+            if not self.is_usable():
+                self.close()
+            self.health_check_done = True
+        super().ensure_connection()
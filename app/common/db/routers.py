@@ -0,0 +1,67 @@
+"""
+    Database router sending reads to the read replica (the "replica" database, the reader endpoint of the cluster).
+    - Reads go to the replica only in a replica_reads() block. replica_routing_middleware opens one for requests with a
+      safe method (GET, HEAD, OPTIONS), i.e. list views in the admin. Everything else (other requests, celery tasks,
+      management commands) reads from the primary: i.e. a task enqueued after a write must find the new rows, even if
+      the replica is lagging behind.
+    - Read your writes: After a write in the block, the following reads go to the primary. Reads in a transaction
+      always go to the primary.
+    - Writes and migrations always go to the primary ("default").
+"""
+import contextvars
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+
+REPLICA_DB_ALIAS = "replica"
+
+# Routing state of the current block: {"pinned": bool, "wrote": bool}. None outside a replica_reads() block
+_state = contextvars.ContextVar("replica_routing_state", default=None)
+
+
+@contextmanager
+def replica_reads(pinned=False):
+    """
+    Read from the replica in this block, until the first write (or never, when pinned). Yields the state of the block:
+    state["pinned"] is True once reads are pinned to the primary, and state["wrote"] once the block writes.
+    """
+    # A mutable state: sync code run from async code (sync_to_async) pins the same block
+    state = {"pinned": pinned, "wrote": False}
+    token = _state.set(state)
+    try:
+        yield state
+    finally:
+        _state.reset(token)
+
+
+def pin_to_primary():
+    """ Send the next reads of the current block to the primary """
+    state = _state.get()
+    if state is not None:
+        state["pinned"] = True
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state["pinned"]:
+            return DEFAULT_DB_ALIAS
+        # Reads in a transaction must see its writes and locks
+        if transaction.get_connection(DEFAULT_DB_ALIAS).in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return REPLICA_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state["pinned"] = state["wrote"] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both databases have the same data
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,103 @@
+"""
+    Readiness checks of the services required by the app: the database, the cache and the broker (SQS).
+    Results are cached for a few seconds in each process, so frequent probes don't add load to the services.
+"""
+import logging
+import threading
+import time
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.http import JsonResponse
+from django.views.generic import View
+
+
+logger = logging.getLogger(__name__)
+
+_sqs_client = None
+_readiness_lock = threading.Lock()
+_readiness = {"checked_at": None, "checks": None}
+
+
+def get_sqs_client():
+    global _sqs_client
+    if _sqs_client is None:
+        # Imported on the first readiness check, not when the urls are loaded (see benchmark_startup)
+        import boto3
+        from botocore.config import Config
+
+        queue_url = urlsplit(settings.SQS_DEFAULT_QUEUE_URL)
+        _sqs_client = boto3.client(
+            "sqs",
+            region_name=settings.AWS_REGION_NAME,
+            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+            endpoint_url=f"{queue_url.scheme}://{queue_url.netloc}",
+            # Fail fast, a probe must not hang
+            config=Config(connect_timeout=1, read_timeout=1, retries={"max_attempts": 0}),
+        )
+    return _sqs_client
+
+
+def check_database():
+    with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+        cursor.execute("SELECT 1")
+
+
+def check_cache():
+    cache.set("health-check", "OK", timeout=30)
+    if cache.get("health-check") != "OK":
+        raise RuntimeError("Value not found in the cache")
+
+
+def check_broker():
+    if settings.CELERY_TASK_ALWAYS_EAGER:
+        return  # Tasks don't go through the broker
+    get_sqs_client().get_queue_attributes(
+        QueueUrl=settings.SQS_DEFAULT_QUEUE_URL,
+        AttributeNames=["QueueArn"],
+    )
+
+
+CHECKS = {
+    "database": check_database,
+    "cache": check_cache,
+    "broker": check_broker,
+}
+
+
+def run_checks():
+    results = {}
+    for name, check in CHECKS.items():
+        start = time.perf_counter()
+        try:
+            check()
+        except Exception as e:
+            logger.warning(f"Readiness check '{name}' failed: {e!r}")
+            ok = False
+        else:
+            ok = True
+        results[name] = {"ok": ok, "duration_ms": round((time.perf_counter() - start) * 1000, 2)}
+    return results
+
+
+def get_readiness():
+    # Concurrent probes wait for the running checks instead of checking the services again
+    with _readiness_lock:
+        checked_at = _readiness["checked_at"]
+        if checked_at is None or time.monotonic() - checked_at >= settings.HEALTH_CHECK_CACHE_SECONDS:
+            _readiness["checks"] = run_checks()
+            _readiness["checked_at"] = time.monotonic()
+        return _readiness["checks"]
+
+
+class ReadinessView(View):
+    def get(self, request, *args, **kwargs):
+        checks = get_readiness()
+        is_ready = all(check["ok"] for check in checks.values())
+        return JsonResponse(
+            {"status": "OK" if is_ready else "ERROR", "checks": checks},
+            status=200 if is_ready else 503
+        )
@@ -0,0 +1,40 @@
+"""
+    ALLOWED_HOSTS of the app running in AWS, including the private IP of the task: The load balancer uses it as the
+    host of the health check requests. The IP is resolved on the first request validating the host, instead of when
+    the settings are imported, so the DNS lookup doesn't delay the start of the app.
+"""
+import os
+import threading
+from socket import gethostbyname, gethostname
+
+
+class TaskHosts(list):
+    """ A list of hosts, resolving and adding the IP of the task (or container) the first time it's read """
+
+    def __init__(self, hosts):
+        super().__init__(hosts)
+        self._resolved = False
+        self._lock = threading.Lock()
+
+    def _resolve(self):
+        if self._resolved:
+            return
+        with self._lock:
+            if not self._resolved:
+                self.append(gethostbyname(gethostname()))
+                self._resolved = True
+
+    def __iter__(self):
+        self._resolve()
+        return super().__iter__()
+
+    def __contains__(self, host):
+        self._resolve()
+        return super().__contains__(host)
+
+
+def get_allowed_hosts(hosts):
+    """ The hosts, plus the IP of the task when running in AWS (ECS) """
+    if os.getenv("AWS_EXECUTION_ENV"):
+        return TaskHosts(hosts)
+    return list(hosts)
@@ -0,0 +1,100 @@
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management import BaseCommand
+from django.core.signals import request_started, request_finished
+from django.db import connections, DEFAULT_DB_ALIAS
+
+from common.db.backends.postgresql.base import close_pools
+
+
+# Connection settings applied on each mode
+MODES = {
+    "new": {"CONN_MAX_AGE": 0, "CONN_HEALTH_CHECKS": False, "pool": None},
+    "persistent": {"CONN_MAX_AGE": 600, "CONN_HEALTH_CHECKS": True, "pool": None},
+    "pooled": {"CONN_MAX_AGE": 0, "CONN_HEALTH_CHECKS": True, "pool": {"min_size": 2, "max_size": 10}},
+}
+
+
+def percentile(sorted_values, p):
+    index = max(math.ceil(p / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[index]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark requests/sec and latency of requests running db queries, "
+        "with and without connection reuse (persistent connections and pooling)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=2000, help="Total requests per mode")
+        parser.add_argument("--concurrency", type=int, default=8, help="Concurrent threads sending requests")
+        parser.add_argument("--queries", type=int, default=1, help="Queries executed by each request")
+        parser.add_argument(
+            "--mode",
+            dest="modes",
+            choices=MODES.keys(),
+            action="append",
+            help="Modes to benchmark. All the modes are run by default."
+        )
+
+    def handle(self, *args, **options):
+        modes = options["modes"] or list(MODES.keys())
+        self.stdout.write(f"{'mode':<12}{'req/s':>10}{'p50 (ms)':>12}{'p99 (ms)':>12}")
+        for mode in modes:
+            latencies, elapsed = self.run_mode(
+                mode,
+                total_requests=options["requests"],
+                concurrency=options["concurrency"],
+                queries=options["queries"],
+            )
+            latencies.sort()
+            self.stdout.write(
+                f"{mode:<12}{len(latencies) / elapsed:>10.1f}"
+                f"{percentile(latencies, 50) * 1000:>12.2f}{percentile(latencies, 99) * 1000:>12.2f}"
+            )
+
+    def run_mode(self, mode, total_requests, concurrency, queries):
+        # Connections are created per thread from the shared settings dict, so the mode applies to the new threads
+        db_settings = connections.settings[DEFAULT_DB_ALIAS]
+        original_settings = {
+            "CONN_MAX_AGE": db_settings["CONN_MAX_AGE"],
+            "CONN_HEALTH_CHECKS": db_settings.get("CONN_HEALTH_CHECKS", False),
+            "pool": db_settings["OPTIONS"].get("pool"),
+        }
+        self.apply_settings(db_settings, MODES[mode])
+        try:
+            requests_per_thread = [total_requests // concurrency] * concurrency
+            requests_per_thread[0] += total_requests % concurrency
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                results = executor.map(lambda n: self.send_requests(n, queries), requests_per_thread)
+                latencies = [latency for thread_latencies in results for latency in thread_latencies]
+            elapsed = time.perf_counter() - start
+        finally:
+            self.apply_settings(db_settings, original_settings)
+            close_pools()
+        return latencies, elapsed
+
+    @staticmethod
+    def apply_settings(db_settings, mode_settings):
+        db_settings["CONN_MAX_AGE"] = mode_settings["CONN_MAX_AGE"]
+        db_settings["CONN_HEALTH_CHECKS"] = mode_settings["CONN_HEALTH_CHECKS"]
+        db_settings["OPTIONS"]["pool"] = mode_settings["pool"]
+
+    def send_requests(self, n, queries):
+        # Simulate the request cycle: django opens/reuses/closes db connections on the request signals
+        connection = connections[DEFAULT_DB_ALIAS]
+        latencies = []
+        for _ in range(n):
+            start = time.perf_counter()
+            request_started.send(sender=self.__class__)
+            with connection.cursor() as cursor:
+                for _ in range(queries):
+                    cursor.execute("SELECT 1")
+            request_finished.send(sender=self.__class__)
+            latencies.append(time.perf_counter() - start)
+        connection.close()
+        return latencies
@@ -0,0 +1,69 @@
+import http.client
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.core.management import BaseCommand
+
+from .benchmark_db_connections import percentile
+
+
+class Command(BaseCommand):
+    help = "Send concurrent requests to a url and report requests/sec and latency (i.e. to compare app servers)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("urls", nargs="+", help="Urls to benchmark, one after the other")
+        parser.add_argument("--requests", type=int, default=1000, help="Total requests per url")
+        parser.add_argument("--concurrency", type=int, default=32, help="Concurrent clients (connections)")
+        parser.add_argument("--timeout", type=float, default=60, help="Request timeout in seconds")
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'url':<60}{'req/s':>10}{'p50 (ms)':>12}{'p99 (ms)':>12}{'errors':>8}")
+        for url in options["urls"]:
+            latencies, errors, elapsed = self.run_url(
+                url,
+                total_requests=options["requests"],
+                concurrency=options["concurrency"],
+                timeout=options["timeout"],
+            )
+            latencies.sort()
+            p50 = percentile(latencies, 50) * 1000 if latencies else 0
+            p99 = percentile(latencies, 99) * 1000 if latencies else 0
+            self.stdout.write(f"{url:<60}{len(latencies) / elapsed:>10.1f}{p50:>12.2f}{p99:>12.2f}{errors:>8}")
+
+    def run_url(self, url, total_requests, concurrency, timeout):
+        requests_per_client = [total_requests // concurrency] * concurrency
+        requests_per_client[0] += total_requests % concurrency
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(lambda n: self.send_requests(url, n, timeout), requests_per_client))
+        elapsed = time.perf_counter() - start
+        latencies = [latency for client_latencies, _ in results for latency in client_latencies]
+        errors = sum(client_errors for _, client_errors in results)
+        return latencies, errors, elapsed
+
+    @staticmethod
+    def send_requests(url, n, timeout):
+        # Each client keeps its connection alive, like a browser or the load balancer would
+        parts = urlsplit(url)
+        connection_class = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+        connection = connection_class(parts.netloc, timeout=timeout)
+        path = parts.path + (f"?{parts.query}" if parts.query else "")
+        latencies = []
+        errors = 0
+        for _ in range(n):
+            start = time.perf_counter()
+            try:
+                connection.request("GET", path)
+                response = connection.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException):
+                errors += 1
+                connection.close()
+                continue
+            if response.status >= 400:
+                errors += 1
+            else:
+                latencies.append(time.perf_counter() - start)
+        connection.close()
+        return latencies, errors
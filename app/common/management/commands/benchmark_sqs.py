@@ -0,0 +1,119 @@
+import socket
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from kombu import Consumer, Producer, Queue
+
+from app.celery import app as celery_app
+from .benchmark_db_connections import percentile
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the SQS polling modes (i.e. against ElasticMQ): enqueue messages at a fixed rate while consuming "
+        "them, and report the enqueue-to-start latency and the SQS requests made per 1k messages"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=1000, help="Messages sent per mode")
+        parser.add_argument("--rate", type=float, default=50, help="Messages sent per second")
+        parser.add_argument("--queue", default=settings.CELERY_TASK_DEFAULT_QUEUE, help="Queue name. It's purged!")
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.SQS_RECEIVE_BATCH_SIZE,
+            help="Messages received per call (prefetch count)"
+        )
+        parser.add_argument(
+            "--mode",
+            dest="modes",
+            choices=settings.SQS_POLLING_MODES.keys(),
+            action="append",
+            help="Polling modes to benchmark. All the modes are run by default."
+        )
+
+    def handle(self, *args, **options):
+        modes = options["modes"] or list(settings.SQS_POLLING_MODES.keys())
+        # SQS requests by operation, counted in the SQS client shared by all the channels
+        self.requests = Counter()
+        self.stdout.write(
+            f"{'mode':<8}{'p50 (ms)':>10}{'p99 (ms)':>10}{'max (ms)':>10}"
+            f"{'receive/1k':>12}{'empty/1k':>10}{'total/1k':>10}{'lost':>6}"
+        )
+        for mode in modes:
+            latencies, lost = self.run_mode(
+                mode,
+                queue_name=options["queue"],
+                total_messages=options["messages"],
+                rate=options["rate"],
+                batch_size=options["batch_size"],
+            )
+            latencies.sort()
+            p50, p99, p100 = (percentile(latencies, p) * 1000 if latencies else 0 for p in (50, 99, 100))
+            per_1k = 1000 / options["messages"]
+            receive, empty = self.requests["ReceiveMessage"], self.requests["EmptyReceiveMessage"]
+            total = sum(self.requests.values()) - empty
+            self.stdout.write(
+                f"{mode:<8}{p50:>10.1f}{p99:>10.1f}{p100:>10.1f}"
+                f"{receive * per_1k:>12.0f}{empty * per_1k:>10.0f}{total * per_1k:>10.0f}{lost:>6}"
+            )
+
+    def run_mode(self, mode, queue_name, total_messages, rate, batch_size):
+        transport_options = settings.SQS_POLLING_MODES[mode]
+        queue = Queue(queue_name)
+        latencies = []
+        received = threading.Event()
+        with celery_app.connection_for_write(transport_options=transport_options) as producer_connection, \
+                celery_app.connection_for_read(transport_options=transport_options) as consumer_connection:
+            producer_channel = producer_connection.default_channel
+            queue(producer_channel).purge()
+            # Both channels share the SQS client of the queue
+            self.count_requests(producer_channel.sqs(queue=queue_name))
+
+            def on_message(body, message):
+                latencies.append(time.time() - body["sent_at"])
+                message.ack()
+                if len(latencies) == total_messages:
+                    received.set()
+
+            consumer = Consumer(consumer_connection.default_channel, queues=[queue], callbacks=[on_message])
+            consumer.qos(prefetch_count=batch_size)
+            # Don't let the drain timeout shorten the polling interval
+            drain_timeout = transport_options["polling_interval"] + transport_options["wait_time_seconds"] + 1
+            consumer_thread = threading.Thread(
+                target=self.consume, args=(consumer_connection, drain_timeout, received), daemon=True
+            )
+            with consumer:
+                consumer_thread.start()
+                # Let the consumer reach its idle state before sending messages
+                time.sleep(1)
+                self.requests.clear()
+                producer = Producer(producer_channel, routing_key=queue_name)
+                for _ in range(total_messages):
+                    producer.publish({"sent_at": time.time()}, serializer="json")
+                    time.sleep(max(1 / rate - 0.001, 0))
+                # Wait for the messages still in flight: up to the polling interval and the wait time
+                received.wait(timeout=drain_timeout + 5)
+                received.set()
+                consumer_thread.join()
+        return latencies, total_messages - len(latencies)
+
+    @staticmethod
+    def consume(connection, timeout, stop):
+        while not stop.is_set():
+            try:
+                connection.drain_events(timeout=timeout)
+            except socket.timeout:
+                pass
+
+    def count_requests(self, sqs_client):
+        def on_response(model, parsed, **kwargs):
+            self.requests[model.name] += 1
+            if model.name == "ReceiveMessage" and not parsed.get("Messages"):
+                self.requests["EmptyReceiveMessage"] += 1
+
+        # unique_id keeps a single handler when running several modes
+        sqs_client.meta.events.register("after-call.sqs", on_response, unique_id="benchmark_sqs")
@@ -0,0 +1,165 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+
+
+# Loaded when first used (i.e. sending a task or calling AWS), not when the app starts
+LAZY_MODULES = ["celery", "kombu", "boto3", "botocore"]
+
+# Resolved through the urls and the whole middleware stack, unlike the liveness path answered by the first middleware
+DEFAULT_PATH = "/admin/login/"
+
+# Run in a new python process: Load the app like the app server does, and serve a first request
+BOOT_SCRIPT = """
+import asyncio, json, sys, time
+
+server_mode, path = sys.argv[1], sys.argv[2]
+if server_mode == "asgi":
+    from app.asgi import application
+else:
+    from app.wsgi import application
+loaded_at = time.time()
+
+if server_mode == "asgi":
+    async def request():
+        messages = []
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {
+            "type": "http", "http_version": "1.1", "method": "GET", "scheme": "http", "path": path,
+            "query_string": b"", "headers": [(b"host", b"localhost")], "server": ("localhost", 8000),
+        }
+        await application(scope, receive, send)
+        return messages[0]["status"]
+
+    status = asyncio.run(request())
+else:
+    statuses = []
+    environ = {
+        "REQUEST_METHOD": "GET", "PATH_INFO": path, "QUERY_STRING": "", "SERVER_NAME": "localhost",
+        "SERVER_PORT": "8000", "HTTP_HOST": "localhost", "SERVER_PROTOCOL": "HTTP/1.1", "wsgi.url_scheme": "http",
+        "wsgi.input": __import__("io").BytesIO(), "wsgi.errors": sys.stderr,
+    }
+    b"".join(application(environ, lambda status_line, headers: statuses.append(int(status_line[:3]))))
+    status = statuses[0]
+responded_at = time.time()
+print(json.dumps({"loaded_at": loaded_at, "responded_at": responded_at, "status": status, "modules": list(sys.modules)}))
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the cold start of the app: time to load it and to serve a first request in a new process, "
+        "and the import time by package (python -X importtime). Fails if the start is slower than the limits, "
+        "or if modules meant to be loaded lazily are imported on start."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--runs", type=int, default=5, help="Processes started. The median is reported")
+        parser.add_argument("--server-mode", default=os.getenv("SERVER_MODE", "wsgi"), choices=["wsgi", "asgi"])
+        parser.add_argument("--path", default=DEFAULT_PATH, help="Path of the first request")
+        parser.add_argument("--top", type=int, default=15, help="Packages and modules listed by import time")
+        parser.add_argument("--max-ms", type=float, help="Fail if the time to first request is longer")
+        parser.add_argument("--baseline", help="Fail if the time to first request is longer than in this json file")
+        parser.add_argument("--tolerance", type=float, default=0.2, help="Slowdown allowed over the baseline")
+        parser.add_argument("--save-baseline", action="store_true", help="Write the results to the baseline file")
+        parser.add_argument(
+            "--lazy-modules",
+            nargs="*",
+            default=LAZY_MODULES,
+            help="Fail if these packages are imported on start. Pass no values to skip the check.",
+        )
+
+    def handle(self, *args, **options):
+        # A first run compiles the .pyc files, like the image build does
+        self.boot(options)
+        runs = [self.boot(options) for _ in range(options["runs"])]
+        load_ms = statistics.median(run["load_ms"] for run in runs)
+        first_request_ms = statistics.median(run["first_request_ms"] for run in runs)
+        profiled_run = self.boot(options, import_time=True)
+
+        self.stdout.write(f"Import time by package (self time, {len(profiled_run['modules'])} modules):")
+        for package, self_us in self.top_packages(profiled_run["import_times"], options["top"]):
+            self.stdout.write(f"  {package:<40}{self_us / 1000:>10.1f} ms")
+        self.stdout.write("Slowest imports (cumulative time):")
+        for module, cumulative_us in self.top_modules(profiled_run["import_times"], options["top"]):
+            self.stdout.write(f"  {module:<60}{cumulative_us / 1000:>10.1f} ms")
+        self.stdout.write(f"Load app: {load_ms:.0f} ms, first request: {first_request_ms:.0f} ms "
+                          f"(median of {len(runs)} runs, {options['server_mode']})")
+
+        errors = []
+        if profiled_run["status"] >= 500:
+            errors.append(f"The first request failed with status {profiled_run['status']}")
+        loaded_lazy_modules = sorted(set(options["lazy_modules"]) & set(profiled_run["modules"]))
+        if loaded_lazy_modules:
+            errors.append(f"Imported on start: {', '.join(loaded_lazy_modules)}")
+        if options["max_ms"] and first_request_ms > options["max_ms"]:
+            errors.append(f"Time to first request {first_request_ms:.0f} ms > {options['max_ms']:.0f} ms")
+        if options["baseline"]:
+            if options["save_baseline"]:
+                with open(options["baseline"], "w") as baseline_file:
+                    json.dump({"load_ms": load_ms, "first_request_ms": first_request_ms}, baseline_file, indent=2)
+                self.stdout.write(f"Baseline saved to {options['baseline']}")
+            else:
+                with open(options["baseline"]) as baseline_file:
+                    baseline_ms = json.load(baseline_file)["first_request_ms"]
+                limit_ms = baseline_ms * (1 + options["tolerance"])
+                if first_request_ms > limit_ms:
+                    errors.append(
+                        f"Time to first request {first_request_ms:.0f} ms > {limit_ms:.0f} ms "
+                        f"(baseline {baseline_ms:.0f} ms + {options['tolerance']:.0%})"
+                    )
+        if errors:
+            raise CommandError("Startup regression: " + "; ".join(errors))
+
+    @staticmethod
+    def boot(options, import_time=False):
+        command = [sys.executable]
+        if import_time:
+            command += ["-X", "importtime"]
+        command += ["-c", BOOT_SCRIPT, options["server_mode"], options["path"]]
+        started_at = time.time()
+        process = subprocess.run(command, cwd=settings.BASE_DIR, capture_output=True, text=True)
+        if process.returncode:
+            raise CommandError(f"The app failed to start:\n{process.stderr}")
+        result = json.loads(process.stdout.splitlines()[-1])
+        result["load_ms"] = (result["loaded_at"] - started_at) * 1000
+        result["first_request_ms"] = (result["responded_at"] - started_at) * 1000
+        if import_time:
+            result["import_times"] = parse_import_times(process.stderr)
+        return result
+
+    @staticmethod
+    def top_packages(import_times, n):
+        self_by_package = defaultdict(int)
+        for module, self_us, _ in import_times:
+            self_by_package[module.split(".")[0]] += self_us
+        return sorted(self_by_package.items(), key=lambda item: item[1], reverse=True)[:n]
+
+    @staticmethod
+    def top_modules(import_times, n):
+        cumulative = [(module, cumulative_us) for module, _, cumulative_us in import_times]
+        return sorted(cumulative, key=lambda item: item[1], reverse=True)[:n]
+
+
+def parse_import_times(output):
+    """ (module, self us, cumulative us) from the "import time: self | cumulative | module" lines """
+    import_times = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        import_times.append((module.strip(), int(self_us), int(cumulative_us)))
+    return import_times
@@ -0,0 +1,85 @@
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management import BaseCommand
+
+from app.celery import app as celery_app
+from common.task_batching import enqueue_in_batches
+from users.tasks import test_task
+from .benchmark_db_connections import percentile
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark enqueuing tasks from requests (i.e. against ElasticMQ), sending them one by one or in batches "
+        "(SQS SendMessageBatch). Reports the time spent enqueuing per request and the SQS requests per 1k tasks"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=100, help="Requests per mode")
+        parser.add_argument("--tasks-per-request", type=int, default=20, help="Tasks enqueued by each request")
+        parser.add_argument("--concurrency", type=int, default=4, help="Concurrent threads sending requests")
+        parser.add_argument(
+            "--mode",
+            dest="modes",
+            choices=["single", "batched"],
+            action="append",
+            help="Modes to benchmark. All the modes are run by default."
+        )
+
+    def handle(self, *args, **options):
+        modes = options["modes"] or ["single", "batched"]
+        # SQS requests by operation, counted in the SQS clients shared by all the channels
+        self.requests = Counter()
+        self.count_requests()
+        self.stdout.write(f"{'mode':<10}{'tasks/s':>10}{'p50 (ms)':>12}{'p99 (ms)':>12}{'sqs requests/1k':>18}")
+        for mode in modes:
+            self.requests.clear()
+            total_tasks = options["requests"] * options["tasks_per_request"]
+            latencies, elapsed = self.run_mode(
+                mode,
+                total_requests=options["requests"],
+                tasks_per_request=options["tasks_per_request"],
+                concurrency=options["concurrency"],
+            )
+            latencies.sort()
+            sent = self.requests["SendMessage"] + self.requests["SendMessageBatch"]
+            self.stdout.write(
+                f"{mode:<10}{total_tasks / elapsed:>10.1f}"
+                f"{percentile(latencies, 50) * 1000:>12.2f}{percentile(latencies, 99) * 1000:>12.2f}"
+                f"{sent * 1000 / total_tasks:>18.0f}"
+            )
+
+    def run_mode(self, mode, total_requests, tasks_per_request, concurrency):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            latencies = list(executor.map(
+                lambda _: self.send_request(mode, tasks_per_request), range(total_requests)
+            ))
+        elapsed = time.perf_counter() - start
+        return latencies, elapsed
+
+    @staticmethod
+    def send_request(mode, tasks_per_request):
+        start = time.perf_counter()
+        if mode == "batched":
+            with enqueue_in_batches():
+                for _ in range(tasks_per_request):
+                    test_task.delay()
+        else:
+            for _ in range(tasks_per_request):
+                test_task.delay()
+        return time.perf_counter() - start
+
+    def count_requests(self):
+        # Only requests actually sent: SendMessage calls captured to be batched don't reach this event
+        def on_request(event_name, **kwargs):
+            self.requests[event_name.split(".")[-1]] += 1
+
+        with celery_app.producer_or_acquire() as producer:
+            channel = producer.channel
+            for queue_name in channel.predefined_queues:
+                channel.sqs(queue=queue_name).meta.events.register(
+                    "before-send.sqs", on_request, unique_id="benchmark_task_enqueue"
+                )
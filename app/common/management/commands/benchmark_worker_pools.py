@@ -0,0 +1,107 @@
+import os
+import subprocess
+import sys
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import BaseCommand, CommandError
+
+from common.task_batching import enqueue_in_batches
+from common.tasks import benchmark_task
+
+
+WORKLOADS = ["io", "cpu", "db"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare celery worker pools (prefork, threads, gevent) running I/O-bound and CPU-bound tasks. "
+        "A worker is started for each pool, and reports the tasks per second it runs. "
+        "Stop the other workers of the queue first, i.e. docker-compose stop worker-default."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--pool",
+            dest="pools",
+            action="append",
+            help="Pool to benchmark, with an optional concurrency, i.e. --pool threads:16. "
+                 "Defaults to prefork, threads and gevent, with the concurrency set in the settings for each pool."
+        )
+        parser.add_argument("--workload", dest="workloads", choices=WORKLOADS, action="append", help="Defaults to io and cpu")
+        parser.add_argument("--tasks", type=int, default=200, help="Tasks per pool and workload")
+        parser.add_argument("--ms", type=int, default=100, help="Duration of each task when run alone")
+        parser.add_argument("--queue", default=settings.CELERY_TASK_DEFAULT_QUEUE)
+        parser.add_argument("--timeout", type=int, default=600, help="Max seconds per pool and workload")
+
+    def handle(self, *args, **options):
+        if "locmem" in settings.CACHES["default"]["BACKEND"]:
+            raise CommandError("Tasks are counted in the cache, which must be shared with the workers (CACHE_REDIS_URL)")
+        pools = [self.parse_pool(pool) for pool in options["pools"] or ["prefork", "threads", "gevent"]]
+        workloads = options["workloads"] or ["io", "cpu"]
+        cpu_iterations = self.calibrate_cpu(options["ms"])
+        self.stdout.write(f"{'pool':<10}{'concurrency':>12}{'workload':>10}{'tasks/s':>10}{'seconds':>10}")
+        for pool, concurrency in pools:
+            worker = self.start_worker(pool, concurrency, options["queue"])
+            try:
+                # The first task waits for the worker to start
+                self.run_tasks(1, "io", 0, options["queue"], options["timeout"])
+                for workload in workloads:
+                    amount = cpu_iterations if workload == "cpu" else options["ms"]
+                    elapsed = self.run_tasks(options["tasks"], workload, amount, options["queue"], options["timeout"])
+                    self.stdout.write(
+                        f"{pool:<10}{concurrency:>12}{workload:>10}{options['tasks'] / elapsed:>10.1f}{elapsed:>10.1f}"
+                    )
+            finally:
+                worker.terminate()
+                try:
+                    worker.wait(timeout=30)
+                except subprocess.TimeoutExpired:
+                    worker.kill()
+
+    @staticmethod
+    def parse_pool(pool):
+        name, _, concurrency = pool.partition(":")
+        return name, int(concurrency) if concurrency else settings.DEFAULT_WORKER_CONCURRENCY[name]
+
+    @staticmethod
+    def calibrate_cpu(ms):
+        # Iterations of the cpu workload taking ms milliseconds in this process
+        iterations = 100000
+        start = time.perf_counter()
+        value = 0
+        for i in range(iterations):
+            value = (value * 31 + i) % 1000003
+        return int(iterations * ms / 1000 / (time.perf_counter() - start))
+
+    @staticmethod
+    def start_worker(pool, concurrency, queue):
+        env = {
+            **os.environ,
+            "CELERY_WORKER_POOL": pool,
+            "CELERY_WORKER_CONCURRENCY": str(concurrency),
+        }
+        return subprocess.Popen(
+            [
+                sys.executable, "-m", "celery", "-A", "app", "worker",
+                "-Q", queue, "-P", pool, "-c", str(concurrency), "-l", "warning", "-n", f"benchmark-{pool}@%h",
+            ],
+            env=env,
+            cwd=settings.BASE_DIR,
+        )
+
+    @staticmethod
+    def run_tasks(total_tasks, workload, amount, queue, timeout):
+        run_key = f"benchmark_worker_pools:{uuid.uuid4()}"
+        cache.set(run_key, 0, timeout=timeout * 2)
+        start = time.perf_counter()
+        with enqueue_in_batches():
+            for _ in range(total_tasks):
+                benchmark_task.apply_async(args=[run_key, workload, amount], queue=queue)
+        while cache.get(run_key) < total_tasks:
+            if time.perf_counter() - start > timeout:
+                raise CommandError(f"Timeout: {cache.get(run_key)} of {total_tasks} {workload} tasks done")
+            time.sleep(0.1)
+        return time.perf_counter() - start
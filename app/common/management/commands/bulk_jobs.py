@@ -0,0 +1,43 @@
+from django.core.management import BaseCommand, CommandError
+
+from common import bulk
+from common.models import BulkJob
+
+
+class Command(BaseCommand):
+    help = "Start bulk jobs, show their progress, and resume their failed chunks. See common.bulk"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--start", metavar="HANDLER", help="Start a job for a bulk handler, by name")
+        parser.add_argument("--chunk-size", type=int, default=bulk.DEFAULT_CHUNK_SIZE, help="Rows per chunk")
+        parser.add_argument("--resume", metavar="JOB_ID", type=int, help="Dispatch the chunks not done again")
+        parser.add_argument(
+            "--plan",
+            action="store_true",
+            help="With --resume, continue planning a job. Only if the planning task was lost."
+        )
+        parser.add_argument("--limit", type=int, default=20, help="Jobs listed")
+
+    def handle(self, *args, **options):
+        # Register the handlers defined in tasks modules
+        from app.celery import app as celery_app
+        celery_app.loader.import_default_modules()
+
+        if options["start"]:
+            try:
+                handler = bulk.get_handler(options["start"])
+            except KeyError:
+                raise CommandError(f"Unknown bulk handler {options['start']}")
+            job = handler.start(chunk_size=options["chunk_size"])
+            self.stdout.write(f"Started job {job.pk}")
+        elif options["resume"]:
+            try:
+                job = BulkJob.objects.get(pk=options["resume"])
+            except BulkJob.DoesNotExist:
+                raise CommandError(f"Job {options['resume']} not found")
+            chunks = bulk.resume_job(job, plan=options["plan"])
+            self.stdout.write(f"Dispatched {len(chunks)} chunks of job {job.pk}")
+
+        self.stdout.write(f"{'id':>6}  {'name':<40}{'status':<10}{'chunks':>8}  progress")
+        for job in BulkJob.objects.order_by("-pk")[:options["limit"]]:
+            self.stdout.write(f"{job.pk:>6}  {job.name:<40}{job.status:<10}{job.total_chunks:>8}  {job.progress()}")
@@ -0,0 +1,23 @@
+from django.core.management import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.migrations.executor import MigrationExecutor
+
+
+class Command(BaseCommand):
+    help = (
+        "Exit with an error if the database has unapplied migrations, without applying them. "
+        "Run by the app tasks before serving: Migrations are applied once per deploy, before updating the services."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS, help="Database to check")
+
+    def handle(self, *args, **options):
+        connection = connections[options["database"]]
+        executor = MigrationExecutor(connection)
+        # Migrations applied in the database but not in the code (i.e. a rollback) don't stop the app
+        plan = executor.migration_plan(executor.loader.graph.leaf_nodes())
+        if plan:
+            unapplied = ", ".join(f"{migration.app_label}.{migration.name}" for migration, _ in plan)
+            raise CommandError(f"The database schema is behind the code. Unapplied migrations: {unapplied}")
+        self.stdout.write("All migrations applied")
@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.staticfiles.management.commands.collectstatic import Command as CollectStaticCommand
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.management import BaseCommand
+
+
+# Hashes of the files uploaded by the last run, stored with the static files
+SYNC_MANIFEST_NAME = "staticfiles-sync.json"
+
+
+class Command(BaseCommand):
+    help = (
+        "Collect the static files into a local directory (hashed names and manifest), and upload to the static files "
+        "storage (S3) only the files changed since the last run, in parallel. Run it once per deploy."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=16, help="Files uploaded at the same time")
+        parser.add_argument("--force", action="store_true", help="Upload all the files")
+        parser.add_argument("--dry-run", action="store_true", help="List the files to upload, without uploading")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        storage = staticfiles_storage
+        with tempfile.TemporaryDirectory() as build_dir:
+            self.collect_locally(build_dir)
+            local_hashes = self.hash_files(build_dir)
+            remote_hashes = {} if options["force"] else self.read_sync_manifest(storage)
+            changed = sorted(name for name, file_hash in local_hashes.items() if remote_hashes.get(name) != file_hash)
+            # The manifest is uploaded last, once the files it points to are uploaded
+            manifest_name = getattr(storage, "manifest_name", None)
+            files = [name for name in changed if name != manifest_name]
+            self.stdout.write(f"{len(changed)} of {len(local_hashes)} static files changed")
+            if options["dry_run"]:
+                for name in changed:
+                    self.stdout.write(f"  {name}")
+                return
+            with ThreadPoolExecutor(max_workers=options["workers"]) as executor:
+                # Raise the first upload error, if any
+                list(executor.map(lambda name: self.upload(storage, build_dir, name), files))
+            if manifest_name in changed:
+                self.upload(storage, build_dir, manifest_name)
+        if changed:
+            self.write_sync_manifest(storage, local_hashes)
+        self.stdout.write(f"Uploaded {len(changed)} files in {time.perf_counter() - start:.1f}s")
+
+    def collect_locally(self, build_dir):
+        """ Run collectstatic into build_dir, hashing the file names like the static files storage """
+        collect = CollectStaticCommand(stdout=self.stdout, stderr=self.stderr)
+        collect.storage = ManifestStaticFilesStorage(location=build_dir)
+        collect.set_options(
+            interactive=False,
+            verbosity=0,
+            link=False,
+            clear=False,
+            dry_run=False,
+            ignore_patterns=[],
+            use_default_ignore_patterns=True,
+            post_process=True,
+        )
+        collect.collect()
+
+    @staticmethod
+    def hash_files(build_dir):
+        hashes = {}
+        for directory, _, file_names in os.walk(build_dir):
+            for file_name in file_names:
+                path = os.path.join(directory, file_name)
+                with open(path, "rb") as local_file:
+                    hashes[os.path.relpath(path, build_dir)] = hashlib.md5(local_file.read()).hexdigest()
+        return hashes
+
+    @staticmethod
+    def read_sync_manifest(storage):
+        if not storage.exists(SYNC_MANIFEST_NAME):
+            return {}
+        with storage.open(SYNC_MANIFEST_NAME) as manifest_file:
+            return json.loads(manifest_file.read())
+
+    def write_sync_manifest(self, storage, hashes):
+        self.save(storage, SYNC_MANIFEST_NAME, ContentFile(json.dumps(hashes).encode()))
+
+    def upload(self, storage, build_dir, name):
+        with open(os.path.join(build_dir, name), "rb") as local_file:
+            self.save(storage, name, File(local_file))
+
+    @staticmethod
+    def save(storage, name, content):
+        """ Save the file under its name, replacing the current one """
+        # S3 overwrites the file in place (AWS_S3_FILE_OVERWRITE). Storages keeping it would save under another name
+        if storage.get_available_name(name) != name:
+            storage.delete(name)
+        storage.save(name, content)
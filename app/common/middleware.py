@@ -0,0 +1,135 @@
+import asyncio
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import JsonResponse
+from django.utils.decorators import sync_and_async_middleware
+
+from .db.routers import REPLICA_DB_ALIAS, replica_reads
+from .request_profiling import start_profile, stop_profile, connect_query_profiler, should_log, log_profile
+from .task_batching import enqueue_in_batches, aenqueue_in_batches, discard_batch
+
+
+@sync_and_async_middleware
+def health_check_middleware(get_response):
+    """
+    Answer liveness probes (i.e. from the load balancer) before the rest of the middlewares run,
+    skipping sessions, csrf, auth, messages and the ALLOWED_HOSTS validation.
+    It must be the first middleware.
+    """
+    liveness_path = settings.HEALTH_CHECK_LIVENESS_PATH
+
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            if request.path_info == liveness_path:
+                return JsonResponse({"status": "OK"}, status=200)
+            return await get_response(request)
+    else:
+        def middleware(request):
+            if request.path_info == liveness_path:
+                return JsonResponse({"status": "OK"}, status=200)
+            return get_response(request)
+
+    return middleware
+
+
+@sync_and_async_middleware
+def task_batching_middleware(get_response):
+    """
+    Send the celery tasks enqueued while handling a request in batches (SQS SendMessageBatch),
+    once the response is ready or the request transaction is committed.
+    Tasks enqueued by a failed request (5xx response) aren't sent, like when the request raises an exception.
+    """
+    if not settings.TASK_ENQUEUE_BATCHING:
+        raise MiddlewareNotUsed()
+
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            async with aenqueue_in_batches():
+                response = await get_response(request)
+                if response.status_code >= 500:
+                    discard_batch()
+                return response
+    else:
+        def middleware(request):
+            with enqueue_in_batches():
+                response = get_response(request)
+                if response.status_code >= 500:
+                    discard_batch()
+                return response
+
+    return middleware
+
+
+@sync_and_async_middleware
+def request_profiling_middleware(get_response):
+    """
+    Profile each request (see common.request_profiling): add a Server-Timing header to the response,
+    and log the profile of sampled requests, slow requests and requests with too many queries.
+    """
+    if not settings.REQUEST_PROFILING:
+        raise MiddlewareNotUsed()
+    connect_query_profiler()
+
+    def process_profile(profile, request, response):
+        total_time = profile.total_time
+        if settings.REQUEST_PROFILING_SERVER_TIMING:
+            response["Server-Timing"] = profile.server_timing(total_time)
+        if should_log(profile, total_time):
+            log_profile(profile, total_time, request, response)
+        return response
+
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            profile, token = start_profile()
+            try:
+                response = await get_response(request)
+            finally:
+                stop_profile(token)
+            return process_profile(profile, request, response)
+    else:
+        def middleware(request):
+            profile, token = start_profile()
+            try:
+                response = get_response(request)
+            finally:
+                stop_profile(token)
+            return process_profile(profile, request, response)
+
+    return middleware
+
+
+@sync_and_async_middleware
+def replica_routing_middleware(get_response):
+    """
+    Send the reads of GET, HEAD and OPTIONS requests to the read replica (see common.db.routers), until they write.
+    Read your writes across requests: A request writing sets a cookie sending the reads of the next requests of the
+    client to the primary for DB_REPLICA_PIN_SECONDS (i.e. the page shown after saving a form), while the replica
+    catches up.
+    """
+    if REPLICA_DB_ALIAS not in settings.DATABASES:
+        raise MiddlewareNotUsed()
+    cookie_name = settings.DB_REPLICA_PIN_COOKIE_NAME
+
+    def is_pinned(request):
+        return request.method not in ("GET", "HEAD", "OPTIONS") or cookie_name in request.COOKIES
+
+    def process_response(state, response):
+        if state["wrote"]:
+            response.set_cookie(
+                cookie_name, "1", max_age=settings.DB_REPLICA_PIN_SECONDS, httponly=True, samesite="Lax"
+            )
+        return response
+
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            with replica_reads(pinned=is_pinned(request)) as state:
+                response = await get_response(request)
+            return process_response(state, response)
+    else:
+        def middleware(request):
+            with replica_reads(pinned=is_pinned(request)) as state:
+                response = get_response(request)
+            return process_response(state, response)
+
+    return middleware
@@ -0,0 +1,68 @@
+from django.db import models
+from django.db.models import Count, Sum
+
+
+class BulkJob(models.Model):
+    """ A bulk job processing the rows of a queryset in chunks. See common.bulk """
+    PLANNING = "planning"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PLANNING, "Planning"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+
+    name = models.CharField(max_length=255)  # Name of the bulk handler
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PLANNING)
+    chunk_size = models.PositiveIntegerField()
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    total_chunks = models.PositiveIntegerField(default=0)  # Set once planning is finished
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
+
+    def progress(self):
+        """ Number of chunks by status, and rows processed """
+        chunks_by_status = dict(self.chunks.values_list("status").annotate(Count("pk")).order_by())
+        progress = {status: chunks_by_status.get(status, 0) for status, _ in BulkChunk.STATUS_CHOICES}
+        progress["processed"] = self.chunks.aggregate(processed=Sum("processed"))["processed"] or 0
+        return progress
+
+
+class BulkChunk(models.Model):
+    """ A range of ids of the queryset of a bulk job, processed by a single task """
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+
+    job = models.ForeignKey(BulkJob, related_name="chunks", on_delete=models.CASCADE)
+    # Ids range, both included
+    first_id = models.BigIntegerField()
+    last_id = models.BigIntegerField()
+    size = models.PositiveIntegerField()  # Rows in the range when planned
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    processed = models.PositiveIntegerField(null=True, blank=True)  # Returned by the handler
+    error = models.TextField(blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["job", "status"]),
+        ]
+
+    def __str__(self):
+        return f"{self.job.name} #{self.job_id} [{self.first_id}, {self.last_id}] ({self.status})"
@@ -0,0 +1,174 @@
+"""
+    Profile the requests handled by the app: wall time, db queries and time, cache hits and misses, response size.
+    Enabled with REQUEST_PROFILING, see common.middleware.request_profiling_middleware.
+    - Db queries are timed by a wrapper installed in each db connection (connection.execute_wrappers).
+    - Cache calls are counted by the cache backend: Use ProfiledRedisCache or ProfiledLocMemCache.
+    Queries and cache calls are only recorded while a request is being profiled, in the same context (also in threads
+    started with sync_to_async).
+"""
+import contextvars
+import json
+import logging
+import random
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.redis import RedisCache
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+
+logger = logging.getLogger(__name__)
+
+# Repeated query templates logged per request, the usual sign of N+1 queries
+MAX_REPEATED_QUERIES_LOGGED = 3
+MAX_QUERY_LENGTH_LOGGED = 300
+
+_profile = contextvars.ContextVar("request_profile", default=None)
+_missing = object()
+
+
+class RequestProfile:
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.db_queries = 0
+        self.db_time = 0.0
+        # Number of times each query template (sql with placeholders) was run
+        self.db_query_counts = Counter()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_time = 0.0
+
+    @property
+    def total_time(self):
+        return time.perf_counter() - self.started_at
+
+    def repeated_queries(self):
+        return [
+            {"sql": sql[:MAX_QUERY_LENGTH_LOGGED], "count": count}
+            for sql, count in self.db_query_counts.most_common(MAX_REPEATED_QUERIES_LOGGED)
+            if count > 1
+        ]
+
+    def server_timing(self, total_time):
+        """ Server-Timing header value, in milliseconds. Shown by the browser dev tools """
+        return ", ".join([
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.db_queries} queries"',
+            f'cache;dur={self.cache_time * 1000:.1f};desc="{self.cache_hits} hits, {self.cache_misses} misses"',
+            f"total;dur={total_time * 1000:.1f}",
+        ])
+
+
+def start_profile():
+    profile = RequestProfile()
+    return profile, _profile.set(profile)
+
+
+def stop_profile(token):
+    _profile.reset(token)
+
+
+def profile_query(execute, sql, params, many, context):
+    profile = _profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.db_time += time.perf_counter() - start
+        profile.db_queries += 1
+        profile.db_query_counts[sql] += 1
+
+
+def install_query_profiler(connection, **kwargs):
+    # Connections are reused by the thread that created them, so the wrapper is installed once per connection
+    if profile_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(profile_query)
+
+
+def connect_query_profiler():
+    connection_created.connect(install_query_profiler, weak=False, dispatch_uid="request_profiling")
+    # Connections of the current thread created before (i.e. by management commands or tests)
+    for connection in connections.all():
+        install_query_profiler(connection)
+
+
+def should_log(profile, total_time):
+    """ Sampled requests, slow requests and requests with too many queries """
+    return (
+        random.random() < settings.REQUEST_PROFILING_SAMPLE_RATE
+        or total_time * 1000 >= settings.REQUEST_PROFILING_SLOW_REQUEST_MS
+        or profile.db_queries >= settings.REQUEST_PROFILING_MAX_QUERIES
+    )
+
+
+def log_profile(profile, total_time, request, response):
+    resolver_match = getattr(request, "resolver_match", None)
+    record = {
+        "method": request.method,
+        "path": request.path,
+        "view": resolver_match.view_name if resolver_match else None,
+        "route": resolver_match.route if resolver_match else None,
+        "status": response.status_code,
+        "duration_ms": round(total_time * 1000, 1),
+        "db_queries": profile.db_queries,
+        "db_ms": round(profile.db_time * 1000, 1),
+        "repeated_queries": profile.repeated_queries(),
+        "cache_hits": profile.cache_hits,
+        "cache_misses": profile.cache_misses,
+        "cache_ms": round(profile.cache_time * 1000, 1),
+        "response_bytes": get_response_size(response),
+    }
+    logger.info(json.dumps(record))
+
+
+def get_response_size(response):
+    if getattr(response, "streaming", False):
+        return int(response["Content-Length"]) if response.has_header("Content-Length") else None
+    return len(response.content)
+
+
+class ProfiledCacheMixin:
+    """ Count the cache hits and misses of the profiled requests """
+
+    def get(self, key, default=None, version=None):
+        profile = _profile.get()
+        if profile is None:
+            return super().get(key, default, version)
+        start = time.perf_counter()
+        value = super().get(key, _missing, version)
+        profile.cache_time += time.perf_counter() - start
+        if value is _missing:
+            profile.cache_misses += 1
+            return default
+        profile.cache_hits += 1
+        return value
+
+    def get_many(self, keys, version=None):
+        profile = _profile.get()
+        if profile is None:
+            return super().get_many(keys, version)
+        keys = list(keys)
+        # Backends without their own get_many call get for each key, which would count them again
+        token = _profile.set(None)
+        start = time.perf_counter()
+        try:
+            values = super().get_many(keys, version)
+        finally:
+            profile.cache_time += time.perf_counter() - start
+            _profile.reset(token)
+        profile.cache_hits += len(values)
+        profile.cache_misses += len(keys) - len(values)
+        return values
+
+
+class ProfiledRedisCache(ProfiledCacheMixin, RedisCache):
+    pass
+
+
+class ProfiledLocMemCache(ProfiledCacheMixin, LocMemCache):
+    pass
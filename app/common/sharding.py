@@ -0,0 +1,59 @@
+"""
+    Split the work of a management command between several tasks (shards), started with:
+
+        python scripts/run_cmd.py "python manage.py backfill_users" --env MyDjangoAppProduction --shards 8
+
+    Each task gets the SHARD_INDEX (0 to SHARD_COUNT - 1) and SHARD_COUNT env vars, and processes its part of the rows:
+
+        users = shard_queryset(CustomUser.objects.filter(is_active=True))
+
+    Rows are split in contiguous ranges of ids, so each shard reads its rows with an index range scan.
+    The ranges split the ids of the whole table, not only of the rows of the queryset: All the shards get the same
+    ranges even if the rows of the queryset change while they start (e.g. rows already updated by the first shards
+    that the filter excludes). Rows inserted after the last id go to the last shard.
+    The ranges shift if the rows with the lowest or highest ids of the table are deleted while the shards start.
+    Without the env vars, the command processes all the rows.
+"""
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Max, Min
+
+
+def get_shard():
+    """ (shard index, shard count) of this process, from the SHARD_INDEX and SHARD_COUNT env vars """
+    shard_index = int(os.getenv("SHARD_INDEX") or 0)
+    shard_count = int(os.getenv("SHARD_COUNT") or 1)
+    if not 0 <= shard_index < shard_count:
+        raise ImproperlyConfigured(f"Invalid shard {shard_index} of {shard_count}")
+    return shard_index, shard_count
+
+
+def get_shard_range(min_id, max_id, shard_index, shard_count):
+    """ (first id, last id) of the shard, both included, splitting [min_id, max_id] in shard_count ranges """
+    shard_size = (max_id - min_id + 1) / shard_count
+    first_id = min_id + round(shard_index * shard_size)
+    last_id = min_id + round((shard_index + 1) * shard_size) - 1
+    return first_id, last_id
+
+
+def shard_queryset(queryset, shard_index=None, shard_count=None):
+    """
+    The rows of the queryset in the shard, by integer primary key.
+    Defaults to the shard of this process (see get_shard).
+    """
+    if shard_index is None or shard_count is None:
+        shard_index, shard_count = get_shard()
+    if shard_count == 1:
+        return queryset
+    # Range of the whole table: Filtering it by the queryset would give a different range to the shards started
+    # after rows were updated by the others
+    id_range = queryset.model._base_manager.using(queryset.db).aggregate(min_id=Min("pk"), max_id=Max("pk"))
+    if id_range["min_id"] is None:
+        return queryset if shard_index == shard_count - 1 else queryset.none()
+    first_id, last_id = get_shard_range(id_range["min_id"], id_range["max_id"], shard_index, shard_count)
+    if shard_index > 0:
+        queryset = queryset.filter(pk__gte=first_id)
+    if shard_index < shard_count - 1:
+        queryset = queryset.filter(pk__lte=last_id)
+    return queryset
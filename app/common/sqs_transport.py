@@ -0,0 +1,45 @@
+"""
+    Kombu SQS transport of the celery app (CELERY_BROKER_TRANSPORT). Same as kombu's, except that the messages
+    published while sending a batch of tasks are captured, and sent with SendMessageBatch by common.task_batching.
+    Loaded by kombu when celery connects to the broker.
+"""
+from kombu.transport import SQS
+
+from .task_batching import capture_message, is_capturing
+
+
+class _CapturingClient:
+    """ SQS client of Channel._put while sending a batch: SendMessage calls are captured instead of made """
+
+    def __init__(self, client):
+        self.client = client
+
+    def send_message(self, **params):
+        capture_message(self.client, params)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+class Channel(SQS.Channel):
+    _capturing = False
+
+    def _put(self, queue, message, **kwargs):
+        # The message is built by kombu as usual. Redelivered messages are only made visible again.
+        if not is_capturing() or message.get("redelivered"):
+            return super()._put(queue, message, **kwargs)
+        self._capturing = True
+        try:
+            return super()._put(queue, message, **kwargs)
+        finally:
+            self._capturing = False
+
+    def sqs(self, queue=None):
+        client = super().sqs(queue=queue)
+        if self._capturing:
+            return _CapturingClient(client)
+        return client
+
+
+class Transport(SQS.Transport):
+    Channel = Channel
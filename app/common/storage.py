@@ -0,0 +1,61 @@
+"""
+    Static files in S3, served by CloudFront (see StaticFilesStack).
+    - File names include a hash of their content (manifest storage), so they can be cached forever:
+      Hashed files are uploaded with "Cache-Control: immutable", and a new deploy uploads new names.
+    - Compressible files are also uploaded compressed with gzip (name.gz) and brotli (name.br), with the
+      Content-Encoding header. A CloudFront function serves them to the browsers accepting the encoding.
+"""
+import gzip
+import mimetypes
+import os
+import re
+
+import brotli
+from django.conf import settings
+from django.core.files.base import ContentFile
+from storages.backends.s3boto3 import S3ManifestStaticStorage
+
+
+# Names of the hashed files, i.e. admin/css/base.1a2b3c4d5e6f.css
+HASHED_NAME_RE = re.compile(r"\.[0-9a-f]{12}\.[^/.]+$")
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Files without a hash may change on the next deploy
+DEFAULT_CACHE_CONTROL = "public, max-age=300"
+# Compressed variants of the files, by suffix
+ENCODINGS = {".gz": "gzip", ".br": "br"}
+
+
+class CompressedManifestS3Storage(S3ManifestStaticStorage):
+    # Static files are served under /static/, where the CloudFront function looks for the compressed variants
+    location = "static"
+
+    def _save(self, name, content):
+        if not self.is_compressible(name):
+            return super()._save(name, content)
+        content.seek(0)
+        data = content.read()
+        if isinstance(data, str):
+            data = data.encode()
+        content.seek(0)
+        name = super()._save(name, content)
+        # Every compressible file must have both variants: The CloudFront function doesn't check if they exist
+        super()._save(f"{name}.gz", ContentFile(gzip.compress(data, compresslevel=9, mtime=0)))
+        super()._save(f"{name}.br", ContentFile(brotli.compress(data)))
+        return name
+
+    def get_object_parameters(self, name):
+        params = super().get_object_parameters(name)
+        original_name, suffix = os.path.splitext(name)
+        if suffix in ENCODINGS:
+            # Served as the original file, compressed
+            params["ContentEncoding"] = ENCODINGS[suffix]
+            params["ContentType"] = mimetypes.guess_type(original_name)[0] or self.default_content_type
+        else:
+            original_name = name
+        is_hashed = HASHED_NAME_RE.search(original_name)
+        params["CacheControl"] = IMMUTABLE_CACHE_CONTROL if is_hashed else DEFAULT_CACHE_CONTROL
+        return params
+
+    @staticmethod
+    def is_compressible(name):
+        return os.path.splitext(name)[1].lower() in settings.STATICFILES_COMPRESSED_EXTENSIONS
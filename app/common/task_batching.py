@@ -0,0 +1,184 @@
+"""
+    Send the celery tasks enqueued in a block of code (i.e. a request) in batches, with SQS SendMessageBatch:
+    one request to SQS every 10 tasks, instead of one request per task.
+
+        with enqueue_in_batches():
+            for user in users:
+                send_welcome_email.delay(user.id)
+
+    Tasks are sent when the block ends, or when the transaction commits if the block runs in a transaction.
+    Tasks aren't sent if the block raises an exception, the transaction is rolled back, or discard_batch() is called.
+    Messages SQS fails to send in a batch are sent again one by one. Tasks that still fail are logged, and
+    TasksNotSentError is raised once the others are sent.
+    The messages are built by celery and kombu as usual: the SQS transport of the app (common.sqs_transport) captures
+    them while a batch is sent, instead of sending them one by one.
+"""
+import base64
+import contextvars
+import json
+import logging
+import uuid
+from contextlib import contextmanager, asynccontextmanager
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+
+
+# SQS limits for SendMessageBatch
+MAX_BATCH_MESSAGES = 10
+MAX_BATCH_BYTES = 256 * 1024
+
+logger = logging.getLogger(__name__)
+
+# Tasks enqueued in the current batch
+_batch = contextvars.ContextVar("task_batch", default=None)
+# SendMessage calls captured by the SQS transport while sending a batch: (client, params)
+_captured_messages = contextvars.ContextVar("task_batch_captured_messages", default=None)
+
+
+def add_to_batch(task, args, kwargs, options):
+    """
+    Add the task to the current batch, if any (see common.batched_task.BatchedTask).
+    Returns False if the task must be sent right away.
+    """
+    batch = _batch.get()
+    if batch is None or options.get("producer") is not None or task.app.conf.task_always_eager:
+        return False
+    options["task_id"] = options.get("task_id") or str(uuid.uuid4())
+    batch.append((task, args, kwargs, options))
+    return True
+
+
+def discard_batch():
+    """ Don't send the tasks enqueued so far in the current batch, i.e. when the request failed """
+    batch = _batch.get()
+    if batch is not None:
+        batch.clear()
+
+
+@contextmanager
+def enqueue_in_batches(using=None):
+    if _batch.get() is not None:
+        # Nested blocks are sent with the outer block
+        yield
+        return
+    batch = []
+    token = _batch.set(batch)
+    try:
+        yield
+    finally:
+        _batch.reset(token)
+    # Not reached if the block raised an exception
+    _send_after_commit(batch, using)
+
+
+@asynccontextmanager
+async def aenqueue_in_batches(using=None):
+    """ Same as enqueue_in_batches, for async code. Tasks are sent from a thread """
+    if _batch.get() is not None:
+        yield
+        return
+    batch = []
+    token = _batch.set(batch)
+    try:
+        yield
+    finally:
+        _batch.reset(token)
+    await sync_to_async(_send_after_commit)(batch, using)
+
+
+def _send_after_commit(batch, using):
+    if not batch:
+        return
+    # Sent when the transaction commits, or right away when not in a transaction
+    if transaction.get_connection(using).in_atomic_block:
+        transaction.on_commit(lambda: send_batch(batch), using=using)
+    else:
+        send_batch(batch)
+
+
+class TasksNotSentError(Exception):
+    """ Tasks of a batch that SQS failed to receive, in a batch and one by one """
+
+
+def is_capturing():
+    return _captured_messages.get() is not None
+
+
+def capture_message(client, params):
+    """ Called by the SQS transport instead of client.send_message(**params), while sending a batch """
+    _captured_messages.get().append((client, params))
+
+
+def send_batch(batch):
+    """ Send the tasks of a batch, with SendMessageBatch when the broker is SQS """
+    if not batch:
+        return
+    app = batch[0][0].app
+    with app.producer_or_acquire() as producer:
+        # Build and publish the messages as usual: the SQS transport captures them instead of sending them.
+        # Other transports send them one by one.
+        captured_messages = []
+        token = _captured_messages.set(captured_messages)
+        try:
+            for task, args, kwargs, options in batch:
+                # Sent with the producer, not added to the batch again
+                task.apply_async(args, kwargs, producer=producer, **options)
+        finally:
+            _captured_messages.reset(token)
+    not_sent = []
+    for client, queue_url, entries in _group_messages(captured_messages):
+        not_sent += _send_message_batch(client, queue_url, entries)
+    if not_sent:
+        raise TasksNotSentError(f"{len(not_sent)} tasks not sent to SQS: {', '.join(not_sent)}")
+
+
+def _group_messages(captured_messages):
+    """ Group the messages by client and queue, in batches within the SQS limits """
+    messages_by_queue = {}
+    for client, params in captured_messages:
+        queue_url = params.pop("QueueUrl")
+        messages_by_queue.setdefault((client, queue_url), []).append(params)
+    for (client, queue_url), messages in messages_by_queue.items():
+        entries, entries_bytes = [], 0
+        for params in messages:
+            size = len(params["MessageBody"].encode())
+            if entries and (len(entries) == MAX_BATCH_MESSAGES or entries_bytes + size > MAX_BATCH_BYTES):
+                yield client, queue_url, entries
+                entries, entries_bytes = [], 0
+            entries.append({"Id": str(len(entries)), **params})
+            entries_bytes += size
+        if entries:
+            yield client, queue_url, entries
+
+
+def _send_message_batch(client, queue_url, entries):
+    """ Returns the ids of the tasks not sent """
+    from botocore.exceptions import BotoCoreError, ClientError
+
+    try:
+        response = client.send_message_batch(QueueUrl=queue_url, Entries=entries)
+    except (BotoCoreError, ClientError) as error:
+        logger.warning(f"Sending {len(entries)} tasks in a batch to {queue_url} failed, sending them one by one: {error}")
+        failed_entries = entries
+    else:
+        # Messages may fail individually (i.e. throttling): Send them again one by one
+        failed_ids = {failed["Id"] for failed in response.get("Failed", [])}
+        failed_entries = [entry for entry in entries if entry["Id"] in failed_ids]
+    not_sent = []
+    for entry in failed_entries:
+        params = {key: value for key, value in entry.items() if key != "Id"}
+        try:
+            client.send_message(QueueUrl=queue_url, **params)
+        except (BotoCoreError, ClientError) as error:
+            not_sent.append(_task_id(params))
+            logger.error(f"Sending the task {not_sent[-1]} to {queue_url} failed: {error}")
+    return not_sent
+
+
+def _task_id(params):
+    # The id of the task is in the body of the message (kombu protocol: base64 encoded json, with the headers)
+    try:
+        return json.loads(base64.b64decode(params["MessageBody"]))["headers"]["id"]
+    except (ValueError, KeyError, TypeError):
+        return "(unknown id)"
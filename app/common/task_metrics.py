@@ -0,0 +1,144 @@
+"""
+    Celery tasks metrics, recorded with celery signals: time waiting in the queue, run time, retries and failures,
+    by queue and task name.
+    - TASK_METRICS_NAMESPACE: Metrics are logged in CloudWatch Embedded Metric Format (EMF), in this namespace.
+      CloudWatch extracts the metrics from the worker logs, without calls to the CloudWatch API.
+    - TASK_METRICS_PROMETHEUS_PORT: Metrics are served for Prometheus in this port (i.e. locally).
+      Using prefork workers, set PROMETHEUS_MULTIPROC_DIR to collect the metrics of all the worker processes.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+from celery import signals
+from django.conf import settings
+
+
+# Time the tasks being run started, by task id
+_started = {}
+_stdout_lock = threading.Lock()
+_prometheus_metrics = None
+
+
+def connect_task_metrics():
+    signals.before_task_publish.connect(record_enqueued_at, weak=False)
+    signals.task_prerun.connect(record_started, weak=False)
+    signals.task_postrun.connect(record_finished, weak=False)
+    signals.worker_ready.connect(start_prometheus_server, weak=False)
+
+
+def record_enqueued_at(headers=None, **kwargs):
+    # Sent with the message, read by the worker running the task
+    if headers is not None:
+        headers["enqueued_at"] = time.time()
+
+
+def record_started(task_id=None, task=None, **kwargs):
+    _started[task_id] = (time.time(), time.perf_counter())
+
+
+def record_finished(task_id=None, task=None, state=None, **kwargs):
+    started = _started.pop(task_id, None)
+    if started is None or not (settings.TASK_METRICS_NAMESPACE or settings.TASK_METRICS_PROMETHEUS_PORT):
+        return
+    started_at, started_perf_counter = started
+    run_time = time.perf_counter() - started_perf_counter
+    queue_wait_time = get_queue_wait_time(task.request, started_at)
+    queue = (task.request.delivery_info or {}).get("routing_key") or "unknown"
+    if settings.TASK_METRICS_NAMESPACE:
+        log_emf_metrics(task.name, queue, state, queue_wait_time, run_time, task_id)
+    if settings.TASK_METRICS_PROMETHEUS_PORT:
+        observe_prometheus_metrics(task.name, queue, state, queue_wait_time, run_time)
+
+
+def get_queue_wait_time(request, started_at):
+    """ Time since the message was sent, or since its eta for delayed tasks (i.e. retries). None if unknown """
+    enqueued_at = getattr(request, "enqueued_at", None) or (request.headers or {}).get("enqueued_at")
+    if enqueued_at is None:
+        return None
+    if request.eta:
+        eta = request.eta if isinstance(request.eta, datetime) else datetime.fromisoformat(request.eta)
+        enqueued_at = max(enqueued_at, eta.timestamp())
+    return max(started_at - enqueued_at, 0)
+
+
+def log_emf_metrics(task_name, queue, state, queue_wait_time, run_time, task_id):
+    values = {
+        "RunTime": run_time * 1000,
+        "Succeeded": int(state == "SUCCESS"),
+        "Failed": int(state == "FAILURE"),
+        "Retried": int(state == "RETRY"),
+    }
+    if queue_wait_time is not None:
+        values["QueueWaitTime"] = queue_wait_time * 1000
+    record = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": settings.TASK_METRICS_NAMESPACE,
+                    "Dimensions": [["Queue"], ["Queue", "TaskName"]],
+                    "Metrics": [
+                        {"Name": name, "Unit": "Milliseconds" if name.endswith("Time") else "Count"}
+                        for name in values
+                    ],
+                }
+            ],
+        },
+        "Queue": queue,
+        "TaskName": task_name,
+        # Not metrics, but available in CloudWatch Logs Insights
+        "TaskId": task_id,
+        "State": state,
+        **values,
+    }
+    # Each record must be a log event on its own, so it's written to the original stdout,
+    # skipping celery's redirection of stdout to its logger (which adds a prefix)
+    with _stdout_lock:
+        sys.__stdout__.write(json.dumps(record) + "\n")
+        sys.__stdout__.flush()
+
+
+def get_prometheus_metrics():
+    global _prometheus_metrics
+    if _prometheus_metrics is None:
+        from prometheus_client import Counter, Histogram
+
+        _prometheus_metrics = {
+            "queue_wait_time": Histogram(
+                "celery_task_queue_wait_seconds", "Time tasks wait in the queue", ["queue", "task"]
+            ),
+            "run_time": Histogram(
+                "celery_task_run_seconds", "Time running tasks", ["queue", "task", "state"]
+            ),
+            "tasks": Counter(
+                "celery_tasks", "Tasks run, by state (SUCCESS, FAILURE or RETRY)", ["queue", "task", "state"]
+            ),
+        }
+    return _prometheus_metrics
+
+
+def observe_prometheus_metrics(task_name, queue, state, queue_wait_time, run_time):
+    metrics = get_prometheus_metrics()
+    if queue_wait_time is not None:
+        metrics["queue_wait_time"].labels(queue, task_name).observe(queue_wait_time)
+    metrics["run_time"].labels(queue, task_name, state).observe(run_time)
+    metrics["tasks"].labels(queue, task_name, state).inc()
+
+
+def start_prometheus_server(**kwargs):
+    # Started once, in the main worker process
+    if not settings.TASK_METRICS_PROMETHEUS_PORT:
+        return
+    from prometheus_client import CollectorRegistry, start_http_server, multiprocess
+
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        start_http_server(settings.TASK_METRICS_PROMETHEUS_PORT, registry=registry)
+    else:
+        get_prometheus_metrics()
+        start_http_server(settings.TASK_METRICS_PROMETHEUS_PORT)
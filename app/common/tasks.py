@@ -0,0 +1,53 @@
+import time
+
+from app.celery import app as celery_app
+from django.core.cache import cache
+from django.db import connection
+
+from . import bulk
+from .models import BulkJob, BulkChunk
+from .task_batching import enqueue_in_batches
+
+
+# Bulk jobs tasks. See common.bulk. Routed to the bulk queue in CELERY_TASK_ROUTES.
+@celery_app.task
+def plan_bulk_job(job_id):
+    job = BulkJob.objects.get(pk=job_id)
+    bulk.plan_job(job, dispatch=dispatch_chunks)
+
+
+@celery_app.task(bind=True, max_retries=None)
+def process_bulk_chunk(self, chunk_id):
+    try:
+        bulk.process_chunk(chunk_id)
+    except Exception as exc:
+        chunk = BulkChunk.objects.select_related("job").get(pk=chunk_id)
+        if chunk.attempts < chunk.job.max_attempts:
+            # Exponential backoff: 1m, 2m, 4m.. up to 15m
+            raise self.retry(exc=exc, countdown=min(60 * 2 ** (chunk.attempts - 1), 900))
+        raise
+
+
+def dispatch_chunks(chunks):
+    # One SQS request every 10 chunks
+    with enqueue_in_batches():
+        for chunk in chunks:
+            process_bulk_chunk.delay(chunk.pk)
+
+
+# Benchmark tasks. See the benchmark_worker_pools command.
+@celery_app.task
+def benchmark_task(run_key, workload, amount):
+    if workload == "io":
+        # Blocks while waiting, i.e. a call to an external API
+        time.sleep(amount / 1000)
+    elif workload == "db":
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_sleep(%s)", [amount / 1000])
+    elif workload == "cpu":
+        # A fixed amount of work in python code, holding the GIL
+        value = 0
+        for i in range(amount):
+            value = (value * 31 + i) % 1000003
+    # Count the tasks done, in the cache shared with the benchmark command
+    cache.incr(run_key)
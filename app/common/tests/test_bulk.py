@@ -0,0 +1,115 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from common import bulk
+from common.models import BulkJob, BulkChunk
+from users.models import CustomUser
+
+
+processed_ranges = []
+
+
+@bulk.bulk_handler(queryset=lambda: CustomUser.objects.all())
+def record_users(users):
+    ids = [user.pk for user in users]
+    processed_ranges.append((ids[0], ids[-1]))
+    return len(ids)
+
+
+@override_settings(SQS_VISIBILITY_TIMEOUTS={"default": 3600, "high_priority": 600, "bulk": 10800})
+class BulkChunkTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [CustomUser.objects.create(username=f"user{i}") for i in range(5)]
+        cls.job = BulkJob.objects.create(name=record_users.name, chunk_size=2, status=BulkJob.RUNNING)
+
+    def setUp(self):
+        processed_ranges.clear()
+
+    def create_chunk(self, first, last, **kwargs):
+        return BulkChunk.objects.create(
+            job=self.job, first_id=self.users[first].pk, last_id=self.users[last].pk, size=last - first + 1, **kwargs
+        )
+
+    def test_pending_chunk_is_claimed_and_processed(self):
+        chunk = self.create_chunk(0, 1)
+
+        self.assertIsNotNone(bulk.process_chunk(chunk.pk))
+
+        chunk.refresh_from_db()
+        self.assertEqual(chunk.status, BulkChunk.DONE)
+        self.assertEqual(chunk.attempts, 1)
+        self.assertEqual(chunk.processed, 2)
+        self.assertEqual(processed_ranges, [(self.users[0].pk, self.users[1].pk)])
+
+    def test_chunk_claimed_by_another_worker_is_skipped(self):
+        # Running for longer than the old 1h threshold, but less than the visibility timeout of the bulk queue
+        chunk = self.create_chunk(0, 1, status=BulkChunk.RUNNING, attempts=1,
+                                  started_at=timezone.now() - timedelta(hours=2))
+
+        self.assertIsNone(bulk.process_chunk(chunk.pk))
+
+        chunk.refresh_from_db()
+        self.assertEqual(chunk.status, BulkChunk.RUNNING)
+        self.assertEqual(chunk.attempts, 1)
+        self.assertEqual(processed_ranges, [])
+
+    def test_stale_chunk_is_taken_again(self):
+        chunk = self.create_chunk(0, 1, status=BulkChunk.RUNNING, attempts=1,
+                                  started_at=timezone.now() - timedelta(seconds=10800 + 60))
+
+        self.assertIsNotNone(bulk.process_chunk(chunk.pk))
+
+        chunk.refresh_from_db()
+        self.assertEqual(chunk.status, BulkChunk.DONE)
+        self.assertEqual(chunk.attempts, 2)
+
+    def test_done_chunk_is_not_processed_again(self):
+        chunk = self.create_chunk(0, 1, status=BulkChunk.DONE, attempts=1, processed=2)
+
+        self.assertIsNone(bulk.process_chunk(chunk.pk))
+        self.assertEqual(processed_ranges, [])
+
+    def test_stale_threshold_follows_the_bulk_queue_visibility_timeout(self):
+        with override_settings(SQS_VISIBILITY_TIMEOUTS={"bulk": 600}):
+            self.assertEqual(bulk.get_stale_chunk_seconds(), 600)
+
+    def test_resume_skips_done_chunks(self):
+        done = self.create_chunk(0, 1, status=BulkChunk.DONE, attempts=1, processed=2)
+        failed = self.create_chunk(2, 3, status=BulkChunk.FAILED, attempts=3)
+        running = self.create_chunk(4, 4, status=BulkChunk.RUNNING, attempts=1, started_at=timezone.now())
+        stale = self.create_chunk(4, 4, status=BulkChunk.RUNNING, attempts=1,
+                                  started_at=timezone.now() - timedelta(seconds=10800 + 60))
+        pending = self.create_chunk(4, 4)
+
+        with mock.patch("common.tasks.dispatch_chunks") as dispatch_chunks:
+            chunks = bulk.resume_job(self.job)
+
+        self.assertEqual({chunk.pk for chunk in chunks}, {failed.pk, stale.pk, pending.pk})
+        dispatch_chunks.assert_called_once_with(chunks)
+        failed.refresh_from_db()
+        self.assertEqual(failed.attempts, 0)
+        done.refresh_from_db()
+        running.refresh_from_db()
+        self.assertEqual((done.status, running.status), (BulkChunk.DONE, BulkChunk.RUNNING))
+
+    def test_plan_job_creates_chunks_after_the_last_one(self):
+        job = BulkJob.objects.create(name=record_users.name, chunk_size=2)
+        BulkChunk.objects.create(job=job, first_id=self.users[0].pk, last_id=self.users[1].pk, size=2)
+        dispatch = mock.Mock()
+
+        bulk.plan_job(job, dispatch=dispatch)
+
+        ranges = list(job.chunks.order_by("first_id").values_list("first_id", "last_id"))
+        self.assertEqual(ranges, [
+            (self.users[0].pk, self.users[1].pk),
+            (self.users[2].pk, self.users[3].pk),
+            (self.users[4].pk, self.users[4].pk),
+        ])
+        dispatch.assert_called_once()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.total_chunks), (BulkJob.RUNNING, 3))
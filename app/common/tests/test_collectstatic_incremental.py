@@ -0,0 +1,111 @@
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.management import call_command
+from django.test import SimpleTestCase, override_settings
+
+from common.management.commands import collectstatic_incremental
+from common.management.commands.collectstatic_incremental import SYNC_MANIFEST_NAME
+
+
+class CollectStaticIncrementalTests(SimpleTestCase):
+    """ Static files uploaded to a local storage, in place of S3 """
+
+    def setUp(self):
+        self.source_dir = self.make_dir()
+        self.write_source("css/app.css", "body { color: red; }")
+        self.write_source("js/app.js", "console.log('app');")
+        settings = override_settings(
+            STATICFILES_DIRS=[self.source_dir],
+            STATICFILES_FINDERS=["django.contrib.staticfiles.finders.FileSystemFinder"],
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.storage = ManifestStaticFilesStorage(location=self.make_dir())
+        storage = mock.patch.object(collectstatic_incremental, "staticfiles_storage", self.storage)
+        storage.start()
+        self.addCleanup(storage.stop)
+
+    def make_dir(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        return directory.name
+
+    def write_source(self, name, content):
+        path = os.path.join(self.source_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as source_file:
+            source_file.write(content)
+
+    def collect(self, *args):
+        """ Names of the files saved to the storage, in order """
+        with mock.patch.object(self.storage, "save", wraps=self.storage.save) as save:
+            call_command("collectstatic_incremental", *args, stdout=StringIO())
+        return [call.args[0] for call in save.call_args_list]
+
+    def stored_files(self):
+        return sorted(
+            os.path.relpath(os.path.join(directory, file_name), self.storage.location)
+            for directory, _, file_names in os.walk(self.storage.location)
+            for file_name in file_names
+        )
+
+    def stored_name(self, name):
+        """ Hashed name of the file, in the uploaded manifest """
+        return ManifestStaticFilesStorage(location=self.storage.location).stored_name(name)
+
+    def read(self, name):
+        with self.storage.open(name) as stored_file:
+            return stored_file.read().decode()
+
+    def test_all_files_are_uploaded_the_first_time(self):
+        uploaded = self.collect()
+
+        hashed_css = self.stored_name("css/app.css")
+        self.assertEqual(
+            sorted(uploaded[:-2]), sorted(["css/app.css", hashed_css, "js/app.js", self.stored_name("js/app.js")])
+        )
+        # The manifest is uploaded once the files it points to are, and the hashes of the files uploaded after it
+        self.assertEqual(uploaded[-2:], ["staticfiles.json", SYNC_MANIFEST_NAME])
+        self.assertEqual(self.stored_files(), sorted(uploaded))
+        self.assertIn(hashed_css, json.loads(self.read(SYNC_MANIFEST_NAME)))
+
+    def test_only_changed_files_are_uploaded(self):
+        self.collect()
+        self.assertEqual(self.collect(), [])
+
+        self.write_source("css/app.css", "body { color: blue; }")
+        uploaded = self.collect()
+
+        hashed_css = self.stored_name("css/app.css")
+        self.assertEqual(sorted(uploaded[:-2]), sorted(["css/app.css", hashed_css]))
+        self.assertEqual(uploaded[-2:], ["staticfiles.json", SYNC_MANIFEST_NAME])
+        # Files are replaced, not saved under other names
+        self.assertEqual(self.read("css/app.css"), "body { color: blue; }")
+        self.assertEqual(len(self.stored_files()), 7)
+
+    def test_sync_manifest_is_kept_if_an_upload_fails(self):
+        self.collect()
+        sync_manifest = self.read(SYNC_MANIFEST_NAME)
+        self.write_source("css/app.css", "body { color: blue; }")
+
+        with mock.patch.object(self.storage, "_save", side_effect=OSError("Upload failed")):
+            with self.assertRaises(OSError):
+                call_command("collectstatic_incremental", stdout=StringIO())
+
+        self.assertEqual(self.read(SYNC_MANIFEST_NAME), sync_manifest)
+        # Uploaded on the next run
+        self.assertIn("css/app.css", self.collect())
+
+    def test_force_uploads_all_the_files(self):
+        self.collect()
+
+        self.assertEqual(len(self.collect("--force")), 6)
+
+    def test_dry_run_uploads_nothing(self):
+        self.assertEqual(self.collect("--dry-run"), [])
+        self.assertEqual(self.stored_files(), [])
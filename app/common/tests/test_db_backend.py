@@ -0,0 +1,58 @@
+import copy
+from unittest import skipUnless
+
+from django.db import connection, connections
+from django.test import TransactionTestCase
+
+from common.db.backends.postgresql.base import DatabaseWrapper, close_pools
+
+
+@skipUnless(connection.vendor == "postgresql", "Requires PostgreSQL")
+class PooledConnectionTests(TransactionTestCase):
+
+    def make_connection(self, **options):
+        settings_dict = copy.deepcopy(connections["default"].settings_dict)
+        settings_dict["CONN_HEALTH_CHECKS"] = True
+        settings_dict["OPTIONS"] = {"pool": {"min_size": 1, "max_size": 2}, **options}
+        pooled_connection = DatabaseWrapper(settings_dict, alias="pooled")
+        self.addCleanup(close_pools)
+        self.addCleanup(pooled_connection.close)
+        return pooled_connection
+
+    def fetch_one(self, pooled_connection, sql):
+        with pooled_connection.cursor() as cursor:
+            cursor.execute(sql)
+            return cursor.fetchone()[0]
+
+    def test_new_pool_connection_is_health_checked_and_usable(self):
+        pooled_connection = self.make_connection()
+
+        self.assertEqual(self.fetch_one(pooled_connection, "SELECT 1"), 1)
+        self.assertTrue(pooled_connection.get_autocommit())
+        self.assertFalse(pooled_connection.in_atomic_block)
+
+    def test_session_settings_are_applied_after_the_health_check(self):
+        pooled_connection = self.make_connection(isolation_level=3)  # ISOLATION_LEVEL_SERIALIZABLE
+        pooled_connection.ensure_connection()
+        # Applied to transactions
+        pooled_connection.set_autocommit(False)
+
+        self.assertEqual(self.fetch_one(pooled_connection, "SHOW transaction_isolation"), "serializable")
+
+    def test_connection_is_given_back_to_the_pool_and_reused(self):
+        pooled_connection = self.make_connection()
+        backend_pid = self.fetch_one(pooled_connection, "SELECT pg_backend_pid()")
+        pooled_connection.close()
+
+        self.assertEqual(self.fetch_one(pooled_connection, "SELECT pg_backend_pid()"), backend_pid)
+
+    def test_connection_closed_by_the_server_is_replaced(self):
+        pooled_connection = self.make_connection()
+        backend_pid = self.fetch_one(pooled_connection, "SELECT pg_backend_pid()")
+        pooled_connection.close()
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_terminate_backend(%s)", [backend_pid])
+
+        new_backend_pid = self.fetch_one(pooled_connection, "SELECT pg_backend_pid()")
+
+        self.assertNotEqual(new_backend_pid, backend_pid)
@@ -0,0 +1,149 @@
+import json
+
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from common import request_profiling
+from common.middleware import request_profiling_middleware
+from common.request_profiling import ProfiledLocMemCache, RequestProfile, start_profile, stop_profile
+from users.models import CustomUser
+
+
+def disconnect_query_profiler():
+    connection_created.disconnect(dispatch_uid="request_profiling")
+    if request_profiling.profile_query in connection.execute_wrappers:
+        connection.execute_wrappers.remove(request_profiling.profile_query)
+
+
+class QueryProfilingTests(TestCase):
+
+    def setUp(self):
+        request_profiling.connect_query_profiler()
+        self.addCleanup(disconnect_query_profiler)
+
+    def test_queries_of_the_profiled_context_are_counted(self):
+        profile, token = start_profile()
+        try:
+            CustomUser.objects.filter(username="a").exists()
+            CustomUser.objects.filter(username="b").exists()
+            CustomUser.objects.count()
+        finally:
+            stop_profile(token)
+
+        self.assertEqual(profile.db_queries, 3)
+        self.assertGreater(profile.db_time, 0)
+        repeated_queries = profile.repeated_queries()
+        self.assertEqual(len(repeated_queries), 1)
+        self.assertEqual(repeated_queries[0]["count"], 2)
+
+    def test_queries_outside_a_profile_are_not_counted(self):
+        profile, token = start_profile()
+        stop_profile(token)
+
+        CustomUser.objects.count()
+
+        self.assertEqual(profile.db_queries, 0)
+
+    def test_profiler_is_installed_once_per_connection(self):
+        request_profiling.connect_query_profiler()
+
+        self.assertEqual(connection.execute_wrappers.count(request_profiling.profile_query), 1)
+
+
+class ProfiledCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        self.cache = ProfiledLocMemCache("request-profiling-tests", {})
+        self.addCleanup(self.cache.clear)
+        self.cache.set_many({"a": 1, "b": None})
+
+    def profile(self, call):
+        profile, token = start_profile()
+        try:
+            return call(), profile
+        finally:
+            stop_profile(token)
+
+    def test_get_counts_hits_and_misses(self):
+        self.assertEqual(self.profile(lambda: self.cache.get("a"))[0], 1)
+        # Cached None values are hits
+        value, profile = self.profile(lambda: [self.cache.get("b", 0), self.cache.get("c", 0), self.cache.get("d")])
+
+        self.assertEqual(value, [None, 0, None])
+        self.assertEqual((profile.cache_hits, profile.cache_misses), (1, 2))
+
+    def test_get_many_counts_hits_and_misses(self):
+        value, profile = self.profile(lambda: self.cache.get_many(key for key in ["a", "b", "c"]))
+
+        self.assertEqual(value, {"a": 1, "b": None})
+        self.assertEqual((profile.cache_hits, profile.cache_misses), (2, 1))
+
+    def test_calls_outside_a_profile_are_not_counted(self):
+        self.assertEqual(self.cache.get("a"), 1)
+        self.assertEqual(self.cache.get_many(["a", "c"]), {"a": 1})
+
+
+class ServerTimingTests(SimpleTestCase):
+
+    def test_format(self):
+        profile = RequestProfile()
+        profile.db_queries, profile.db_time = 15, 0.01234
+        profile.cache_hits, profile.cache_misses, profile.cache_time = 1, 2, 0.0008
+
+        self.assertEqual(
+            profile.server_timing(0.048),
+            'db;dur=12.3;desc="15 queries", cache;dur=0.8;desc="1 hits, 2 misses", total;dur=48.0',
+        )
+
+
+@override_settings(
+    REQUEST_PROFILING=True,
+    REQUEST_PROFILING_SAMPLE_RATE=0,
+    REQUEST_PROFILING_SLOW_REQUEST_MS=10000,
+    REQUEST_PROFILING_MAX_QUERIES=2,
+)
+class RequestProfilingMiddlewareTests(TestCase):
+
+    def setUp(self):
+        self.addCleanup(disconnect_query_profiler)
+
+    def get(self, queries=0):
+        def view(request):
+            for _ in range(queries):
+                CustomUser.objects.count()
+            return HttpResponse("ok")
+
+        return request_profiling_middleware(view)(RequestFactory().get("/users/"))
+
+    def test_not_used_when_profiling_is_off(self):
+        with override_settings(REQUEST_PROFILING=False):
+            with self.assertRaises(MiddlewareNotUsed):
+                request_profiling_middleware(lambda request: HttpResponse())
+
+    @override_settings(REQUEST_PROFILING_SERVER_TIMING=True)
+    def test_server_timing_header(self):
+        response = self.get(queries=1)
+
+        self.assertIn('desc="1 queries"', response["Server-Timing"])
+
+    @override_settings(REQUEST_PROFILING_SERVER_TIMING=False)
+    def test_no_server_timing_header_when_off(self):
+        response = self.get()
+
+        self.assertFalse(response.has_header("Server-Timing"))
+
+    def test_requests_with_too_many_queries_are_logged(self):
+        with self.assertLogs("common.request_profiling", "INFO") as logs:
+            self.get(queries=2)
+
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual((record["path"], record["status"]), ("/users/", 200))
+        self.assertEqual((record["db_queries"], record["response_bytes"]), (2, 2))
+        self.assertEqual(len(logs.records), 1)
+
+    def test_other_requests_are_not_logged(self):
+        with self.assertNoLogs("common.request_profiling", "INFO"):
+            self.get(queries=1)
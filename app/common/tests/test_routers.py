@@ -0,0 +1,128 @@
+from unittest import mock
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, TransactionTestCase, override_settings
+
+from common.db import routers
+from common.db.routers import REPLICA_DB_ALIAS, replica_reads, pin_to_primary
+from common.middleware import replica_routing_middleware
+from users.models import CustomUser
+
+
+def read_db():
+    """ Database the reads of users go to """
+    return CustomUser.objects.all().db
+
+
+@override_settings(DATABASE_ROUTERS=["common.db.routers.ReplicaRouter"])
+class ReplicaRouterTests(TransactionTestCase):
+
+    def test_reads_outside_a_block_use_the_primary(self):
+        self.assertEqual(read_db(), DEFAULT_DB_ALIAS)
+
+    def test_reads_in_a_block_use_the_replica(self):
+        with replica_reads():
+            self.assertEqual(read_db(), REPLICA_DB_ALIAS)
+
+    def test_write_pins_the_next_reads_to_the_primary(self):
+        with replica_reads() as state:
+            CustomUser.objects.create(username="user")
+
+            self.assertEqual(read_db(), DEFAULT_DB_ALIAS)
+            self.assertTrue(state["wrote"])
+
+    def test_reads_in_a_transaction_use_the_primary(self):
+        with replica_reads():
+            with transaction.atomic():
+                self.assertEqual(read_db(), DEFAULT_DB_ALIAS)
+            self.assertEqual(read_db(), REPLICA_DB_ALIAS)
+
+    def test_pin_to_primary(self):
+        with replica_reads() as state:
+            pin_to_primary()
+
+            self.assertEqual(read_db(), DEFAULT_DB_ALIAS)
+            self.assertFalse(state["wrote"])
+
+    def test_writes_and_migrations_use_the_primary(self):
+        router = routers.ReplicaRouter()
+        with replica_reads():
+            self.assertEqual(router.db_for_write(CustomUser), DEFAULT_DB_ALIAS)
+        self.assertTrue(router.allow_migrate(DEFAULT_DB_ALIAS, "users"))
+        self.assertFalse(router.allow_migrate(REPLICA_DB_ALIAS, "users"))
+
+
+@override_settings(DATABASE_ROUTERS=["common.db.routers.ReplicaRouter"])
+class ReplicaRoutingMiddlewareTests(TransactionTestCase):
+
+    def setUp(self):
+        # The middleware is used when there is a replica. Queries aren't run in it: the tests check where they'd go
+        databases = mock.patch.dict(settings.DATABASES, {REPLICA_DB_ALIAS: settings.DATABASES[DEFAULT_DB_ALIAS]})
+        databases.start()
+        self.addCleanup(databases.stop)
+        self.factory = RequestFactory()
+        self.read_dbs = []
+
+    def request(self, request, write=False, atomic=False):
+        def view(request):
+            if atomic:
+                with transaction.atomic():
+                    self.read_dbs.append(read_db())
+            else:
+                self.read_dbs.append(read_db())
+            if write:
+                CustomUser.objects.create(username=f"user{len(self.read_dbs)}")
+                self.read_dbs.append(read_db())
+            return HttpResponse()
+
+        return replica_routing_middleware(view)(request)
+
+    def test_get_reads_from_the_replica(self):
+        response = self.request(self.factory.get("/"))
+
+        self.assertEqual(self.read_dbs, [REPLICA_DB_ALIAS])
+        self.assertNotIn(settings.DB_REPLICA_PIN_COOKIE_NAME, response.cookies)
+
+    def test_unsafe_methods_never_read_from_the_replica(self):
+        for method in ("post", "put", "patch", "delete"):
+            self.request(getattr(self.factory, method)("/"))
+
+        self.assertEqual(self.read_dbs, [DEFAULT_DB_ALIAS] * 4)
+
+    def test_write_pins_the_next_reads_and_sets_the_cookie(self):
+        response = self.request(self.factory.get("/"), write=True)
+
+        self.assertEqual(self.read_dbs, [REPLICA_DB_ALIAS, DEFAULT_DB_ALIAS])
+        cookie = response.cookies[settings.DB_REPLICA_PIN_COOKIE_NAME]
+        self.assertEqual(cookie["max-age"], settings.DB_REPLICA_PIN_SECONDS)
+
+    def test_pin_cookie_sends_the_reads_to_the_primary(self):
+        request = self.factory.get("/")
+        request.COOKIES[settings.DB_REPLICA_PIN_COOKIE_NAME] = "1"
+
+        self.request(request)
+
+        self.assertEqual(self.read_dbs, [DEFAULT_DB_ALIAS])
+
+    def test_reads_in_a_transaction_use_the_primary(self):
+        self.request(self.factory.get("/"), atomic=True)
+
+        self.assertEqual(self.read_dbs, [DEFAULT_DB_ALIAS])
+
+    def test_routing_state_is_reset_between_requests(self):
+        self.request(self.factory.post("/"), write=True)
+        self.assertIsNone(routers._state.get())
+
+        self.request(self.factory.get("/"))
+
+        self.assertEqual(self.read_dbs[-1], REPLICA_DB_ALIAS)
+        self.assertIsNone(routers._state.get())
+
+    def test_not_used_without_a_replica(self):
+        del settings.DATABASES[REPLICA_DB_ALIAS]
+
+        with self.assertRaises(MiddlewareNotUsed):
+            replica_routing_middleware(lambda request: HttpResponse())
@@ -0,0 +1,75 @@
+import os
+from unittest import mock
+
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, TestCase
+
+from common.sharding import get_shard, shard_queryset
+from users.models import CustomUser
+
+
+class ShardQuerysetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(20):
+            CustomUser.objects.create(username=f"user{i}", is_active=i % 3 != 0)
+
+    @staticmethod
+    def active_users():
+        return CustomUser.objects.filter(is_active=True)
+
+    def shard_ids(self, shard_count):
+        return [
+            set(shard_queryset(self.active_users(), shard_index, shard_count).values_list("pk", flat=True))
+            for shard_index in range(shard_count)
+        ]
+
+    def test_shards_cover_each_row_once(self):
+        for shard_count in (1, 2, 3, 7, 30):
+            shards = self.shard_ids(shard_count)
+
+            self.assertEqual(sum(len(ids) for ids in shards), self.active_users().count())
+            self.assertEqual(set().union(*shards), set(self.active_users().values_list("pk", flat=True)))
+
+    def test_rows_excluded_by_the_filter_while_shards_run_keep_their_shard(self):
+        expected_ids = set(self.active_users().values_list("pk", flat=True))
+        processed_ids = []
+        for shard_index in range(4):
+            shard = shard_queryset(self.active_users(), shard_index, 4)
+            ids = list(shard.values_list("pk", flat=True))
+            # The shard processes its rows, which the filter of the next shards then excludes
+            CustomUser.objects.filter(pk__in=ids).update(is_active=False)
+            processed_ids += ids
+
+        self.assertEqual(len(processed_ids), len(expected_ids))
+        self.assertEqual(set(processed_ids), expected_ids)
+
+    def test_rows_inserted_after_the_last_id_go_to_the_last_shard(self):
+        shards = [shard_queryset(self.active_users(), shard_index, 3) for shard_index in range(3)]
+        user = CustomUser.objects.create(username="new")
+
+        self.assertEqual([user in shard for shard in shards], [False, False, True])
+
+    def test_rows_inserted_in_an_empty_table_go_to_the_last_shard(self):
+        CustomUser.objects.all().delete()
+        shards = [shard_queryset(self.active_users(), shard_index, 3) for shard_index in range(3)]
+        user = CustomUser.objects.create(username="new")
+
+        self.assertEqual([user in shard for shard in shards], [False, False, True])
+
+
+class GetShardTests(SimpleTestCase):
+
+    def test_shard_from_the_env(self):
+        with mock.patch.dict(os.environ, {"SHARD_INDEX": "2", "SHARD_COUNT": "8"}):
+            self.assertEqual(get_shard(), (2, 8))
+
+    def test_all_rows_without_the_env(self):
+        with mock.patch.dict(os.environ, {"SHARD_INDEX": "", "SHARD_COUNT": ""}):
+            self.assertEqual(get_shard(), (0, 1))
+
+    def test_invalid_shard(self):
+        with mock.patch.dict(os.environ, {"SHARD_INDEX": "8", "SHARD_COUNT": "8"}):
+            with self.assertRaises(ImproperlyConfigured):
+                get_shard()
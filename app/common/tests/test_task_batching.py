@@ -0,0 +1,196 @@
+import base64
+import json
+from unittest import mock
+
+import boto3
+from botocore.stub import Stubber
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from app.celery import app as celery_app
+from common import sqs_transport, task_batching
+from common.middleware import task_batching_middleware
+from common.task_batching import enqueue_in_batches, TasksNotSentError
+
+
+@celery_app.task
+def record(value):
+    return value
+
+
+def message_task_id(entry):
+    return json.loads(base64.b64decode(entry["MessageBody"]))["headers"]["id"]
+
+
+def message_args(entry):
+    return json.loads(base64.b64decode(json.loads(base64.b64decode(entry["MessageBody"]))["body"]))[0]
+
+
+SENT = {"MessageId": "message", "MD5OfMessageBody": "0" * 32}
+
+
+class TaskBatchingTests(SimpleTestCase):
+    """ Tasks sent by the celery app, through the SQS transport, to a stubbed SQS client """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # One client for the class: the channels of the pooled broker connections keep theirs between the tests
+        cls.sqs_client = boto3.client(
+            "sqs",
+            region_name="us-east-1",
+            aws_access_key_id="FAKEABCDEFGHIJKLMNOP",
+            aws_secret_access_key="FAKE7NiynG+TogH8Nj+P9nlE73sq3",
+        )
+        new_sqs_client = mock.patch.object(sqs_transport.Channel, "new_sqs_client", return_value=cls.sqs_client)
+        new_sqs_client.start()
+        cls.addClassCleanup(new_sqs_client.stop)
+
+    def setUp(self):
+        self.stubber = Stubber(self.sqs_client)
+        self.stubber.activate()
+        self.addCleanup(self.stubber.deactivate)
+        send_message_batch = mock.patch.object(
+            self.sqs_client, "send_message_batch", wraps=self.sqs_client.send_message_batch
+        )
+        self.send_message_batch = send_message_batch.start()
+        self.addCleanup(send_message_batch.stop)
+
+    @staticmethod
+    def delay(value):
+        # The queues are predefined: not declared, which would check their size (GetQueueAttributes)
+        return record.apply_async((value,), declare=[])
+
+    def enqueue(self, count):
+        with enqueue_in_batches():
+            return [self.delay(i) for i in range(count)]
+
+    def expect_batch(self, size, failed_ids=()):
+        successful = [{"Id": str(i), **SENT} for i in range(size) if str(i) not in failed_ids]
+        failed = [{"Id": id_, "SenderFault": False, "Code": "ServiceUnavailable"} for id_ in failed_ids]
+        self.stubber.add_response("send_message_batch", {"Successful": successful, "Failed": failed})
+
+    def sent_batches(self):
+        return [call.kwargs["Entries"] for call in self.send_message_batch.call_args_list]
+
+    def test_tasks_are_sent_in_batches_of_10(self):
+        self.expect_batch(10)
+        self.expect_batch(2)
+
+        results = self.enqueue(12)
+
+        self.stubber.assert_no_pending_responses()
+        batches = self.sent_batches()
+        self.assertEqual([len(entries) for entries in batches], [10, 2])
+        self.assertEqual(
+            {call.kwargs["QueueUrl"] for call in self.send_message_batch.call_args_list},
+            {"http://broker:9324/000000000000/default"},
+        )
+        self.assertEqual([entry["Id"] for entry in batches[0]], [str(i) for i in range(10)])
+        # The messages built by celery, with the ids of the results returned
+        entries = batches[0] + batches[1]
+        self.assertEqual([message_task_id(entry) for entry in entries], [result.id for result in results])
+        self.assertEqual(message_args(entries[11]), [11])
+
+    def test_tasks_outside_a_block_are_sent_one_by_one(self):
+        self.stubber.add_response("send_message", SENT)
+
+        result = self.delay(1)
+
+        self.stubber.assert_no_pending_responses()
+        self.assertIsNotNone(result.id)
+        self.send_message_batch.assert_not_called()
+
+    def test_failed_entries_are_sent_one_by_one(self):
+        self.expect_batch(3, failed_ids=["1"])
+        self.stubber.add_response("send_message", SENT)
+
+        self.enqueue(3)
+
+        self.stubber.assert_no_pending_responses()
+
+    def test_batch_error_falls_back_to_single_sends(self):
+        self.stubber.add_client_error("send_message_batch", "AWS.SimpleQueueService.NonExistentQueue", http_status_code=400)
+        for _ in range(2):
+            self.stubber.add_response("send_message", SENT)
+
+        with self.assertLogs("common.task_batching", "WARNING") as logs:
+            self.enqueue(2)
+
+        self.stubber.assert_no_pending_responses()
+        self.assertIn("sending them one by one", logs.output[0])
+
+    def test_tasks_not_sent_one_by_one_are_raised(self):
+        self.expect_batch(3, failed_ids=["0", "2"])
+        self.stubber.add_client_error("send_message", "ServiceUnavailable", http_status_code=503)
+        self.stubber.add_response("send_message", SENT)
+
+        with self.assertLogs("common.task_batching", "ERROR") as logs:
+            with self.assertRaises(TasksNotSentError) as raised:
+                results = []
+                with enqueue_in_batches():
+                    results += [self.delay(i) for i in range(3)]
+
+        # The other task was sent before raising
+        self.stubber.assert_no_pending_responses()
+        self.assertEqual(str(raised.exception), f"1 tasks not sent to SQS: {results[0].id}")
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn(f"Sending the task {results[0].id}", logs.output[0])
+
+    def test_tasks_are_not_sent_if_the_block_raises(self):
+        with self.assertRaises(ValueError):
+            with enqueue_in_batches():
+                self.delay(1)
+                raise ValueError()
+
+        # The stubber raises on calls without a response
+        self.send_message_batch.assert_not_called()
+
+    def test_nested_blocks_are_sent_with_the_outer_block(self):
+        self.expect_batch(2)
+        with enqueue_in_batches():
+            self.delay(1)
+            with enqueue_in_batches():
+                self.delay(2)
+            self.send_message_batch.assert_not_called()
+
+        self.assertEqual([len(entries) for entries in self.sent_batches()], [2])
+
+
+@override_settings(TASK_ENQUEUE_BATCHING=True)
+class TaskBatchingMiddlewareTests(SimpleTestCase):
+
+    def setUp(self):
+        send_batch = mock.patch.object(task_batching, "send_batch")
+        self.send_batch = send_batch.start()
+        self.addCleanup(send_batch.stop)
+
+    def get(self, status):
+        def view(request):
+            record.delay(1)
+            return HttpResponse(status=status)
+
+        return task_batching_middleware(view)(RequestFactory().get("/"))
+
+    def test_tasks_are_sent_after_the_response(self):
+        self.get(200)
+
+        self.send_batch.assert_called_once()
+        self.assertEqual(len(self.send_batch.call_args.args[0]), 1)
+
+    def test_tasks_of_failed_requests_are_not_sent(self):
+        response = self.get(500)
+
+        self.assertEqual(response.status_code, 500)
+        self.send_batch.assert_not_called()
+
+    def test_tasks_are_sent_for_client_errors(self):
+        self.get(404)
+
+        self.send_batch.assert_called_once()
+
+    def test_tasks_not_sent_fail_the_request(self):
+        self.send_batch.side_effect = TasksNotSentError("1 tasks not sent to SQS: id")
+
+        with self.assertRaises(TasksNotSentError):
+            self.get(200)
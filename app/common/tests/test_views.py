@@ -0,0 +1,32 @@
+from unittest import mock
+
+from django.core.exceptions import BadRequest
+from django.test import RequestFactory, SimpleTestCase
+
+from common import views
+
+
+class BenchmarkViewsTests(SimpleTestCase):
+
+    def delay_seconds(self, **params):
+        return views._delay_seconds(RequestFactory().get("/", params))
+
+    def test_delay(self):
+        self.assertEqual(self.delay_seconds(), 0.1)
+        self.assertEqual(self.delay_seconds(ms="250"), 0.25)
+
+    def test_delay_is_clamped(self):
+        self.assertEqual(self.delay_seconds(ms="-5"), 0)
+        self.assertEqual(self.delay_seconds(ms=str(views.MAX_DELAY_MS * 10)), views.MAX_DELAY_MS / 1000)
+
+    def test_invalid_delay_is_a_bad_request(self):
+        for value in ("abc", "1.5", ""):
+            with self.assertRaises(BadRequest):
+                self.delay_seconds(ms=value)
+
+    def test_sync_io_view_waits_the_delay(self):
+        with mock.patch.object(views.time, "sleep") as sleep:
+            response = views.sync_io_view(RequestFactory().get("/", {"ms": "50"}))
+
+        self.assertEqual(response.status_code, 200)
+        sleep.assert_called_once_with(0.05)
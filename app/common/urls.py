@@ -0,0 +1,12 @@
+from django.urls import path
+
+from . import views
+
+
+app_name = "common"
+urlpatterns = [
+    path("benchmark/sync-io/", view=views.sync_io_view, name="benchmark-sync-io"),
+    path("benchmark/async-io/", view=views.async_io_view, name="benchmark-async-io"),
+    path("benchmark/db/", view=views.db_view, name="benchmark-db"),
+    path("benchmark/cpu/", view=views.cpu_view, name="benchmark-cpu"),
+]
@@ -0,0 +1,49 @@
+"""
+    Views simulating common workloads, used to benchmark the app server (enabled with BENCHMARK_VIEWS=True).
+"""
+import asyncio
+import time
+
+from django.core.exceptions import BadRequest
+from django.db import connection
+from django.http import JsonResponse
+
+
+DEFAULT_DELAY_MS = 100
+# Longer delays would tie up the workers (and hit the load balancer timeout)
+MAX_DELAY_MS = 10000
+
+
+def _delay_seconds(request):
+    """ Delay of the ms query param, between 0 and MAX_DELAY_MS. Invalid values are a bad request (400) """
+    try:
+        delay_ms = int(request.GET.get("ms", DEFAULT_DELAY_MS))
+    except ValueError:
+        raise BadRequest("ms must be an integer")
+    return min(max(delay_ms, 0), MAX_DELAY_MS) / 1000
+
+
+def sync_io_view(request):
+    # Blocks a worker (or thread) while waiting, i.e. a call to an external API
+    time.sleep(_delay_seconds(request))
+    return JsonResponse({"status": "OK"})
+
+
+async def async_io_view(request):
+    # Waits without blocking the event loop
+    await asyncio.sleep(_delay_seconds(request))
+    return JsonResponse({"status": "OK"})
+
+
+def db_view(request):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_sleep(%s)", [_delay_seconds(request)])
+    return JsonResponse({"status": "OK"})
+
+
+def cpu_view(request):
+    # Busy loop, i.e. rendering big templates or serializing data
+    end = time.perf_counter() + _delay_seconds(request)
+    while time.perf_counter() < end:
+        pass
+    return JsonResponse({"status": "OK"})
@@ -1,3 +1,5 @@
 #!/bin/sh
 echo "CELERY_BROKER_URL: ${CELERY_BROKER_URL}"
-celery -A app worker -Q $1 -l info
+# The pool is passed in the command line, so celery patches the standard library before starting when using gevent.
+# Concurrency, prefetch multiplier and max tasks per child are read from the settings.
+celery -A app.celery worker -Q $1 -l info -P "${CELERY_WORKER_POOL:-prefork}"
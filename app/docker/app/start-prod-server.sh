@@ -1,4 +1,8 @@
 #!/bin/sh
-python manage.py migrate
-python manage.py collectstatic --noinput
-gunicorn app.wsgi --bind 0.0.0.0:8000 --timeout 60 --access-logfile - --error-logfile -
+set -e
+# Migrations are applied once per deploy, before the service update (see DEFAULT_DEPLOY_COMMANDS).
+# Don't serve requests with a schema behind the code.
+python manage.py check_migrations
+# Workers, threads and the worker class (SERVER_MODE=wsgi or asgi) are derived from the task resources.
+# See app/gunicorn_conf.py
+gunicorn --config app/gunicorn_conf.py
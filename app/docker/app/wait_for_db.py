@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""
+    Wait until the database accepts connections, before running the command of the container (see entrypoint.sh).
+    - Connections are retried with exponential backoff and jitter, until DB_WAIT_TIMEOUT_SECONDS.
+    - Each attempt waits up to DB_WAIT_CONNECT_TIMEOUT_SECONDS: A paused Aurora Serverless cluster is resumed by the
+      connection attempts, and answers once it's resumed.
+    Exits with an error if the database isn't ready before the deadline. The wait time is logged.
+"""
+import os
+import random
+import sys
+import time
+
+import psycopg2
+
+
+def env_float(name, default):
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+TIMEOUT_SECONDS = env_float("DB_WAIT_TIMEOUT_SECONDS", 300)
+INITIAL_DELAY_SECONDS = env_float("DB_WAIT_INITIAL_DELAY_SECONDS", 0.5)
+MAX_DELAY_SECONDS = env_float("DB_WAIT_MAX_DELAY_SECONDS", 10)
+CONNECT_TIMEOUT_SECONDS = env_float("DB_WAIT_CONNECT_TIMEOUT_SECONDS", 5)
+
+
+def log(message):
+    print(f"[wait_for_db] {message}", file=sys.stderr, flush=True)
+
+
+def one_line(error):
+    return " ".join(str(error).split())
+
+
+def connect(timeout):
+    connection = psycopg2.connect(
+        dbname=os.getenv("DB_NAME"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        host=os.getenv("DB_HOST"),
+        port=os.getenv("DB_PORT") or 5432,
+        connect_timeout=max(int(timeout), 1),
+    )
+    connection.close()
+
+
+def wait_for_db(timeout, initial_delay, max_delay, connect_timeout):
+    """ Returns the attempts made, or raises the last connection error once the timeout is reached """
+    deadline = time.monotonic() + timeout
+    attempt = 0
+    while True:
+        attempt += 1
+        remaining = deadline - time.monotonic()
+        try:
+            connect(min(connect_timeout, remaining))
+            return attempt
+        except psycopg2.OperationalError as error:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise
+            # Full jitter: the tasks starting together don't retry at the same time
+            delay = min(random.uniform(0, min(max_delay, initial_delay * 2 ** (attempt - 1))), remaining)
+            log(f"Database unavailable (attempt {attempt}), retrying in {delay:.1f}s: {one_line(error)}")
+            time.sleep(delay)
+
+
+def main():
+    start = time.monotonic()
+    log(f"Waiting for database '{os.getenv('DB_NAME')}' on host '{os.getenv('DB_HOST')}'..")
+    try:
+        attempts = wait_for_db(TIMEOUT_SECONDS, INITIAL_DELAY_SECONDS, MAX_DELAY_SECONDS, CONNECT_TIMEOUT_SECONDS)
+    except psycopg2.OperationalError as error:
+        log(f"Database not ready after {time.monotonic() - start:.1f}s: {one_line(error)}")
+        sys.exit(1)
+    log(f"Database ready after {time.monotonic() - start:.1f}s ({attempts} attempts)")
+
+
+if __name__ == "__main__":
+    main()
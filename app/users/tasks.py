@@ -1,6 +1,22 @@
-from celery import shared_task
+from app.celery import app as celery_app
+from common.bulk import bulk_handler
+from .models import CustomUser
 
 
-@shared_task
+@celery_app.task
 def test_task():
     print("This is a test task running with celery!")
+
+
+# Bulk job example: python manage.py bulk_jobs --start users.tasks.normalize_emails
+@bulk_handler(queryset=lambda: CustomUser.objects.exclude(email=""))
+def normalize_emails(users):
+    """ Lowercase the domain of the user emails """
+    normalized = []
+    for user in users.only("pk", "email"):
+        email = CustomUser.objects.normalize_email(user.email)
+        if email != user.email:
+            user.email = email
+            normalized.append(user)
+    CustomUser.objects.bulk_update(normalized, ["email"])
+    return len(normalized)
@@ -0,0 +1,2 @@
+# The tests of the django app are run by django: cd app && python manage.py test
+collect_ignore = ["app"]
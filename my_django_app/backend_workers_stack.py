@@ -1,13 +1,19 @@
 from aws_cdk import (
+    Duration,
     Stack,
+    aws_applicationautoscaling as appscaling,
+    aws_cloudwatch as cloudwatch,
     aws_ec2 as ec2,
     aws_ecs as ecs,
     aws_sqs as sqs,
     aws_ecs_patterns as ecs_patterns,
 )
 from constructs import Construct
+from my_django_app.pgbouncer_sidecar import add_pgbouncer_sidecar
 
 
+WORKER_POOLS = ("prefork", "threads", "gevent", "solo")
+
 class BackendWorkersStack(Stack):
 
     def __init__(
@@ -19,22 +25,33 @@ class BackendWorkersStack(Stack):
             queue: sqs.Queue,
             env_vars: dict,
             secrets: dict,
+            celery_queue: str = "default",  # Name of the queue in celery settings
             task_cpu: int = 256,
             task_memory_mib: int = 1024,
             task_min_scaling_capacity: int = 0,
             task_max_scaling_capacity: int = 4,
             scaling_steps: list = None,
+            backlog_per_task_target: float = None,  # Messages per task to keep. None disables backlog scaling.
+            task_metrics_namespace: str = None,  # CloudWatch namespace of the tasks metrics, logged by the workers
+            queue_wait_target_seconds: float = None,  # Scale out to keep the average time tasks wait in the queue
+            worker_pool: str = "prefork",  # prefork, threads, gevent or solo
+            worker_concurrency: int = None,  # Derived from the pool and task_cpu when not set
+            worker_prefetch_multiplier: int = None,  # Derived from the concurrency and the SQS receive batch when not set
+            worker_max_tasks_per_child: int = None,  # Only for prefork. Unlimited when not set
+            pgbouncer_secrets: dict = None,  # Add a PgBouncer sidecar connecting to the db with these secrets
             **kwargs
     ) -> None:
         self.vpc = vpc
         self.ecs_cluster = ecs_cluster
         self.queue = queue
+        self.celery_queue = celery_queue
         self.env_vars = env_vars
         self.secrets = secrets
         self.task_cpu = task_cpu
         self.task_memory_mib = task_memory_mib
         self.task_min_scaling_capacity = task_min_scaling_capacity
         self.task_max_scaling_capacity = task_max_scaling_capacity
+        self.pgbouncer_secrets = pgbouncer_secrets
         if scaling_steps:
             self.scaling_steps = scaling_steps
         else:
@@ -44,8 +61,35 @@ class BackendWorkersStack(Stack):
                 {"lower": 100, "change": +1},  # 100 msgs = 2 workers
                 {"lower": 200, "change": +2},  # 200 msgs = 4 workers
             ]
+        self.backlog_per_task_target = backlog_per_task_target
+        self.task_metrics_namespace = task_metrics_namespace
+        self.queue_wait_target_seconds = queue_wait_target_seconds
+        if self.queue_wait_target_seconds and not self.task_metrics_namespace:
+            raise ValueError("queue_wait_target_seconds requires task_metrics_namespace")
+        if worker_pool not in WORKER_POOLS:
+            raise ValueError(f"Invalid worker_pool {worker_pool}. Choices: {', '.join(WORKER_POOLS)}")
+        self.worker_pool = worker_pool
+        self.worker_concurrency = worker_concurrency
+        self.worker_prefetch_multiplier = worker_prefetch_multiplier
+        self.worker_max_tasks_per_child = worker_max_tasks_per_child
         super().__init__(scope, construct_id, **kwargs)
 
+        # Worker settings, read by celery settings. Concurrency is derived from the task resources when not set.
+        self.worker_env_vars = {
+            **self.env_vars,
+            "TASK_CPU": str(self.task_cpu),
+            "TASK_MEMORY_MIB": str(self.task_memory_mib),
+            "CELERY_WORKER_POOL": self.worker_pool,
+        }
+        if self.worker_concurrency:
+            self.worker_env_vars["CELERY_WORKER_CONCURRENCY"] = str(self.worker_concurrency)
+        if self.worker_prefetch_multiplier:
+            self.worker_env_vars["CELERY_WORKER_PREFETCH_MULTIPLIER"] = str(self.worker_prefetch_multiplier)
+        if self.worker_max_tasks_per_child:
+            self.worker_env_vars["CELERY_WORKER_MAX_TASKS_PER_CHILD"] = str(self.worker_max_tasks_per_child)
+        if self.task_metrics_namespace:
+            self.worker_env_vars["TASK_METRICS_NAMESPACE"] = self.task_metrics_namespace
+
         # Instantiate the worker
         self.container_name = f"celery_worker"
         self.workers_fargate_service = ecs_patterns.QueueProcessingFargateService(
@@ -66,7 +110,97 @@ class BackendWorkersStack(Stack):
                 target="prod"
             ),
             container_name=self.container_name,
-            command=["start-celery-worker.sh", queue.queue_name],
-            environment=self.env_vars,
+            command=["start-celery-worker.sh", self.celery_queue],
+            environment=self.worker_env_vars,
             secrets=self.secrets
         )
+        # Target tracking on the backlog per task (messages visible / running tasks).
+        # The step scaling above, based on the absolute number of messages, is kept as a fallback.
+        # It also scales from zero tasks, when the backlog per task isn't defined.
+        if self.backlog_per_task_target:
+            self.backlog_scaling_policy = self.add_backlog_per_task_scaling()
+        if self.queue_wait_target_seconds:
+            self.queue_wait_scaling_policy = self.add_queue_wait_time_scaling()
+        # Share db connections between the celery worker processes of each task
+        if self.pgbouncer_secrets:
+            self.pgbouncer_container = add_pgbouncer_sidecar(
+                task_definition=self.workers_fargate_service.task_definition,
+                database_secrets=self.pgbouncer_secrets,
+            )
+
+    def add_queue_wait_time_scaling(self) -> appscaling.TargetTrackingScalingPolicy:
+        # Average time tasks waited in the queue, from the tasks metrics logged by the workers (common.task_metrics)
+        queue_wait_time = cloudwatch.Metric(
+            namespace=self.task_metrics_namespace,
+            metric_name="QueueWaitTime",
+            dimensions_map={"Queue": self.celery_queue},
+            statistic="Average",
+            period=Duration.minutes(1),
+        )
+        scalable_task_count = self.workers_fargate_service.service.node.find_child("TaskCount")
+        # Scale out only: There are no metrics when there are no tasks, so scaling in is left to the other policies
+        return scalable_task_count.scale_to_track_custom_metric(
+            "QueueWaitTimeScaling",
+            metric=queue_wait_time,
+            target_value=self.queue_wait_target_seconds * 1000,  # Milliseconds
+            disable_scale_in=True,
+        )
+
+    def add_backlog_per_task_scaling(self) -> appscaling.CfnScalingPolicy:
+        # The scalable target created by the QueueProcessingFargateService pattern
+        scalable_target = self.workers_fargate_service.service.node.find_child("TaskCount").node.find_child("Target")
+        policy = appscaling.CfnScalingPolicy(
+            self,
+            "BacklogPerTaskScaling",
+            policy_name=f"{self.stack_name}-BacklogPerTaskScaling",
+            policy_type="TargetTrackingScaling",
+            scaling_target_id=scalable_target.scalable_target_id,
+        )
+        # Metric math isn't supported by the target tracking constructs yet, so the config is set in CloudFormation
+        policy.add_property_override(
+            "TargetTrackingScalingPolicyConfiguration",
+            {
+                "TargetValue": self.backlog_per_task_target,
+                "CustomizedMetricSpecification": {
+                    "Metrics": [
+                        {
+                            "Id": "visible",
+                            "MetricStat": {
+                                "Metric": {
+                                    "Namespace": "AWS/SQS",
+                                    "MetricName": "ApproximateNumberOfMessagesVisible",
+                                    "Dimensions": [{"Name": "QueueName", "Value": self.queue.queue_name}],
+                                },
+                                "Stat": "Sum",
+                            },
+                            "ReturnData": False,
+                        },
+                        {
+                            # The sample count of the service CPU utilization is the number of running tasks
+                            "Id": "tasks",
+                            "MetricStat": {
+                                "Metric": {
+                                    "Namespace": "AWS/ECS",
+                                    "MetricName": "CPUUtilization",
+                                    "Dimensions": [
+                                        {"Name": "ClusterName", "Value": self.ecs_cluster.cluster_name},
+                                        {"Name": "ServiceName", "Value": self.workers_fargate_service.service.service_name},
+                                    ],
+                                },
+                                "Stat": "SampleCount",
+                            },
+                            "ReturnData": False,
+                        },
+                        {
+                            # With no tasks running there are no CPU datapoints: count 1 task, so the backlog
+                            # still has data and scales the service out from zero
+                            "Id": "backlog_per_task",
+                            "Expression": "visible / FILL(tasks, 1)",
+                            "Label": "Messages visible per running task",
+                            "ReturnData": True,
+                        },
+                    ]
+                },
+            }
+        )
+        return policy
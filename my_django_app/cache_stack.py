@@ -0,0 +1,70 @@
+from aws_cdk import (
+    Stack,
+    aws_ec2 as ec2,
+    aws_elasticache as elasticache,
+    aws_ssm as ssm,
+)
+from constructs import Construct
+
+
+class CacheStack(Stack):
+
+    def __init__(
+            self,
+            scope: Construct,
+            construct_id: str,
+            vpc: ec2.Vpc,
+            node_type: str = "cache.t3.micro",
+            num_nodes: int = 1,  # Set 2 or more to add replicas with automatic failover
+            **kwargs
+    ) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+        self.vpc = vpc
+        self.node_type = node_type
+        self.num_nodes = num_nodes
+
+        # Place the cache nodes in the same private subnets used by the ECS tasks
+        self.subnet_group = elasticache.CfnSubnetGroup(
+            self,
+            "CacheSubnetGroup",
+            description="Private subnets for the cache",
+            subnet_ids=[
+                s.subnet_id
+                for s in self.vpc.select_subnets(subnet_type=ec2.SubnetType.PRIVATE_ISOLATED).subnets
+            ]
+        )
+        # Allow ingress traffic from ECS tasks
+        self.security_group = ec2.SecurityGroup(
+            self,
+            "CacheSecurityGroup",
+            vpc=self.vpc,
+            description="Services in private subnets can access the cache",
+            allow_all_outbound=False
+        )
+        self.security_group.add_ingress_rule(
+            peer=ec2.Peer.ipv4(self.vpc.vpc_cidr_block),
+            connection=ec2.Port.tcp(6379),
+            description="Services in private subnets can access the cache"
+        )
+        # A Redis replication group, with a single primary node by default
+        self.redis = elasticache.CfnReplicationGroup(
+            self,
+            "RedisReplicationGroup",
+            replication_group_description="Django cache and sessions",
+            engine="redis",
+            cache_node_type=self.node_type,
+            num_cache_clusters=self.num_nodes,
+            automatic_failover_enabled=self.num_nodes > 1,
+            cache_subnet_group_name=self.subnet_group.ref,
+            security_group_ids=[self.security_group.security_group_id],
+        )
+        self.redis_url = (
+            f"redis://{self.redis.attr_primary_end_point_address}:{self.redis.attr_primary_end_point_port}/0"
+        )
+        # Save the cache url in SSM Parameter Store
+        self.redis_url_param = ssm.StringParameter(
+            self,
+            "CacheRedisUrlParam",
+            parameter_name=f"/{scope.stage_name}/CacheRedisUrlParam",
+            string_value=self.redis_url
+        )
@@ -8,6 +8,14 @@ from aws_cdk import (
 from constructs import Construct
 
 
+# - serverless: Aurora Serverless v1. Scales in steps doubling the capacity, pauses when idle, without readers.
+# - serverless_v2: A writer and readers scaling in steps of 0.5 ACUs.
+# - provisioned: A writer and readers of a fixed instance class.
+ENGINE_MODES = ["serverless", "serverless_v2", "provisioned"]
+# Serverless v2 requires Aurora PostgreSQL 13.6 or later
+CLUSTER_ENGINE_VERSION = rds.AuroraPostgresEngineVersion.of("13.6", "13")
+
+
 class DatabaseStack(Stack):
 
     def __init__(
@@ -20,18 +28,49 @@ class DatabaseStack(Stack):
             max_capacity: rds.AuroraCapacityUnit = rds.AuroraCapacityUnit.ACU_4,
             auto_pause_minutes: int = 30,
             backup_retention_days: int = 1,
+            engine_mode: str = "serverless",  # See ENGINE_MODES
+            readers: int = 1,  # Reader instances, with serverless_v2 and provisioned
+            serverless_v2_min_capacity: float = 0.5,  # ACUs, in steps of 0.5
+            serverless_v2_max_capacity: float = 4,
+            instance_type: str = "t4g.medium",  # Class of the instances, with provisioned
             **kwargs
     ) -> None:
         super().__init__(scope, construct_id, **kwargs)
+        if engine_mode not in ENGINE_MODES:
+            raise ValueError(f"Unsupported engine mode: {engine_mode}")
         self.vpc = vpc
         self.database_name = database_name
         self.min_capacity = min_capacity
         self.max_capacity = max_capacity
         self.auto_pause_minutes = auto_pause_minutes
         self.backup_retention_days = backup_retention_days
+        self.engine_mode = engine_mode
+        self.readers = readers
+        self.serverless_v2_min_capacity = serverless_v2_min_capacity
+        self.serverless_v2_max_capacity = serverless_v2_max_capacity
+        self.instance_type = instance_type
+
+        if self.engine_mode == "serverless":
+            self.db_cluster = self.aurora_serverless_db = self.create_serverless_cluster()
+            self.reader_endpoint = None
+        else:
+            self.db_cluster = self.create_cluster()
+            # Balances the connections between the readers
+            self.reader_endpoint = self.db_cluster.cluster_read_endpoint
+        # Allow ingress traffic from ECS tasks
+        self.db_cluster.connections.allow_default_port_from_any_ipv4(
+            description="Services in private subnets can access the DB"
+        )
+        # Save the name of the autogenerated secrets manager secret holding database credentials
+        self.ssm_db_secret_name_param = ssm.StringParameter(
+            self,
+            "DatabaseSecretNameParam",
+            parameter_name=f"/{scope.stage_name}/DatabaseSecretNameParam",
+            string_value=self.db_cluster.secret.secret_name
+        )
 
-        # Our network in the cloud
-        self.aurora_serverless_db = rds.ServerlessCluster(
+    def create_serverless_cluster(self):
+        return rds.ServerlessCluster(
             self,
             "AuroraServerlessCluster",
             engine=rds.DatabaseClusterEngine.AURORA_POSTGRESQL,
@@ -52,14 +91,29 @@ class DatabaseStack(Stack):
                 max_capacity=self.max_capacity
             ),
         )
-        # Allow ingress traffic from ECS tasks
-        self.aurora_serverless_db.connections.allow_default_port_from_any_ipv4(
-            description="Services in private subnets can access the DB"
-        )
-        # Save the name of the autogenerated secrets manager secret holding database credentials
-        self.ssm_db_secret_name_param = ssm.StringParameter(
+
+    def create_cluster(self):
+        """ A writer and readers, serverless v2 or provisioned """
+        serverless_v2 = self.engine_mode == "serverless_v2"
+        cluster = rds.DatabaseCluster(
             self,
-            "DatabaseSecretNameParam",
-            parameter_name=f"/{scope.stage_name}/DatabaseSecretNameParam",
-            string_value=self.aurora_serverless_db.secret.secret_name
+            "AuroraCluster",
+            engine=rds.DatabaseClusterEngine.aurora_postgres(version=CLUSTER_ENGINE_VERSION),
+            instances=1 + self.readers,  # The first one is the writer
+            instance_props=rds.InstanceProps(
+                vpc=self.vpc,
+                vpc_subnets=ec2.SubnetSelection(subnet_type=ec2.SubnetType.PRIVATE_ISOLATED),
+                # db.serverless instances scale within the capacity range of the cluster
+                instance_type=ec2.InstanceType("serverless" if serverless_v2 else self.instance_type),
+            ),
+            default_database_name=self.database_name,
+            backup=rds.BackupProps(retention=Duration.days(self.backup_retention_days)),
+            deletion_protection=True,
         )
+        if serverless_v2:
+            # Not supported by this version of the DatabaseCluster construct
+            cluster.node.default_child.add_property_override("ServerlessV2ScalingConfiguration", {
+                "MinCapacity": self.serverless_v2_min_capacity,
+                "MaxCapacity": self.serverless_v2_max_capacity,
+            })
+        return cluster
@@ -0,0 +1,129 @@
+import typing
+from aws_cdk import (
+    CustomResource,
+    Duration,
+    aws_ec2 as ec2,
+    aws_ecs as ecs,
+    aws_iam as iam,
+    aws_lambda as lambda_,
+    aws_logs as logs,
+    custom_resources as cr,
+)
+from constructs import Construct
+
+
+# Start the task on create and update (i.e. a new task definition on each deploy), and wait until it stops.
+# The deployment fails if the container exits with an error.
+HANDLER_CODE = """
+import boto3
+
+ecs = boto3.client("ecs")
+
+
+def on_event(event, context):
+    if event["RequestType"] == "Delete":
+        return {"PhysicalResourceId": event["PhysicalResourceId"]}
+    props = event["ResourceProperties"]
+    response = ecs.run_task(
+        cluster=props["Cluster"],
+        taskDefinition=props["TaskDefinitionArn"],
+        count=1,
+        launchType="FARGATE",
+        startedBy="deploy",
+        networkConfiguration={
+            "awsvpcConfiguration": {
+                "subnets": props["Subnets"],
+                "securityGroups": props["SecurityGroups"],
+                "assignPublicIp": "DISABLED",
+            }
+        },
+        overrides={"containerOverrides": [{"name": props["ContainerName"], "command": props["Command"]}]},
+    )
+    if response["failures"]:
+        raise RuntimeError(f"Deploy task not started: {response['failures']}")
+    return {"PhysicalResourceId": response["tasks"][0]["taskArn"]}
+
+
+def is_complete(event, context):
+    if event["RequestType"] == "Delete":
+        return {"IsComplete": True}
+    props = event["ResourceProperties"]
+    task = ecs.describe_tasks(cluster=props["Cluster"], tasks=[event["PhysicalResourceId"]])["tasks"][0]
+    if task["lastStatus"] != "STOPPED":
+        return {"IsComplete": False}
+    container = next(c for c in task["containers"] if c["name"] == props["ContainerName"])
+    if container.get("exitCode") != 0:
+        reason = container.get("reason") or task.get("stoppedReason")
+        raise RuntimeError(f"Deploy task {task['taskArn']} failed with exit code {container.get('exitCode')}: {reason}")
+    return {"IsComplete": True}
+"""
+
+
+class EcsDeployTask(Construct):
+    """
+    Run commands in a one-off Fargate task of the task definition, on each deploy, once the task definition is
+    updated and before the service is updated. Add a dependency on it to the service.
+    Commands are run in order, and stop at the first error.
+    """
+
+    def __init__(
+            self,
+            scope: Construct,
+            construct_id: str,
+            cluster: ecs.ICluster,
+            task_definition: ecs.TaskDefinition,
+            container_name: str,
+            commands: typing.Sequence[str],
+            subnet_ids: typing.Sequence[str],
+            security_groups: typing.Sequence[ec2.ISecurityGroup],
+            timeout: Duration = Duration.minutes(30),
+    ) -> None:
+        super().__init__(scope, construct_id)
+        self.commands = commands
+        on_event_handler = lambda_.Function(
+            self, "OnEvent",
+            runtime=lambda_.Runtime.PYTHON_3_9,
+            handler="index.on_event",
+            code=lambda_.Code.from_inline(HANDLER_CODE),
+            timeout=Duration.minutes(1),
+        )
+        is_complete_handler = lambda_.Function(
+            self, "IsComplete",
+            runtime=lambda_.Runtime.PYTHON_3_9,
+            handler="index.is_complete",
+            code=lambda_.Code.from_inline(HANDLER_CODE),
+            timeout=Duration.minutes(1),
+        )
+        on_event_handler.add_to_role_policy(iam.PolicyStatement(
+            actions=["ecs:RunTask"],
+            resources=[task_definition.task_definition_arn],
+        ))
+        is_complete_handler.add_to_role_policy(iam.PolicyStatement(
+            actions=["ecs:DescribeTasks"],
+            resources=["*"],
+        ))
+        # Pass the roles of the task definition to the task
+        task_definition.task_role.grant_pass_role(on_event_handler)
+        task_definition.obtain_execution_role().grant_pass_role(on_event_handler)
+        provider = cr.Provider(
+            self, "Provider",
+            on_event_handler=on_event_handler,
+            is_complete_handler=is_complete_handler,
+            query_interval=Duration.seconds(15),
+            total_timeout=timeout,
+            log_retention=logs.RetentionDays.ONE_WEEK,
+        )
+        self.resource = CustomResource(
+            self, "Resource",
+            service_token=provider.service_token,
+            properties={
+                "Cluster": cluster.cluster_name,
+                # A new task definition revision runs the task again
+                "TaskDefinitionArn": task_definition.task_definition_arn,
+                "ContainerName": container_name,
+                # Run by the container entrypoint, once the database is ready
+                "Command": ["sh", "-c", " && ".join(commands)],
+                "Subnets": subnet_ids,
+                "SecurityGroups": [security_group.security_group_id for security_group in security_groups],
+            },
+        )
@@ -10,11 +10,62 @@ from my_django_app.database_stack import DatabaseStack
 from my_django_app.my_django_app_stack import MyDjangoAppStack
 from my_django_app.static_files_stack import StaticFilesStack
 from my_django_app.queues_stack import QueuesStack
+from my_django_app.cache_stack import CacheStack
 from my_django_app.backend_workers_stack import BackendWorkersStack
 from my_django_app.external_secrets_stack import ExternalSecretsStack
 from my_django_app.dns_route_to_alb_stack import DnsRouteToAlbStack
 
 
+# Celery queues and the workers consuming them. Each queue gets its own SQS queue and workers service.
+# visibility_timeout_seconds is set in the queue, and must be longer than the longest task in it.
+# Worker settings are BackendWorkersStack arguments. Settings not set here are taken from the worker_* stage arguments.
+DEFAULT_WORKER_QUEUES = {
+    "default": {
+        "visibility_timeout_seconds": 3600,
+    },
+    # Latency-sensitive tasks: Always-on workers, scaling out early
+    "high_priority": {
+        "visibility_timeout_seconds": 600,  # Short tasks, redelivered soon if a worker is stopped
+        "task_min_scaling_capacity": 1,
+        # Mostly I/O (i.e. sending emails, calling APIs): many tasks per process
+        "worker_pool": "threads",
+        "scaling_steps": [
+            {"upper": 0, "change": 0},    # 0 msgs = min workers
+            {"lower": 1, "change": +1},   # 1 msg = +1 worker
+            {"lower": 20, "change": +2},  # 20 msgs = +2 workers
+        ],
+        "backlog_per_task_target": None,
+        # Scale out when tasks wait in the queue, measured by the workers (see common.task_metrics)
+        "queue_wait_target_seconds": 5,
+    },
+    # Long-running tasks: Bigger workers, scaled to zero when there is no work
+    "bulk": {
+        "visibility_timeout_seconds": 10800,
+        "task_cpu": 512,
+        "task_memory_mib": 1024,
+        # A process per vCPU, taking one message at a time, and replaced after some tasks to release memory
+        "worker_pool": "prefork",
+        "worker_prefetch_multiplier": 1,
+        "worker_max_tasks_per_child": 100,
+        "task_min_scaling_capacity": 0,
+        "scaling_steps": [
+            {"upper": 0, "change": -1},    # 0 msgs = 0 workers
+            {"lower": 1, "change": +1},    # 1 msg = 1 worker
+            {"lower": 500, "change": +1},  # 500 msgs = 2 workers
+        ],
+        "backlog_per_task_target": None,
+    },
+}
+
+# Commands run once per deploy, in a one-off app task, before the app service is updated. The deploy fails if any fails.
+DEFAULT_DEPLOY_COMMANDS = [
+    # Applied once, instead of by every app task starting. The app tasks check that they are applied
+    "python manage.py migrate --noinput",
+    # Upload only the static files changed since the last deploy (see common/management/commands)
+    "python manage.py collectstatic_incremental",
+]
+
+
 class MyDjangoAppPipelineStage(Stage):
 
     def __init__(
@@ -28,11 +79,37 @@ class MyDjangoAppPipelineStage(Stage):
             db_min_capacity: rds.AuroraCapacityUnit = rds.AuroraCapacityUnit.ACU_2,
             db_max_capacity: rds.AuroraCapacityUnit = rds.AuroraCapacityUnit.ACU_4,
             db_auto_pause_minutes: int = 0,
+            db_engine_mode: str = "serverless",  # serverless (v1), serverless_v2 or provisioned. See DatabaseStack
+            db_readers: int = 1,  # Reader instances (serverless_v2 and provisioned), used by the app for reads
+            db_serverless_v2_min_capacity: float = 0.5,
+            db_serverless_v2_max_capacity: float = 4,
+            db_instance_type: str = "t4g.medium",  # Provisioned instances class
+            db_conn_max_age: int = 60,
+            db_conn_health_checks: bool = True,
+            db_pool_max_size: int = 0,
+            db_connection_proxy: str = None,  # None (direct connections) or "pgbouncer" (sidecar in each task)
+            cache_node_type: str = "cache.t3.micro",
+            cache_num_nodes: int = 1,
+            cached_db_sessions: bool = True,
+            app_server_mode: str = "wsgi",
+            app_deploy_commands: list = None,  # See DEFAULT_DEPLOY_COMMANDS
+            request_profiling: bool = False,  # Server-Timing header and sampled logs of the time, queries and cache calls
+            request_profiling_sample_rate: float = 0.01,  # Fraction of the requests logged when profiling
             app_task_min_scaling_capacity: int = 2,
             app_task_max_scaling_capacity: int = 4,
+            app_requests_per_target: int = 600,
+            app_response_time_scaling_steps: list = None,
             worker_task_min_scaling_capacity: int = 1,
             worker_task_max_scaling_capacity: int = 4,
             worker_scaling_steps: list = None,
+            worker_acceptable_latency_seconds: int = None,  # Max time a message should wait in the queue
+            worker_messages_per_second_per_task: float = None,  # Throughput of a worker task
+            worker_queue_wait_target_seconds: float = None,  # Scale out workers to keep the average queue wait time
+            worker_pool: str = "prefork",  # prefork (CPU-bound tasks), threads or gevent (I/O-bound tasks), or solo
+            worker_concurrency: int = None,  # Derived from the pool and the task cpu when not set
+            worker_prefetch_multiplier: int = None,
+            worker_max_tasks_per_child: int = None,
+            worker_queues: dict = None,  # Queues and their workers settings. See DEFAULT_WORKER_QUEUES
             **kwargs
     ):
 
@@ -44,11 +121,44 @@ class MyDjangoAppPipelineStage(Stage):
         self.db_min_capacity = db_min_capacity
         self.db_max_capacity = db_max_capacity
         self.db_auto_pause_minutes = db_auto_pause_minutes
+        self.db_engine_mode = db_engine_mode
+        self.db_readers = db_readers
+        self.db_serverless_v2_min_capacity = db_serverless_v2_min_capacity
+        self.db_serverless_v2_max_capacity = db_serverless_v2_max_capacity
+        self.db_instance_type = db_instance_type
+        self.db_conn_max_age = db_conn_max_age
+        self.db_conn_health_checks = db_conn_health_checks
+        self.db_pool_max_size = db_pool_max_size
+        if db_connection_proxy not in (None, "pgbouncer"):
+            raise ValueError(f"Unsupported db connection proxy: {db_connection_proxy}")
+        self.db_connection_proxy = db_connection_proxy
+        self.cache_node_type = cache_node_type
+        self.cache_num_nodes = cache_num_nodes
+        self.cached_db_sessions = cached_db_sessions
+        self.app_server_mode = app_server_mode
+        self.app_deploy_commands = DEFAULT_DEPLOY_COMMANDS if app_deploy_commands is None else app_deploy_commands
+        self.request_profiling = request_profiling
+        self.request_profiling_sample_rate = request_profiling_sample_rate
         self.app_task_min_scaling_capacity = app_task_min_scaling_capacity
         self.app_task_max_scaling_capacity = app_task_max_scaling_capacity
+        self.app_requests_per_target = app_requests_per_target
+        self.app_response_time_scaling_steps = app_response_time_scaling_steps
         self.worker_task_min_scaling_capacity = worker_task_min_scaling_capacity
         self.worker_task_max_scaling_capacity = worker_task_max_scaling_capacity
         self.worker_scaling_steps = worker_scaling_steps
+        # Backlog per task that can be processed within the acceptable latency
+        if worker_acceptable_latency_seconds and worker_messages_per_second_per_task:
+            self.worker_backlog_per_task_target = worker_acceptable_latency_seconds * worker_messages_per_second_per_task
+        else:
+            self.worker_backlog_per_task_target = None
+        # Tasks metrics logged by the workers (queue wait time, run time, failures)
+        self.task_metrics_namespace = f"{construct_id}/Tasks"
+        self.worker_queue_wait_target_seconds = worker_queue_wait_target_seconds
+        self.worker_pool = worker_pool
+        self.worker_concurrency = worker_concurrency
+        self.worker_prefetch_multiplier = worker_prefetch_multiplier
+        self.worker_max_tasks_per_child = worker_max_tasks_per_child
+        self.worker_queues = worker_queues if worker_queues else DEFAULT_WORKER_QUEUES
         aws_env = kwargs.get("env")
         self.network = NetworkStack(
             self,
@@ -63,7 +173,12 @@ class MyDjangoAppPipelineStage(Stage):
             database_name="app_db",
             min_capacity=self.db_min_capacity,
             max_capacity=self.db_max_capacity,
-            auto_pause_minutes=self.db_auto_pause_minutes
+            auto_pause_minutes=self.db_auto_pause_minutes,
+            engine_mode=self.db_engine_mode,
+            readers=self.db_readers,
+            serverless_v2_min_capacity=self.db_serverless_v2_min_capacity,
+            serverless_v2_max_capacity=self.db_serverless_v2_max_capacity,
+            instance_type=self.db_instance_type,
         )
         # Serve static files for the Backoffice (django-admin)
         self.static_files = StaticFilesStack(
@@ -78,6 +193,21 @@ class MyDjangoAppPipelineStage(Stage):
             self,
             "Queues",
             env=aws_env,  # AWS Account and Region
+            queue_names=list(self.worker_queues.keys()),
+            visibility_timeouts={
+                queue_name: queue_settings["visibility_timeout_seconds"]
+                for queue_name, queue_settings in self.worker_queues.items()
+                if "visibility_timeout_seconds" in queue_settings
+            },
+        )
+        # Shared cache for all the app and worker tasks
+        self.cache = CacheStack(
+            self,
+            "Cache",
+            env=aws_env,  # AWS Account and Region
+            vpc=self.network.vpc,
+            node_type=self.cache_node_type,
+            num_nodes=self.cache_num_nodes
         )
         self.app_env_vars = {
             "DJANGO_SETTINGS_MODULE": self.django_settings_module,
@@ -85,16 +215,43 @@ class MyDjangoAppPipelineStage(Stage):
             "AWS_ACCOUNT_ID": os.getenv('CDK_DEFAULT_ACCOUNT'),
             "AWS_STATIC_FILES_BUCKET_NAME":  self.static_files.s3_bucket.bucket_name,
             "AWS_STATIC_FILES_CLOUDFRONT_URL": self.static_files.cloudfront_distro.distribution_domain_name,
-            "SQS_DEFAULT_QUEUE_URL": self.queues.default_queue.queue_url,
-            "CELERY_TASK_ALWAYS_EAGER": "False"
+            # The url of each celery queue, by queue name
+            "SQS_QUEUE_URLS": self.queues.queue_urls,
+            # The visibility timeout of each celery queue, by queue name (i.e. to detect lost bulk chunks)
+            "SQS_VISIBILITY_TIMEOUTS": self.queues.visibility_timeouts_json,
+            "CELERY_TASK_ALWAYS_EAGER": "False",
+            # Database connections reuse
+            "DB_CONN_MAX_AGE": str(self.db_conn_max_age),
+            "DB_CONN_HEALTH_CHECKS": str(self.db_conn_health_checks),
+            "DB_POOL_MAX_SIZE": str(self.db_pool_max_size),
+            # Cache and sessions
+            "CACHE_REDIS_URL": self.cache.redis_url,
+            "DJANGO_SESSION_ENGINE": (
+                "django.contrib.sessions.backends.cached_db" if self.cached_db_sessions
+                else "django.contrib.sessions.backends.db"
+            ),
+            # Requests profiling
+            "REQUEST_PROFILING": str(self.request_profiling),
+            "REQUEST_PROFILING_SAMPLE_RATE": str(self.request_profiling_sample_rate),
         }
         self.secrets = ExternalSecretsStack(
             self,
             "ExternalParameters",
             env=aws_env,  # AWS Account and Region
             name_prefix=f"/{self.stage_name}/",
-            database_secrets=self.database.aurora_serverless_db.secret,
+            database_secrets=self.database.db_cluster.secret,
+            database_proxy_host="127.0.0.1" if self.db_connection_proxy == "pgbouncer" else None,
         )
+        self.app_env_vars.update(self.secrets.app_env_vars)
+        # Reads of GET requests go to the readers (see common.db.routers)
+        if self.database.reader_endpoint and self.db_readers:
+            self.app_env_vars["DB_REPLICA_HOST"] = self.database.reader_endpoint.hostname
+        if self.db_connection_proxy == "pgbouncer":
+            # Server-side cursors don't work with transaction pooling
+            self.app_env_vars["DB_DISABLE_SERVER_SIDE_CURSORS"] = "True"
+            pgbouncer_secrets = self.secrets.database_secrets
+        else:
+            pgbouncer_secrets = None
         self.django_app = MyDjangoAppStack(
             self,
             "AppService",
@@ -109,26 +266,62 @@ class MyDjangoAppPipelineStage(Stage):
             task_desired_count=self.app_task_min_scaling_capacity,
             task_min_scaling_capacity=self.app_task_min_scaling_capacity,
             task_max_scaling_capacity=self.app_task_max_scaling_capacity,
+            requests_per_target=self.app_requests_per_target,
+            response_time_scaling_steps=self.app_response_time_scaling_steps,
+            server_mode=self.app_server_mode,
+            pgbouncer_secrets=pgbouncer_secrets,
+            deploy_commands=self.app_deploy_commands,
         )
-        # Grant permissions to the app to put messages in hte queue
-        self.queues.default_queue.grant_send_messages(
-            self.django_app.alb_fargate_service.service.task_definition.task_role
-        )
-        self.workers = BackendWorkersStack(
-            self,
-            "Workers",
-            env=aws_env,  # AWS Account and Region
-            vpc=self.network.vpc,
-            ecs_cluster=self.network.ecs_cluster,
-            queue=self.queues.default_queue,
-            env_vars=self.app_env_vars,
-            secrets=self.secrets.app_secrets,
-            task_cpu=256,
-            task_memory_mib=512,
-            task_min_scaling_capacity=self.worker_task_min_scaling_capacity,
-            task_max_scaling_capacity=self.worker_task_max_scaling_capacity,
-            scaling_steps=self.worker_scaling_steps
-        )
+        # Grant permissions to the app to put messages in the queues
+        for queue in self.queues.queues.values():
+            queue.grant_send_messages(
+                self.django_app.alb_fargate_service.service.task_definition.task_role
+            )
+        # A workers service for each queue
+        self.workers_by_queue = {}
+        for queue_name, queue_settings in self.worker_queues.items():
+            worker_settings = {k: v for k, v in queue_settings.items() if k != "visibility_timeout_seconds"}
+            worker_kwargs = {
+                "task_cpu": 256,
+                "task_memory_mib": 512,
+                "task_min_scaling_capacity": self.worker_task_min_scaling_capacity,
+                "task_max_scaling_capacity": self.worker_task_max_scaling_capacity,
+                "scaling_steps": self.worker_scaling_steps,
+                "backlog_per_task_target": self.worker_backlog_per_task_target,
+                "task_metrics_namespace": self.task_metrics_namespace,
+                "queue_wait_target_seconds": self.worker_queue_wait_target_seconds,
+                "worker_pool": self.worker_pool,
+                "worker_concurrency": self.worker_concurrency,
+                "worker_prefetch_multiplier": self.worker_prefetch_multiplier,
+                "worker_max_tasks_per_child": self.worker_max_tasks_per_child,
+                **worker_settings
+            }
+            queue_camel_name = "".join(word.capitalize() for word in queue_name.split("_"))
+            workers = BackendWorkersStack(
+                self,
+                "Workers" if queue_name == "default" else f"Workers{queue_camel_name}",
+                env=aws_env,  # AWS Account and Region
+                vpc=self.network.vpc,
+                ecs_cluster=self.network.ecs_cluster,
+                queue=self.queues.queues[queue_name],
+                celery_queue=queue_name,
+                env_vars=self.app_env_vars,
+                secrets=self.secrets.app_secrets,
+                pgbouncer_secrets=pgbouncer_secrets,
+                **worker_kwargs
+            )
+            # Tasks can trigger other tasks in any queue
+            for queue in self.queues.queues.values():
+                queue.grant_send_messages(
+                    workers.workers_fargate_service.service.task_definition.task_role
+                )
+            # Workers run the new code once the deploy commands (i.e. migrations) succeed, like the app service
+            if self.django_app.deploy_task:
+                workers.workers_fargate_service.service.node.default_child.node.add_dependency(
+                    self.django_app.deploy_task
+                )
+            self.workers_by_queue[queue_name] = workers
+        self.workers = self.workers_by_queue["default"]
         # Route requests made in the domain to the ALB
         self.dns = DnsRouteToAlbStack(
             self,
@@ -14,20 +14,13 @@ class ExternalSecretsStack(Stack):
             construct_id: str,
             database_secrets: secretsmanager.ISecret,
             name_prefix: str,  # Naming convention for parameters: i.e; /AppNameStageName/SecretName
+            database_proxy_host: str = None,  # Connect to the database through a proxy (i.e. PgBouncer sidecar)
             **kwargs
     ) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
-        # Secret values required by the app which are store in the Secrets Manager
-        # This values will be injected as env vars on runtime
-        self.app_secrets = {
-            "DJANGO_SECRET_KEY": ecs.Secret.from_secrets_manager(
-                secretsmanager.Secret.from_secret_name_v2(
-                    self,
-                    f"DjangoKeySecret",
-                    secret_name=f"{name_prefix}DjangoSecretKey"
-                )
-            ),
+        # Database credentials, taken from the secret generated for the database cluster
+        self.database_secrets = {
             "DB_HOST": ecs.Secret.from_secrets_manager(
                 database_secrets,
                 field="host"
@@ -48,6 +41,18 @@ class ExternalSecretsStack(Stack):
                 database_secrets,
                 field="password"
             ),
+        }
+        # Secret values required by the app which are store in the Secrets Manager
+        # This values will be injected as env vars on runtime
+        self.app_secrets = {
+            "DJANGO_SECRET_KEY": ecs.Secret.from_secrets_manager(
+                secretsmanager.Secret.from_secret_name_v2(
+                    self,
+                    f"DjangoKeySecret",
+                    secret_name=f"{name_prefix}DjangoSecretKey"
+                )
+            ),
+            **self.database_secrets,
             "AWS_ACCESS_KEY_ID": ecs.Secret.from_secrets_manager(
                 secretsmanager.Secret.from_secret_name_v2(
                     self,
@@ -63,3 +68,9 @@ class ExternalSecretsStack(Stack):
                 )
             ),
         }
+        # Regular env vars overriding secrets
+        self.app_env_vars = {}
+        if database_proxy_host:
+            # The app connects to the database through a proxy, which uses the actual host
+            self.app_secrets.pop("DB_HOST")
+            self.app_env_vars["DB_HOST"] = database_proxy_host
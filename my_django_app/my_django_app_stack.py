@@ -1,5 +1,7 @@
 from aws_cdk import (
+    Duration,
     Stack,
+    aws_applicationautoscaling as appscaling,
     aws_ec2 as ec2,
     aws_sqs as sqs,
     aws_ecs as ecs,
@@ -9,6 +11,8 @@ from aws_cdk import (
     aws_ssm as ssm
 )
 from constructs import Construct
+from my_django_app.deploy_task import EcsDeployTask
+from my_django_app.pgbouncer_sidecar import add_pgbouncer_sidecar
 
 
 class MyDjangoAppStack(Stack):
@@ -27,6 +31,12 @@ class MyDjangoAppStack(Stack):
             task_desired_count: int = 2,
             task_min_scaling_capacity: int = 2,
             task_max_scaling_capacity: int = 4,
+            requests_per_target: int = 600,  # Requests per minute per task. None disables request count scaling.
+            response_time_scaling_steps: list = None,  # Response time (p95, in seconds) steps. None disables it.
+            server_mode: str = "wsgi",  # "wsgi" (sync workers) or "asgi" (uvicorn workers)
+            health_check_path: str = "/status/",  # Liveness path, see common/middleware.py
+            pgbouncer_secrets: dict = None,  # Add a PgBouncer sidecar connecting to the db with these secrets
+            deploy_commands: list = None,  # Commands run once per deploy, in a one-off task, before updating the service
             **kwargs
     ) -> None:
 
@@ -41,6 +51,12 @@ class MyDjangoAppStack(Stack):
         self.task_desired_count = task_desired_count
         self.task_min_scaling_capacity = task_min_scaling_capacity
         self.task_max_scaling_capacity = task_max_scaling_capacity
+        self.requests_per_target = requests_per_target
+        self.response_time_scaling_steps = response_time_scaling_steps
+        self.server_mode = server_mode
+        self.health_check_path = health_check_path
+        self.pgbouncer_secrets = pgbouncer_secrets
+        self.deploy_commands = deploy_commands
 
         # Prepare parameters
         self.container_name = f"django_app"
@@ -74,14 +90,45 @@ class MyDjangoAppStack(Stack):
                 ),
                 container_name=self.container_name,
                 container_port=8000,
-                environment=self.env_vars,
+                environment={
+                    **self.env_vars,
+                    "SERVER_MODE": self.server_mode,
+                    # Gunicorn workers and threads are derived from the task resources
+                    "TASK_CPU": str(self.task_cpu),
+                    "TASK_MEMORY_MIB": str(self.task_memory_mib),
+                },
                 secrets=self.secrets
             ),
             public_load_balancer=True
         )
+        # Share db connections between the gunicorn workers of each task
+        if self.pgbouncer_secrets:
+            self.pgbouncer_container = add_pgbouncer_sidecar(
+                task_definition=self.alb_fargate_service.task_definition,
+                database_secrets=self.pgbouncer_secrets,
+            )
+        # Run the deploy commands (i.e. collectstatic) once, instead of in every task starting,
+        # and update the service only if they succeed
+        self.deploy_task = None
+        if self.deploy_commands:
+            self.deploy_task = EcsDeployTask(
+                self,
+                "DeployTask",
+                cluster=self.ecs_cluster,
+                task_definition=self.alb_fargate_service.task_definition,
+                container_name=self.container_name,
+                commands=self.deploy_commands,
+                subnet_ids=self.vpc.select_subnets(subnet_type=ec2.SubnetType.PRIVATE_ISOLATED).subnet_ids,
+                security_groups=self.alb_fargate_service.service.connections.security_groups,
+            )
+            # Only the service resource: The deploy task uses the service security group
+            self.alb_fargate_service.service.node.default_child.node.add_dependency(self.deploy_task)
         # Set the health checks settings
+        # The liveness path is answered without checking the database or other services. ECS replaces the tasks
+        # failing this check, so a database outage must not make every task unhealthy and restart them in a loop.
+        # The readiness path (/status/ready/) checks the services, for monitoring and deployments.
         self.alb_fargate_service.target_group.configure_health_check(
-            path="/status/",
+            path=self.health_check_path,
             healthy_threshold_count=3,
             unhealthy_threshold_count=2
         )
@@ -94,6 +141,24 @@ class MyDjangoAppStack(Stack):
             f"CpuScaling",
             target_utilization_percent=75,
         )
+        # Autoscaling based on requests per task, as I/O-bound requests don't use much CPU.
+        if self.requests_per_target:
+            scalable_target.scale_on_request_count(
+                f"RequestCountScaling",
+                requests_per_target=self.requests_per_target,
+                target_group=self.alb_fargate_service.target_group,
+            )
+        # Autoscaling based on the response time, adding tasks when requests take longer than expected
+        if self.response_time_scaling_steps:
+            scalable_target.scale_on_metric(
+                f"ResponseTimeScaling",
+                metric=self.alb_fargate_service.target_group.metric_target_response_time(
+                    statistic="p95",
+                    period=Duration.minutes(1),
+                ),
+                scaling_steps=[appscaling.ScalingInterval(**step) for step in self.response_time_scaling_steps],
+                adjustment_type=appscaling.AdjustmentType.CHANGE_IN_CAPACITY,
+            )
         # Save useful values in in SSM
         self.ecs_cluster_name_param = ssm.StringParameter(
             self,
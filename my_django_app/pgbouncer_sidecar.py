@@ -0,0 +1,42 @@
+from aws_cdk import (
+    aws_ecs as ecs,
+)
+
+
+def add_pgbouncer_sidecar(
+        task_definition: ecs.TaskDefinition,
+        database_secrets: dict,
+        pool_mode: str = "transaction",
+        default_pool_size: int = 5,
+        max_client_conn: int = 100,
+        listen_port: int = 5432,
+) -> ecs.ContainerDefinition:
+    """
+    Add a PgBouncer container to the task, sharing a few db connections between all the app processes/threads.
+    Containers in a Fargate task share the network, so the app connects to PgBouncer at localhost.
+    """
+    app_container = task_definition.default_container
+    pgbouncer_container = task_definition.add_container(
+        "PgBouncer",
+        container_name="pgbouncer",
+        image=ecs.ContainerImage.from_asset(directory="app/docker/pgbouncer/"),
+        essential=True,
+        memory_reservation_mib=32,
+        environment={
+            "POOL_MODE": pool_mode,
+            "DEFAULT_POOL_SIZE": str(default_pool_size),
+            "MAX_CLIENT_CONN": str(max_client_conn),
+            "LISTEN_PORT": str(listen_port),
+            "AUTH_TYPE": "md5",
+        },
+        secrets=database_secrets,  # DB_HOST, DB_PORT, DB_NAME, DB_USER and DB_PASSWORD of the actual database
+        logging=ecs.LogDrivers.aws_logs(stream_prefix="pgbouncer"),
+    )
+    # Start the app after the proxy
+    app_container.add_container_dependencies(
+        ecs.ContainerDependency(
+            container=pgbouncer_container,
+            condition=ecs.ContainerDependencyCondition.START
+        )
+    )
+    return pgbouncer_container
@@ -68,6 +68,9 @@ class MyDjangoAppPipelineStack(Stack):
             db_auto_pause_minutes=5,
             app_task_min_scaling_capacity=1,
             app_task_max_scaling_capacity=2,
+            # Profile all the requests in staging
+            request_profiling=True,
+            request_profiling_sample_rate=1.0,
             worker_task_min_scaling_capacity=1,
             worker_task_max_scaling_capacity=2,
             worker_scaling_steps=[
@@ -86,6 +89,15 @@ class MyDjangoAppPipelineStack(Stack):
             db_auto_pause_minutes=0,  # Keep the database always up in production
             app_task_min_scaling_capacity=2,
             app_task_max_scaling_capacity=5,
+            app_requests_per_target=1200,  # 20 requests per second per task
+            # Log 1% of the requests, and all the slow ones or with too many queries (i.e. N+1 queries)
+            request_profiling=True,
+            request_profiling_sample_rate=0.01,
+            app_response_time_scaling_steps=[
+                {"upper": 1, "change": 0},    # p95 < 1s = no changes (Scale-in is driven by the other policies)
+                {"lower": 1, "change": +1},   # p95 > 1s = add 1 task
+                {"lower": 3, "change": +2},   # p95 > 3s = add 2 tasks
+            ],
             worker_task_min_scaling_capacity=2,
             worker_task_max_scaling_capacity=4,
             worker_scaling_steps=[
@@ -93,7 +105,10 @@ class MyDjangoAppPipelineStack(Stack):
                 {"lower": 100, "change": +1},  # > 100 msg = 2 worker
                 {"lower": 200, "change": +1},  # > 200 msgs = 3 workers
                 {"lower": 500, "change": +2},  # > 500 msgs = 5 workers
-            ]
+            ],
+            # Scale to keep the backlog per task under 60s x 2 msgs/s = 120 msgs
+            worker_acceptable_latency_seconds=60,
+            worker_messages_per_second_per_task=2,
         )
         pipeline.add_stage(
             self.production_env,
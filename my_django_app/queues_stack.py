@@ -1,4 +1,7 @@
+import json
+import typing
 from aws_cdk import (
+    Duration,
     Stack,
     aws_sqs as sqs,
     aws_ssm as ssm,
@@ -12,18 +15,52 @@ class QueuesStack(Stack):
             self,
             scope: Construct,
             construct_id: str,
+            queue_names: typing.Sequence[str] = ("default", ),
+            visibility_timeouts: dict = None,  # Seconds by queue name. Must be longer than the longest task
+            default_visibility_timeout: int = 3600,
             **kwargs
     ) -> None:
         super().__init__(scope, construct_id, **kwargs)
-        # Create a SQS queue
-        self.default_queue = sqs.Queue(
+        self.queue_names = queue_names
+        self.visibility_timeouts = visibility_timeouts if visibility_timeouts else {}
+        self.default_visibility_timeout = default_visibility_timeout
+        # Create a SQS queue for each queue name, used as the celery queue name
+        self.queues = {}
+        for queue_name in self.queue_names:
+            if queue_name == "default":
+                # Keep the original ids so the existing default queue isn't replaced
+                queue_id, queue_url_param_id = "SQSQueue", "SqsDefaultQueueUrlParam"
+            else:
+                queue_camel_name = "".join(word.capitalize() for word in queue_name.split("_"))
+                queue_id, queue_url_param_id = f"{queue_camel_name}SQSQueue", f"Sqs{queue_camel_name}QueueUrlParam"
+            queue = sqs.Queue(
+                self,
+                queue_id,
+                # Messages being processed are hidden from other workers until this timeout expires
+                visibility_timeout=Duration.seconds(
+                    self.visibility_timeouts.get(queue_name, self.default_visibility_timeout)
+                ),
+                # Long polling for receive calls not setting a wait time
+                receive_message_wait_time=Duration.seconds(20),
+            )
+            # Save the queue url in SSM Parameter Store
+            ssm.StringParameter(
+                self,
+                queue_url_param_id,
+                parameter_name=f"/{scope.stage_name}/{queue_url_param_id}",
+                string_value=queue.queue_url
+            )
+            self.queues[queue_name] = queue
+        self.default_queue = self.queues["default"]
+        # The url of each queue by name, as expected by the SQS_QUEUE_URLS env var
+        self.queue_urls = json.dumps({name: queue.queue_url for name, queue in self.queues.items()})
+        # The visibility timeout of each queue by name, as expected by the SQS_VISIBILITY_TIMEOUTS env var
+        self.visibility_timeouts_json = json.dumps({
+            name: self.visibility_timeouts.get(name, self.default_visibility_timeout) for name in self.queues
+        })
+        self.queue_urls_param = ssm.StringParameter(
             self,
-            "SQSQueue"
-        )
-        # Save the queue url in SSM Parameter Store
-        self.default_queue_url_param = ssm.StringParameter(
-            self,
-            "SqsDefaultQueueUrlParam",
-            parameter_name=f"/{scope.stage_name}/SqsDefaultQueueUrlParam",
-            string_value=self.default_queue.queue_url
+            "SqsQueueUrlsParam",
+            parameter_name=f"/{scope.stage_name}/SqsQueueUrlsParam",
+            string_value=self.queue_urls
         )
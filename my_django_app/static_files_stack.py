@@ -1,5 +1,7 @@
+import json
 import typing
 from aws_cdk import (
+    Duration,
     Stack,
     RemovalPolicy,
     aws_s3 as s3,
@@ -10,6 +12,58 @@ from aws_cdk import (
 from constructs import Construct
 
 
+# Static files uploaded with gzip and brotli variants (name.gz and name.br) by the app static storage.
+# Must match STATICFILES_COMPRESSED_EXTENSIONS in the app settings.
+COMPRESSED_EXTENSIONS = (".css", ".js", ".map", ".json", ".svg", ".txt", ".html", ".xml", ".ttf", ".otf", ".eot")
+# Serve the compressed variant accepted by the browser. Viewer request functions get the Accept-Encoding header
+# sent by the browser, not the normalized one of the cache key: i.e. "gzip, deflate, br" or "br;q=0, gzip".
+SERVE_COMPRESSED_FUNCTION_CODE = """
+function acceptedEncodings(header) {
+    // q value by coding. A coding with q=0 is refused
+    var encodings = {};
+    var entries = header.split(',');
+    for (var i = 0; i < entries.length; i++) {
+        var params = entries[i].split(';');
+        var coding = params[0].trim().toLowerCase();
+        var q = 1;
+        for (var j = 1; j < params.length; j++) {
+            var param = params[j].trim().toLowerCase();
+            if (param.indexOf('q=') === 0) {
+                q = parseFloat(param.substring(2)) || 0;
+            }
+        }
+        if (coding) {
+            encodings[coding] = q;
+        }
+    }
+    return encodings;
+}
+
+function accepts(encodings, coding) {
+    if (coding in encodings) {
+        return encodings[coding] > 0;
+    }
+    return encodings['*'] > 0;
+}
+
+function handler(event) {
+    var request = event.request;
+    var acceptEncoding = request.headers['accept-encoding'];
+    var extension = request.uri.substring(request.uri.lastIndexOf('.')).toLowerCase();
+    if (!acceptEncoding || EXTENSIONS.indexOf(extension) === -1) {
+        return request;
+    }
+    var encodings = acceptedEncodings(acceptEncoding.value);
+    if (accepts(encodings, 'br')) {
+        request.uri += '.br';
+    } else if (accepts(encodings, 'gzip')) {
+        request.uri += '.gz';
+    }
+    return request;
+}
+"""
+
+
 class StaticFilesStack(Stack):
 
     def __init__(
@@ -62,16 +116,55 @@ class StaticFilesStack(Stack):
             )
         else:
             response_headers_policy = cloudfront.ResponseHeadersPolicy.CORS_ALLOW_ALL_ORIGINS
+        # Static files are cached by the browsers and the edge for as long as the origin says (a year for hashed
+        # files), in a cache entry per encoding accepted by the browser
+        self.static_cache_policy = cloudfront.CachePolicy(
+            self, "StaticFilesCachePolicy",
+            cache_policy_name=f"{scope.stage_name}StaticFilesCachePolicy",
+            comment="Static files, by accepted encoding",
+            min_ttl=Duration.seconds(0),
+            default_ttl=Duration.days(1),
+            max_ttl=Duration.days(365),
+            enable_accept_encoding_gzip=True,
+            enable_accept_encoding_brotli=True,
+            header_behavior=cloudfront.CacheHeaderBehavior.none(),
+            query_string_behavior=cloudfront.CacheQueryStringBehavior.none(),
+            cookie_behavior=cloudfront.CacheCookieBehavior.none(),
+        )
+        self.serve_compressed_function = cloudfront.Function(
+            self, "ServeCompressedFunction",
+            comment="Serve the pre-compressed static files",
+            code=cloudfront.FunctionCode.from_inline(
+                f"var EXTENSIONS = {json.dumps(COMPRESSED_EXTENSIONS)};{SERVE_COMPRESSED_FUNCTION_CODE}"
+            ),
+        )
+        s3_origin = origins.S3Origin(
+            self.s3_bucket,
+            origin_access_identity=self.oai
+        )
         # Create the cloudfront distribution
         self.cloudfront_distro = cloudfront.Distribution(
             self, "CFDistribution",
             default_behavior=cloudfront.BehaviorOptions(
-                origin=origins.S3Origin(
-                    self.s3_bucket,
-                    origin_access_identity=self.oai
-                ),
+                origin=s3_origin,
                 response_headers_policy=response_headers_policy
-            )
+            ),
+            additional_behaviors={
+                # Uploaded by the static files storage
+                "static/*": cloudfront.BehaviorOptions(
+                    origin=s3_origin,
+                    response_headers_policy=response_headers_policy,
+                    cache_policy=self.static_cache_policy,
+                    # Files without compressed variants are compressed by CloudFront
+                    compress=True,
+                    function_associations=[
+                        cloudfront.FunctionAssociation(
+                            function=self.serve_compressed_function,
+                            event_type=cloudfront.FunctionEventType.VIEWER_REQUEST,
+                        ),
+                    ],
+                ),
+            },
         )
         # Save useful parameters to SSM Parameter Store
         self.static_files_bucket_name = ssm.StringParameter(
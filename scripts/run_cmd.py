@@ -1,7 +1,12 @@
 import os
+import sys
 import json
+import time
 import boto3
 import argparse
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
 
 
 AWS_ACCOUNT_ID = os.getenv("AWS_ACCOUNT_ID")
@@ -9,26 +14,36 @@ AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")
 AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
 AWS_REGION_NAME = os.getenv("AWS_REGION_NAME")
 
-ecs_client = boto3.client(
-    'ecs',
-    aws_access_key_id=AWS_ACCESS_KEY_ID,
-    aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-    region_name=AWS_REGION_NAME,
-)
+# Non-secret config is cached on disk for a short time, per env, so consecutive commands skip the SSM calls.
+# Task definitions change on each deploy: use --no-cache right after deploying.
+CONFIG_CACHE_DIR = os.getenv("RUN_CMD_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "run_cmd"))
+CONFIG_CACHE_TTL_SECONDS = int(os.getenv("RUN_CMD_CACHE_TTL_SECONDS") or 120)
+# Names per GetParameters call
+MAX_PARAMETERS_PER_CALL = 10
 
-ssm_client = boto3.client(
-    'ssm',
-    aws_access_key_id=AWS_ACCESS_KEY_ID,
-    aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-    region_name=AWS_REGION_NAME,
-)
+# Time spent in each step, reported with --timings
+timings = {}
 
-secrets_client = boto3.client(
-    'secretsmanager',
-    aws_access_key_id=AWS_ACCESS_KEY_ID,
-    aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-    region_name=AWS_REGION_NAME,
-)
+
+@contextmanager
+def timed(step):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[step] = timings.get(step, 0) + time.perf_counter() - start
+
+
+@lru_cache(maxsize=None)
+def get_client(service_name):
+    # Shared by the threads once created. Creating clients isn't thread-safe (boto3 default session):
+    # get the clients in the main thread before using them in threads.
+    return boto3.client(
+        service_name,
+        aws_access_key_id=AWS_ACCESS_KEY_ID,
+        aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
+        region_name=AWS_REGION_NAME,
+    )
 
 
 aws_ssm_parameters_map = {
@@ -47,25 +62,73 @@ aws_ssm_parameters = [
         "TaskDefArnParam",
         "TaskDefFamilyParam",
         "TaskExecRoleArnParam",
-        "TaskRoleArnParam"
+        "TaskRoleArnParam",
+        "VpcPrivateSubnetsParam",
+        "StaticFilesBucketNameParam",
+        "StaticFilesCloudFrontUrlParam",
+        "SqsQueueUrlsParam",
+        "DatabaseSecretNameParam",
 ]
 
 
-def _build_execution_cofig(env_name, extra_env_vars=None):
-    # Get the parameters stored in SSM
-    config = {}
+def _get_parameters(env_name, names):
+    """ Get SSM parameters with GetParameters, in concurrent calls of up to 10 names """
+    ssm_client = get_client("ssm")
+    chunks = [names[i:i + MAX_PARAMETERS_PER_CALL] for i in range(0, len(names), MAX_PARAMETERS_PER_CALL)]
+
+    def get_chunk(chunk):
+        return ssm_client.get_parameters(Names=[f"/{env_name}/{name}" for name in chunk])
+
+    parameters = {}
+    with ThreadPoolExecutor(max_workers=len(chunks)) as executor:
+        for response in executor.map(get_chunk, chunks):
+            if response.get("InvalidParameters"):
+                raise ValueError(f"Parameters not found in SSM: {', '.join(response['InvalidParameters'])}")
+            for parameter in response["Parameters"]:
+                parameters[parameter["Name"].rsplit("/", 1)[-1]] = parameter["Value"]
+    return parameters
+
+
+def _get_secrets(secret_ids):
+    """ Get the secret strings from Secrets Manager, concurrently """
+    secrets_client = get_client("secretsmanager")
+    with ThreadPoolExecutor(max_workers=len(secret_ids)) as executor:
+        responses = executor.map(lambda secret_id: secrets_client.get_secret_value(SecretId=secret_id), secret_ids)
+        return {secret_id: response["SecretString"] for secret_id, response in zip(secret_ids, responses)}
+
+
+def _get_cached_parameters(env_name, use_cache=True):
+    """ The SSM parameters of the env, from the disk cache if fresh """
+    cache_path = os.path.join(CONFIG_CACHE_DIR, f"{env_name}.json")
+    if use_cache and os.path.exists(cache_path):
+        if time.time() - os.path.getmtime(cache_path) < CONFIG_CACHE_TTL_SECONDS:
+            with open(cache_path) as cache_file:
+                return json.load(cache_file)
+    parameters = _get_parameters(env_name, aws_ssm_parameters)
+    os.makedirs(CONFIG_CACHE_DIR, exist_ok=True)
+    # Written only by the user: The parameters aren't secrets, but they describe the infrastructure
+    fd = os.open(cache_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as cache_file:
+        json.dump(parameters, cache_file)
+    return parameters
 
-    for p in aws_ssm_parameters:
-        response = ssm_client.get_parameter(
-            Name=f"/{env_name}/{p}"
-        )
-        config[p] = response['Parameter']['Value']
+
+def _build_execution_cofig(env_name, extra_env_vars=None, use_cache=True):
+    # The Django secret key is fetched while the parameters are read from SSM (or the cache).
+    # The database secret name is an SSM parameter, so that secret is fetched once the parameters are read.
+    django_secret_key_id = f"/{env_name}/DjangoSecretKey"
+    get_client("ssm")
+    get_client("secretsmanager")
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        django_secret_future = executor.submit(_get_secrets, [django_secret_key_id])
+        with timed("parameters"):
+            config = _get_cached_parameters(env_name, use_cache=use_cache)
+        with timed("secrets"):
+            db_secrets = json.loads(_get_secrets([config["DatabaseSecretNameParam"]])[config["DatabaseSecretNameParam"]])
+            django_secret_key = django_secret_future.result()[django_secret_key_id]
 
     # Networking config
-    response = ssm_client.get_parameter(
-        Name=f"/{env_name}/VpcPrivateSubnetsParam"
-    )
-    config["subnets"] = response['Parameter']['Value'].split(',')
+    config["subnets"] = config["VpcPrivateSubnetsParam"].split(',')
     # Let it use the default security group
     # config["securityGroups"] = [
     #     "sg-011d894ce2289d62b"
@@ -89,95 +152,50 @@ def _build_execution_cofig(env_name, extra_env_vars=None):
         {
             "name": "CELERY_TASK_ALWAYS_EAGER",
             "value": "False"
-        }
-    ]
-    # Retrieve extra env var values from SSM Parameter Store
-    response = ssm_client.get_parameter(
-        Name=f"/{env_name}/StaticFilesBucketNameParam"
-    )
-    config["environment"].append(
+        },
+        # Extra env var values from SSM Parameter Store
         {
             "name": "AWS_STATIC_FILES_BUCKET_NAME",
-            "value": response['Parameter']['Value']
-        }
-    )
-    response = ssm_client.get_parameter(
-        Name=f"/{env_name}/StaticFilesCloudFrontUrlParam"
-    )
-    config["environment"].append(
+            "value": config["StaticFilesBucketNameParam"]
+        },
         {
             "name": "AWS_STATIC_FILES_CLOUDFRONT_URL",
-            "value": response['Parameter']['Value']
-        }
-    )
-    response = ssm_client.get_parameter(
-        Name=f"/{env_name}/SqsDefaultQueueUrlParam"
-    )
-    config["environment"].append(
+            "value": config["StaticFilesCloudFrontUrlParam"]
+        },
         {
-            "name": "SQS_DEFAULT_QUEUE_URL",
-            "value": response['Parameter']['Value']
-        }
-    )
-
-    # Retrieve secret values from secrets manager
-    response = secrets_client.get_secret_value(
-        SecretId=f"/{env_name}/DjangoSecretKey"
-    )
-    config["environment"].append(
+            "name": "SQS_QUEUE_URLS",
+            "value": config["SqsQueueUrlsParam"]
+        },
+        # Secret values from secrets manager
         {
             "name": "DJANGO_SECRET_KEY",
-            "value": response['SecretString']
-        }
-    )
-    # Get the name of the secret containing database secrets from SSM
-    response = ssm_client.get_parameter(
-        Name=f"/{env_name}/DatabaseSecretNameParam"
-    )
-    db_secret_name = response['Parameter']['Value']
-    # Now get the actual secrets from secrets manager
-    response = secrets_client.get_secret_value(
-        SecretId=db_secret_name
-    )
-    db_secrets = json.loads(
-        response['SecretString']
-    )
-    config["environment"].append(
+            "value": django_secret_key
+        },
         {
             "name": "DB_HOST",
             "value": db_secrets['host']
-        }
-    )
-    config["environment"].append(
+        },
         {
             "name": "DB_PORT",
             "value": str(db_secrets['port'])
-        }
-    )
-    config["environment"].append(
+        },
         {
             "name": "DB_USER",
             "value": db_secrets['username']
-        }
-    )
-    config["environment"].append(
+        },
         {
             "name": "DB_PASSWORD",
             "value": db_secrets['password']
-        }
-    )
-    config["environment"].append(
+        },
         {
             "name": "AWS_ACCESS_KEY_ID",
             "value": AWS_ACCESS_KEY_ID
-        }
-    )
-    config["environment"].append(
+        },
         {
             "name": "AWS_SECRET_ACCESS_KEY",
             "value": AWS_SECRET_ACCESS_KEY
-        }
-    )
+        },
+    ]
     # Add extra env vars if any
     if extra_env_vars:
         for var in extra_env_vars:
@@ -192,10 +210,10 @@ def _build_execution_cofig(env_name, extra_env_vars=None):
 
 
 # This method runs a command as a task in AWS ECS Fargate
-def run_task_in_fargate(docker_cmd, config):
+def run_task_in_fargate(docker_cmd, config, extra_environment=None):
 
     # Call AWS API
-    aws_response = ecs_client.run_task(
+    aws_response = get_client("ecs").run_task(
         cluster=config["EcsClusterNameParam"],
         # Let it use the latest active revision of the task
         taskDefinition=config["TaskDefArnParam"],
@@ -215,7 +233,7 @@ def run_task_in_fargate(docker_cmd, config):
                 {
                     'name': config["container"],
                     'command': docker_cmd.split(" "),  # Expects a list
-                    'environment': config["environment"],
+                    'environment': config["environment"] + (extra_environment or []),
                 },
             ],
             'executionRoleArn': config["TaskExecRoleArnParam"],
@@ -225,6 +243,92 @@ def run_task_in_fargate(docker_cmd, config):
     return aws_response
 
 
+def run_sharded_tasks(docker_cmd, config, shard_count):
+    """
+    Run the command in shard_count tasks, each one with its SHARD_INDEX and SHARD_COUNT env vars.
+    Tasks are started concurrently. Returns the task arns, by shard index.
+    Raises RuntimeError if a shard couldn't be started.
+    """
+    get_client("ecs")
+
+    def run_shard(shard_index):
+        aws_response = run_task_in_fargate(
+            docker_cmd=docker_cmd,
+            config=config,
+            extra_environment=[
+                {"name": "SHARD_INDEX", "value": str(shard_index)},
+                {"name": "SHARD_COUNT", "value": str(shard_count)},
+            ],
+        )
+        if aws_response["failures"]:
+            raise RuntimeError(f"Shard {shard_index} couldn't be started: {aws_response['failures']}")
+        return aws_response["tasks"][0]["taskArn"]
+
+    with ThreadPoolExecutor(max_workers=min(shard_count, 10)) as executor:
+        return list(executor.map(run_shard, range(shard_count)))
+
+
+def wait_for_tasks(cluster, task_arns, timeout_seconds=None, initial_delay=5, max_delay=60):
+    """ Poll the tasks until all of them are stopped, with exponential backoff. Returns the tasks """
+    ecs_client = get_client("ecs")
+    deadline = time.monotonic() + timeout_seconds if timeout_seconds else None
+    delay = initial_delay
+    while True:
+        tasks = []
+        # Up to 100 tasks per call
+        for i in range(0, len(task_arns), 100):
+            response = ecs_client.describe_tasks(cluster=cluster, tasks=task_arns[i:i + 100])
+            tasks.extend(response["tasks"])
+        running = [task for task in tasks if task["lastStatus"] != "STOPPED"]
+        print(f"{len(tasks) - len(running)}/{len(task_arns)} tasks stopped")
+        if not running:
+            tasks_by_arn = {task["taskArn"]: task for task in tasks}
+            return [tasks_by_arn[task_arn] for task_arn in task_arns]
+        if deadline and time.monotonic() + delay > deadline:
+            raise TimeoutError(f"{len(running)} tasks still running after {timeout_seconds}s")
+        time.sleep(delay)
+        delay = min(delay * 2, max_delay)
+
+
+def get_log_stream_url(config, task_arn):
+    """ CloudWatch console url of the logs of the task, when it logs with the awslogs driver """
+    task_definition = _get_task_definition(config["TaskDefArnParam"])
+    container = next(c for c in task_definition["containerDefinitions"] if c["name"] == config["container"])
+    log_options = container.get("logConfiguration", {}).get("options", {})
+    if "awslogs-group" not in log_options:
+        return None
+    log_stream = f"{log_options.get('awslogs-stream-prefix')}/{config['container']}/{task_arn.split('/')[-1]}"
+    region = log_options.get("awslogs-region", AWS_REGION_NAME)
+
+    def console_encode(value):
+        return value.replace("/", "$252F")
+
+    return (
+        f"https://{region}.console.aws.amazon.com/cloudwatch/home?region={region}#logsV2:log-groups/log-group/"
+        f"{console_encode(log_options['awslogs-group'])}/log-events/{console_encode(log_stream)}"
+    )
+
+
+@lru_cache(maxsize=None)
+def _get_task_definition(task_definition_arn):
+    return get_client("ecs").describe_task_definition(taskDefinition=task_definition_arn)["taskDefinition"]
+
+
+def report_tasks(config, tasks):
+    """ Print the exit code and logs of each task. Returns 0 if all the tasks succeeded, 1 otherwise """
+    failed = 0
+    for shard_index, task in enumerate(tasks):
+        container = next(c for c in task["containers"] if c["name"] == config["container"])
+        exit_code = container.get("exitCode")
+        if exit_code != 0:
+            failed += 1
+        reason = container.get("reason") or task.get("stoppedReason", "")
+        print(f"Shard {shard_index}: exit code {exit_code} {reason}")
+        print(f"  Logs: {get_log_stream_url(config, task['taskArn'])}")
+    print(f"{len(tasks) - failed}/{len(tasks)} tasks succeeded")
+    return 1 if failed else 0
+
+
 def init_argparse() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(
         description="Run a command as a fargate task in ecs, using the same container and settings used by the App"
@@ -247,18 +351,75 @@ def init_argparse() -> argparse.ArgumentParser:
         action='append',  # Make a list witht he multiple env vars
         required=False
     )
+    parser.add_argument(
+        "--no-cache",
+        dest="use_cache",
+        help="Read the parameters from SSM, instead of the cache of the last minutes (i.e. right after a deploy)",
+        action="store_false",
+    )
+    parser.add_argument(
+        "--shards",
+        help="Run the command in N tasks, with the SHARD_INDEX and SHARD_COUNT env vars (see common.sharding), "
+             "and wait for all of them to finish",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--wait",
+        help="Wait for the task to finish, and exit with its exit code",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--timeout",
+        help="Seconds to wait for the tasks to finish",
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        "--timings",
+        help="Report the time spent loading the config and starting the task",
+        action="store_true",
+    )
     return parser
 
 
 if __name__ == "__main__":
+    start = time.perf_counter()
     parser = init_argparse()
     args = parser.parse_args()
     env_name = args.env_name
     docker_cmd = args.command
     env_vars = args.env_vars
     print(f"Building execution config for {env_name}")
-    config = _build_execution_cofig(env_name=env_name, extra_env_vars=env_vars)
+    config = _build_execution_cofig(env_name=env_name, extra_env_vars=env_vars, use_cache=args.use_cache)
     print(f"Config loaded:\n{config}")
-    print(f"Starting task in ECS with command:\n{docker_cmd}")
-    aws_response = run_task_in_fargate(docker_cmd=docker_cmd, config=config)
-    print(f"AWS Response:\n{aws_response}")
+    exit_code = 0
+    if args.shards > 1:
+        print(f"Starting {args.shards} tasks in ECS with command:\n{docker_cmd}")
+        with timed("run_task"):
+            try:
+                task_arns = run_sharded_tasks(docker_cmd=docker_cmd, config=config, shard_count=args.shards)
+            except RuntimeError as error:
+                # The other shards may have been started
+                print(f"{error}. Check the tasks started in the cluster {config['EcsClusterNameParam']}")
+                sys.exit(1)
+    else:
+        print(f"Starting task in ECS with command:\n{docker_cmd}")
+        with timed("run_task"):
+            aws_response = run_task_in_fargate(docker_cmd=docker_cmd, config=config)
+        print(f"AWS Response:\n{aws_response}")
+        if aws_response["failures"]:
+            print(f"The task couldn't be started: {aws_response['failures']}")
+            sys.exit(1)
+        task_arns = [task["taskArn"] for task in aws_response["tasks"]]
+    if args.timings:
+        timings["total"] = time.perf_counter() - start
+        print("Timings: " + ", ".join(f"{step} {seconds * 1000:.0f}ms" for step, seconds in timings.items()))
+    if task_arns and (args.shards > 1 or args.wait):
+        try:
+            tasks = wait_for_tasks(config["EcsClusterNameParam"], task_arns, timeout_seconds=args.timeout)
+        except TimeoutError as error:
+            print(f"{error}: stopped waiting, the tasks keep running in the cluster {config['EcsClusterNameParam']}")
+            sys.exit(1)
+        exit_code = report_tasks(config, tasks)
+    sys.exit(exit_code)
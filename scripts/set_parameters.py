@@ -1,7 +1,21 @@
 import json
-import os
+import sys
 import argparse
-import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+
+# Names per GetParameters call, and secrets per BatchGetSecretValue call
+MAX_PARAMETERS_PER_CALL = 10
+MAX_SECRETS_PER_CALL = 20
+
+CREATE = "create"
+UPDATE = "update"
+UNCHANGED = "unchanged"
+SKIP = "skip"  # Changed, but --overwrite wasn't set
 
 
 def init_argparse() -> argparse.ArgumentParser:
@@ -38,29 +52,151 @@ def init_argparse() -> argparse.ArgumentParser:
         action="store_true",
         default=False
     )
+    parser.add_argument(
+        "--dry-run",
+        help="Show the parameters that would be created or updated, without changing them",
+        dest="is_dry_run",
+        action="store_true",
+        default=False
+    )
+    parser.add_argument(
+        "--concurrency",
+        help="Parameters written at the same time. Throttled requests are retried with adaptive backoff.",
+        type=int,
+        default=4,
+    )
     return parser
 
 
+def parse_tags(tags):
+    """ Tags in the aws cli format: Key=project,Value=MyDjangoApp Key=env,Value=prod """
+    if not tags:
+        return []
+    parsed = []
+    for tag in tags.split():
+        fields = dict(field.split("=", maxsplit=1) for field in tag.split(","))
+        parsed.append({"Key": fields["Key"], "Value": fields["Value"]})
+    return parsed
+
+
+def create_client(service_name, profile=None, concurrency=4):
+    session = boto3.session.Session(profile_name=profile)
+    return session.client(
+        service_name,
+        config=Config(
+            # Retry throttled requests, slowing down the client
+            retries={"max_attempts": 10, "mode": "adaptive"},
+            max_pool_connections=concurrency,
+        ),
+    )
+
+
+def get_current_parameters(ssm_client, names):
+    """ Current values of the SSM parameters, by name. Missing parameters aren't included """
+    values = {}
+    for i in range(0, len(names), MAX_PARAMETERS_PER_CALL):
+        response = ssm_client.get_parameters(Names=names[i:i + MAX_PARAMETERS_PER_CALL], WithDecryption=True)
+        for parameter in response["Parameters"]:
+            values[parameter["Name"]] = parameter["Value"]
+    return values
+
+
+def get_current_secrets(secrets_client, names):
+    """ Current values of the secrets, by name. Missing secrets aren't included """
+    values = {}
+    for i in range(0, len(names), MAX_SECRETS_PER_CALL):
+        response = secrets_client.batch_get_secret_value(SecretIdList=names[i:i + MAX_SECRETS_PER_CALL])
+        for secret in response["SecretValues"]:
+            values[secret["Name"]] = secret.get("SecretString")
+        for error in response.get("Errors", []):
+            if error["ErrorCode"] != "ResourceNotFoundException":
+                raise RuntimeError(f"Can't read the secret {error['SecretId']}: {error.get('Message')}")
+    return values
+
+
+def diff_parameters(parameters, current_values, is_overwrite):
+    """ The action to take for each parameter: create, update, unchanged or skip """
+    actions = {}
+    for key, value in parameters.items():
+        if key not in current_values:
+            actions[key] = CREATE
+        elif current_values[key] == value:
+            actions[key] = UNCHANGED
+        else:
+            actions[key] = UPDATE if is_overwrite else SKIP
+    return actions
+
+
+def put_parameter(ssm_client, key, value, action, tags):
+    kwargs = {"Name": key, "Value": value, "Type": "String"}
+    if action == UPDATE:
+        # Tags can't be set when overwriting a parameter
+        kwargs["Overwrite"] = True
+    elif tags:
+        kwargs["Tags"] = tags
+    ssm_client.put_parameter(**kwargs)
+
+
+def put_secret(secrets_client, key, value, action, tags):
+    if action == UPDATE:
+        secrets_client.put_secret_value(SecretId=key, SecretString=value)
+        return
+    kwargs = {"Name": key, "SecretString": value}
+    if tags:
+        kwargs["Tags"] = tags
+    try:
+        secrets_client.create_secret(**kwargs)
+    except ClientError as error:
+        # Created since the current values were read
+        if error.response["Error"]["Code"] != "ResourceExistsException":
+            raise
+        secrets_client.put_secret_value(SecretId=key, SecretString=value)
+
+
 if __name__ == "__main__":
     parser = init_argparse()
     args = parser.parse_args()
     print("Settings parameters in AWS..")
     with open(args.file, "r") as parameters_file:
         parameters = json.load(parameters_file)
-        for key, value in parameters.items():
-            command = ["aws"]
-            if args.profile:
-                command.extend(["--profile", args.profile])
-            if args.is_secret:  # Secret in secrets manager
-                command.extend(["secretsmanager", "create-secret", "--name", key, "--secret-string", value])
-                if args.is_overwrite:
-                    command.append("--force-overwrite-replica-secret")
-            else:  # Regular parameter in SSM
-                command.extend(["ssm", "put-parameter", "--name", key, "--value", value, "--type", "String"])
-                if args.is_overwrite:
-                    command.append("--overwrite")
-                elif args.tags:
-                    command.extend(["--tags", args.tags])
-            print(command)
-            response = subprocess.call(command)
-    print("Finished.")
+    client = create_client(
+        "secretsmanager" if args.is_secret else "ssm", profile=args.profile, concurrency=args.concurrency
+    )
+    if args.is_secret:  # Secrets in secrets manager
+        current_values = get_current_secrets(client, list(parameters))
+        put = put_secret
+    else:  # Regular parameters in SSM
+        current_values = get_current_parameters(client, list(parameters))
+        put = put_parameter
+    actions = diff_parameters(parameters, current_values, args.is_overwrite)
+    for key, action in actions.items():
+        if action == SKIP:
+            print(f"{key}: {action} (already exists with a different value, use --overwrite)")
+        elif action == UPDATE and not args.is_secret:
+            print(f"{key}: {action} ({current_values[key]!r} -> {parameters[key]!r})")
+        else:
+            print(f"{key}: {action}")
+    to_write = [key for key, action in actions.items() if action in (CREATE, UPDATE)]
+    if args.is_dry_run:
+        print(f"Dry run: {len(to_write)} parameters would be written.")
+        sys.exit(0)
+
+    tags = parse_tags(args.tags)
+
+    def write(key):
+        try:
+            put(client, key, parameters[key], actions[key], tags)
+        except ClientError as error:
+            return key, error
+        return key, None
+
+    errors = 0
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        for key, error in executor.map(write, to_write):
+            if error:
+                errors += 1
+                print(f"{key}: error {error}")
+            else:
+                print(f"{key}: {actions[key]}d")
+    print(f"Finished. {len(to_write) - errors} parameters written, {errors} errors.")
+    sys.exit(1 if errors else 0)
@@ -0,0 +1,24 @@
+import pytest
+import aws_cdk as core
+
+from my_django_app.deployment_stage import MyDjangoAppPipelineStage
+
+
+@pytest.fixture
+def make_stage(monkeypatch):
+    """ Build a deployment stage with test values, accepting the same arguments as MyDjangoAppPipelineStage """
+    # Required by the stage to set the AWS_ACCOUNT_ID env var
+    monkeypatch.setenv("CDK_DEFAULT_ACCOUNT", "123456789012")
+
+    def _make_stage(**kwargs):
+        app = core.App()
+        stage_kwargs = {
+            "env": core.Environment(account="123456789012", region="us-east-1"),
+            "django_settings_module": "app.settings.stage",
+            "django_debug": False,
+            "domain_name": "example.com",
+        }
+        stage_kwargs.update(kwargs)
+        return MyDjangoAppPipelineStage(app, "Test", **stage_kwargs)
+
+    return _make_stage
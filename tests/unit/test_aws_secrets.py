@@ -0,0 +1,165 @@
+import base64
+import sys
+from pathlib import Path
+
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+from botocore.stub import Stubber
+
+# aws_utils is part of the django app
+sys.path.append(str(Path(__file__).parents[2] / "app"))
+from aws_utils import aws_secrets  # noqa: E402
+from aws_utils.aws_secrets import SecretsCache  # noqa: E402
+
+
+SECRET_ARN = "arn:aws:secretsmanager:us-east-1:123456789012:secret:{name}-AbCdEf"
+
+
+@pytest.fixture
+def client():
+    client = boto3.client(
+        "secretsmanager",
+        region_name="us-east-1",
+        aws_access_key_id="FAKEABCDEFGHIJKLMNOP",
+        aws_secret_access_key="FAKE7NiynG+TogH8Nj+P9nlE73sq3",
+    )
+    with Stubber(client) as stubber:
+        client.stubber = stubber
+        yield client
+        stubber.assert_no_pending_responses()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """ Control the time seen by the cache """
+    now = [1000.0]
+    monkeypatch.setattr(aws_secrets.time, "monotonic", lambda: now[0])
+    return now
+
+
+def secret_value(name, value, version=1):
+    version_id = f"{version:032d}"
+    return {"ARN": SECRET_ARN.format(name=name), "Name": name, "VersionId": version_id, "SecretString": value}
+
+
+def test_secret_is_cached(client, clock):
+    client.stubber.add_response("get_secret_value", secret_value("db", "s3cr3t"), {"SecretId": "db"})
+    cache = SecretsCache(client)
+
+    assert cache.get("db") == "s3cr3t"
+    clock[0] += 60
+    assert cache.get("db") == "s3cr3t"
+
+
+def test_secret_is_refreshed_after_ttl(client, clock):
+    client.stubber.add_response("get_secret_value", secret_value("db", "old"), {"SecretId": "db"})
+    client.stubber.add_response("get_secret_value", secret_value("db", "rotated", version=2), {"SecretId": "db"})
+    cache = SecretsCache(client, ttl_seconds=300, ttl_jitter=0.2)
+
+    assert cache.get("db") == "old"
+    clock[0] += 300
+    assert cache.get("db") == "rotated"
+
+
+def test_force_refresh(client, clock):
+    client.stubber.add_response("get_secret_value", secret_value("db", "old"), {"SecretId": "db"})
+    client.stubber.add_response("get_secret_value", secret_value("db", "rotated", version=2), {"SecretId": "db"})
+    cache = SecretsCache(client)
+
+    assert cache.get("db") == "old"
+    assert cache.get("db", force_refresh=True) == "rotated"
+
+
+def test_binary_secret(client, clock):
+    client.stubber.add_response(
+        "get_secret_value",
+        {"ARN": SECRET_ARN.format(name="key"), "Name": "key", "SecretBinary": base64.b64encode(b"\x00\x01")},
+        {"SecretId": "key"},
+    )
+    cache = SecretsCache(client)
+
+    assert cache.get("key") == b"\x00\x01"
+
+
+def test_stale_value_returned_on_transient_errors(client, clock):
+    client.stubber.add_response("get_secret_value", secret_value("db", "s3cr3t"), {"SecretId": "db"})
+    client.stubber.add_client_error("get_secret_value", "InternalServiceError", expected_params={"SecretId": "db"})
+    cache = SecretsCache(client, ttl_seconds=300, max_stale_seconds=3600)
+
+    assert cache.get("db") == "s3cr3t"
+    clock[0] += 600
+    assert cache.get("db") == "s3cr3t"
+    # Not retried right away
+    assert cache.get("db") == "s3cr3t"
+
+
+def test_stale_value_expires(client, clock):
+    client.stubber.add_response("get_secret_value", secret_value("db", "s3cr3t"), {"SecretId": "db"})
+    client.stubber.add_client_error("get_secret_value", "ThrottlingException", expected_params={"SecretId": "db"})
+    cache = SecretsCache(client, ttl_seconds=300, max_stale_seconds=3600)
+
+    cache.get("db")
+    clock[0] += 4000
+    with pytest.raises(ClientError):
+        cache.get("db")
+
+
+def test_other_errors_are_raised(client, clock):
+    client.stubber.add_response("get_secret_value", secret_value("db", "s3cr3t"), {"SecretId": "db"})
+    client.stubber.add_client_error(
+        "get_secret_value", "ResourceNotFoundException", expected_params={"SecretId": "db"}
+    )
+    cache = SecretsCache(client)
+
+    cache.get("db")
+    clock[0] += 600
+    with pytest.raises(ClientError):
+        cache.get("db")
+
+
+def test_get_many_in_one_call(client, clock):
+    client.stubber.add_response(
+        "batch_get_secret_value",
+        {
+            "SecretValues": [secret_value("db", "s3cr3t"), secret_value("api", "k3y")],
+            "Errors": [],
+        },
+        {"SecretIdList": ["db", "api"]},
+    )
+    cache = SecretsCache(client)
+
+    assert cache.get_many(["db", "api"]) == {"db": "s3cr3t", "api": "k3y"}
+    # Served from the cache
+    assert cache.get("api") == "k3y"
+    assert cache.get_many(["api", "db"]) == {"db": "s3cr3t", "api": "k3y"}
+
+
+def test_get_many_only_fetches_expired_secrets(client, clock):
+    client.stubber.add_response("get_secret_value", secret_value("db", "s3cr3t"), {"SecretId": "db"})
+    client.stubber.add_response(
+        "batch_get_secret_value",
+        {"SecretValues": [secret_value("api", "k3y")], "Errors": []},
+        {"SecretIdList": ["api"]},
+    )
+    cache = SecretsCache(client)
+
+    cache.get("db")
+    assert cache.get_many(["db", "api"]) == {"db": "s3cr3t", "api": "k3y"}
+
+
+def test_get_many_errors(client, clock):
+    client.stubber.add_response(
+        "batch_get_secret_value",
+        {
+            "SecretValues": [secret_value("db", "s3cr3t")],
+            "Errors": [{"SecretId": "missing", "ErrorCode": "ResourceNotFoundException", "Message": "Not found"}],
+        },
+        {"SecretIdList": ["db", "missing"]},
+    )
+    cache = SecretsCache(client)
+
+    with pytest.raises(ClientError):
+        cache.get_many(["db", "missing"])
+    # Secrets fetched are cached anyway
+    assert cache.get("db") == "s3cr3t"
@@ -0,0 +1,138 @@
+import pytest
+import aws_cdk.assertions as assertions
+from aws_cdk.assertions import Match
+
+
+def test_workers_connect_to_db_through_pgbouncer(make_stage):
+    stage = make_stage(db_connection_proxy="pgbouncer")
+    template = assertions.Template.from_stack(stage.workers)
+
+    template.has_resource_properties("AWS::ECS::TaskDefinition", {
+        "ContainerDefinitions": [
+            Match.object_like({
+                "Name": "celery_worker",
+                "DependsOn": [{"Condition": "START", "ContainerName": "pgbouncer"}],
+                "Environment": Match.array_with([
+                    {"Name": "DB_HOST", "Value": "127.0.0.1"},
+                ]),
+            }),
+            Match.object_like({"Name": "pgbouncer"}),
+        ]
+    })
+
+
+def test_workers_scale_on_backlog_per_task(make_stage):
+    stage = make_stage(worker_acceptable_latency_seconds=60, worker_messages_per_second_per_task=2)
+    template = assertions.Template.from_stack(stage.workers)
+
+    template.has_resource_properties("AWS::ApplicationAutoScaling::ScalingPolicy", {
+        "PolicyType": "TargetTrackingScaling",
+        "TargetTrackingScalingPolicyConfiguration": {
+            "TargetValue": 120,
+            "CustomizedMetricSpecification": {
+                "Metrics": Match.array_with([
+                    Match.object_like({"Id": "backlog_per_task", "Expression": "visible / FILL(tasks, 1)", "ReturnData": True}),
+                ])
+            },
+        },
+    })
+    # Step scaling on the number of messages is kept as a fallback
+    template.has_resource_properties("AWS::ApplicationAutoScaling::ScalingPolicy", {
+        "PolicyType": "StepScaling",
+    })
+
+
+def test_workers_backlog_scaling_disabled_by_default(make_stage):
+    stage = make_stage()
+    template = assertions.Template.from_stack(stage.workers)
+
+    template.has_resource_properties("AWS::ApplicationAutoScaling::ScalingPolicy", {
+        "PolicyType": "TargetTrackingScaling",
+        "TargetTrackingScalingPolicyConfiguration": Match.object_like({
+            "PredefinedMetricSpecification": {"PredefinedMetricType": "ECSServiceAverageCPUUtilization"},
+        }),
+    })
+    template.resource_count_is("AWS::ApplicationAutoScaling::ScalingPolicy", 3)
+
+
+def test_workers_service_per_queue(make_stage):
+    stage = make_stage()
+
+    queues_template = assertions.Template.from_stack(stage.queues)
+    queues_template.resource_count_is("AWS::SQS::Queue", 3)
+    queues_template.has_resource_properties("AWS::SQS::Queue", {
+        "VisibilityTimeout": 10800,
+        "ReceiveMessageWaitTimeSeconds": 20,
+    })
+    assert set(stage.workers_by_queue) == {"default", "high_priority", "bulk"}
+    template = assertions.Template.from_stack(stage.workers_by_queue["bulk"])
+    template.has_resource_properties("AWS::ECS::TaskDefinition", {
+        "Cpu": "512",
+        "ContainerDefinitions": [
+            Match.object_like({
+                "Name": "celery_worker",
+                "Command": ["start-celery-worker.sh", "bulk"],
+                "Environment": Match.array_with([
+                    {"Name": "SQS_QUEUE_URLS", "Value": Match.any_value()},
+                    {
+                        "Name": "SQS_VISIBILITY_TIMEOUTS",
+                        "Value": '{"default": 3600, "high_priority": 600, "bulk": 10800}',
+                    },
+                    {"Name": "CELERY_WORKER_POOL", "Value": "prefork"},
+                    {"Name": "CELERY_WORKER_MAX_TASKS_PER_CHILD", "Value": "100"},
+                ]),
+            }),
+        ]
+    })
+
+
+def test_workers_pool_settings(make_stage):
+    stage = make_stage(worker_pool="gevent", worker_concurrency=200)
+    template = assertions.Template.from_stack(stage.workers)
+
+    template.has_resource_properties("AWS::ECS::TaskDefinition", {
+        "ContainerDefinitions": [
+            Match.object_like({
+                "Name": "celery_worker",
+                "Environment": Match.array_with([
+                    {"Name": "TASK_CPU", "Value": "256"},
+                    {"Name": "CELERY_WORKER_POOL", "Value": "gevent"},
+                    {"Name": "CELERY_WORKER_CONCURRENCY", "Value": "200"},
+                ]),
+            }),
+        ]
+    })
+
+
+def test_workers_invalid_pool(make_stage):
+    with pytest.raises(ValueError):
+        make_stage(worker_pool="eventlet")
+
+
+def test_workers_scale_on_queue_wait_time(make_stage):
+    stage = make_stage(worker_queue_wait_target_seconds=30)
+    template = assertions.Template.from_stack(stage.workers)
+
+    template.has_resource_properties("AWS::ECS::TaskDefinition", {
+        "ContainerDefinitions": [
+            Match.object_like({
+                "Name": "celery_worker",
+                "Environment": Match.array_with([
+                    {"Name": "TASK_METRICS_NAMESPACE", "Value": stage.task_metrics_namespace},
+                ]),
+            }),
+        ]
+    })
+    template.has_resource_properties("AWS::ApplicationAutoScaling::ScalingPolicy", {
+        "PolicyType": "TargetTrackingScaling",
+        "TargetTrackingScalingPolicyConfiguration": Match.object_like({
+            "TargetValue": 30000,
+            "DisableScaleIn": True,
+            "CustomizedMetricSpecification": {
+                "Namespace": stage.task_metrics_namespace,
+                "MetricName": "QueueWaitTime",
+                "Dimensions": [{"Name": "Queue", "Value": "default"}],
+                "Statistic": "Average",
+            },
+        }),
+    })
@@ -0,0 +1,34 @@
+import aws_cdk.assertions as assertions
+from aws_cdk.assertions import Match
+
+
+def test_redis_cache_created(make_stage):
+    stage = make_stage(cache_num_nodes=2)
+    template = assertions.Template.from_stack(stage.cache)
+
+    template.has_resource_properties("AWS::ElastiCache::ReplicationGroup", {
+        "Engine": "redis",
+        "NumCacheClusters": 2,
+        "AutomaticFailoverEnabled": True,
+    })
+    template.has_resource_properties("AWS::EC2::SecurityGroup", {
+        "SecurityGroupIngress": [
+            Match.object_like({"FromPort": 6379, "ToPort": 6379}),
+        ]
+    })
+
+
+def test_app_uses_cache_for_sessions(make_stage):
+    stage = make_stage()
+    template = assertions.Template.from_stack(stage.django_app)
+
+    template.has_resource_properties("AWS::ECS::TaskDefinition", {
+        "ContainerDefinitions": [
+            Match.object_like({
+                "Environment": Match.array_with([
+                    Match.object_like({"Name": "CACHE_REDIS_URL"}),
+                    {"Name": "DJANGO_SESSION_ENGINE", "Value": "django.contrib.sessions.backends.cached_db"},
+                ]),
+            }),
+        ]
+    })
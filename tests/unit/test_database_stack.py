@@ -0,0 +1,41 @@
+import aws_cdk.assertions as assertions
+from aws_cdk.assertions import Match
+
+
+def test_serverless_v1_cluster_by_default(make_stage):
+    stage = make_stage()
+    template = assertions.Template.from_stack(stage.database)
+
+    template.has_resource_properties("AWS::RDS::DBCluster", {"EngineMode": "serverless"})
+    template.resource_count_is("AWS::RDS::DBInstance", 0)
+
+
+def test_serverless_v2_cluster_with_readers(make_stage):
+    stage = make_stage(db_engine_mode="serverless_v2", db_readers=2, db_serverless_v2_max_capacity=8)
+    template = assertions.Template.from_stack(stage.database)
+
+    template.has_resource_properties("AWS::RDS::DBCluster", {
+        "Engine": "aurora-postgresql",
+        "ServerlessV2ScalingConfiguration": {"MinCapacity": 0.5, "MaxCapacity": 8},
+    })
+    # A writer and 2 readers
+    template.resource_count_is("AWS::RDS::DBInstance", 3)
+    template.has_resource_properties("AWS::RDS::DBInstance", {"DBInstanceClass": "db.serverless"})
+
+
+def test_app_reads_from_reader_endpoint(make_stage):
+    stage = make_stage(db_engine_mode="provisioned", db_readers=1)
+    template = assertions.Template.from_stack(stage.django_app)
+
+    template.has_resource_properties("AWS::ECS::TaskDefinition", {
+        "ContainerDefinitions": [
+            Match.object_like({
+                "Name": "django_app",
+                "Environment": Match.array_with([
+                    Match.object_like({"Name": "DB_REPLICA_HOST"}),
+                ]),
+            }),
+        ]
+    })
+    database_template = assertions.Template.from_stack(stage.database)
+    database_template.has_resource_properties("AWS::RDS::DBInstance", {"DBInstanceClass": "db.t4g.medium"})
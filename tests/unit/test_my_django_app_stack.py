@@ -1,15 +1,181 @@
-import aws_cdk as core
 import aws_cdk.assertions as assertions
+from aws_cdk.assertions import Match
 
-from my_django_app.my_django_app_stack import MyDjangoAppStack
 
-# example tests. To run these tests, uncomment this file along with the example
-# resource in my_django_app/my_django_app_stack.py
-def test_sqs_queue_created():
-    app = core.App()
-    stack = MyDjangoAppStack(app, "my-django-app")
-    template = assertions.Template.from_stack(stack)
+def test_app_service_created(make_stage):
+    stage = make_stage()
+    template = assertions.Template.from_stack(stage.django_app)
 
-#     template.has_resource_properties("AWS::SQS::Queue", {
-#         "VisibilityTimeout": 300
-#     })
+    template.resource_count_is("AWS::ECS::Service", 1)
+    template.has_resource_properties("AWS::ECS::TaskDefinition", {
+        "ContainerDefinitions": [
+            Match.object_like({
+                "Name": "django_app",
+                "Secrets": Match.array_with([
+                    Match.object_like({"Name": "DB_HOST"}),
+                ]),
+            }),
+        ]
+    })
+
+
+def test_app_service_connects_to_db_through_pgbouncer(make_stage):
+    stage = make_stage(db_connection_proxy="pgbouncer")
+    template = assertions.Template.from_stack(stage.django_app)
+
+    template.has_resource_properties("AWS::ECS::TaskDefinition", {
+        "ContainerDefinitions": [
+            Match.object_like({
+                "Name": "django_app",
+                "DependsOn": [{"Condition": "START", "ContainerName": "pgbouncer"}],
+                "Environment": Match.array_with([
+                    {"Name": "DB_HOST", "Value": "127.0.0.1"},
+                    {"Name": "DB_DISABLE_SERVER_SIDE_CURSORS", "Value": "True"},
+                ]),
+                "Secrets": Match.not_(Match.array_with([
+                    Match.object_like({"Name": "DB_HOST"}),
+                ])),
+            }),
+            Match.object_like({
+                "Name": "pgbouncer",
+                "Essential": True,
+                "Environment": Match.array_with([
+                    {"Name": "POOL_MODE", "Value": "transaction"},
+                ]),
+                "Secrets": Match.array_with([
+                    Match.object_like({"Name": "DB_HOST"}),
+                    Match.object_like({"Name": "DB_PASSWORD"}),
+                ]),
+            }),
+        ]
+    })
+
+
+def test_app_server_settings(make_stage):
+    stage = make_stage(app_server_mode="asgi")
+    template = assertions.Template.from_stack(stage.django_app)
+
+    template.has_resource_properties("AWS::ECS::TaskDefinition", {
+        "ContainerDefinitions": [
+            Match.object_like({
+                "Name": "django_app",
+                "Environment": Match.array_with([
+                    {"Name": "SERVER_MODE", "Value": "asgi"},
+                    {"Name": "TASK_CPU", "Value": "256"},
+                    {"Name": "TASK_MEMORY_MIB", "Value": "512"},
+                ]),
+            }),
+        ]
+    })
+
+
+def test_app_request_profiling_settings(make_stage):
+    stage = make_stage(request_profiling=True, request_profiling_sample_rate=0.05)
+    template = assertions.Template.from_stack(stage.django_app)
+
+    template.has_resource_properties("AWS::ECS::TaskDefinition", {
+        "ContainerDefinitions": [
+            Match.object_like({
+                "Name": "django_app",
+                "Environment": Match.array_with([
+                    {"Name": "REQUEST_PROFILING", "Value": "True"},
+                    {"Name": "REQUEST_PROFILING_SAMPLE_RATE", "Value": "0.05"},
+                ]),
+            }),
+        ]
+    })
+
+
+def test_load_balancer_checks_liveness_path(make_stage):
+    stage = make_stage()
+    template = assertions.Template.from_stack(stage.django_app)
+
+    template.has_resource_properties("AWS::ElasticLoadBalancingV2::TargetGroup", {
+        "HealthCheckPath": "/status/",
+        "HealthyThresholdCount": 3,
+        "UnhealthyThresholdCount": 2,
+    })
+
+
+def test_app_scales_on_request_count(make_stage):
+    stage = make_stage(app_requests_per_target=1200)
+    template = assertions.Template.from_stack(stage.django_app)
+
+    template.has_resource_properties("AWS::ApplicationAutoScaling::ScalingPolicy", {
+        "PolicyType": "TargetTrackingScaling",
+        "TargetTrackingScalingPolicyConfiguration": Match.object_like({
+            "PredefinedMetricSpecification": Match.object_like({
+                "PredefinedMetricType": "ALBRequestCountPerTarget",
+            }),
+            "TargetValue": 1200,
+        }),
+    })
+
+
+def test_app_scales_on_response_time(make_stage):
+    stage = make_stage(
+        app_response_time_scaling_steps=[
+            {"upper": 1, "change": 0},
+            {"lower": 1, "change": +1},
+            {"lower": 3, "change": +2},
+        ]
+    )
+    template = assertions.Template.from_stack(stage.django_app)
+
+    template.has_resource_properties("AWS::ApplicationAutoScaling::ScalingPolicy", {
+        "PolicyType": "StepScaling",
+        "StepScalingPolicyConfiguration": Match.object_like({
+            "AdjustmentType": "ChangeInCapacity",
+            "StepAdjustments": [
+                {"MetricIntervalLowerBound": 0, "MetricIntervalUpperBound": 2, "ScalingAdjustment": 1},
+                {"MetricIntervalLowerBound": 2, "ScalingAdjustment": 2},
+            ],
+        }),
+    })
+    template.has_resource_properties("AWS::CloudWatch::Alarm", {
+        "MetricName": "TargetResponseTime",
+        "ExtendedStatistic": "p95",
+        "Threshold": 1,
+        "ComparisonOperator": "GreaterThanOrEqualToThreshold",
+    })
+
+
+def test_app_response_time_scaling_disabled_by_default(make_stage):
+    stage = make_stage()
+    template = assertions.Template.from_stack(stage.django_app)
+
+    template.resource_count_is("AWS::CloudWatch::Alarm", 0)
+
+
+def test_deploy_commands_run_before_service_update(make_stage):
+    stage = make_stage()
+    template = assertions.Template.from_stack(stage.django_app)
+
+    custom_resources = template.find_resources("AWS::CloudFormation::CustomResource", {
+        "Properties": {
+            "ContainerName": "django_app",
+            "Command": [
+                "sh", "-c", "python manage.py migrate --noinput && python manage.py collectstatic_incremental"
+            ],
+        }
+    })
+    assert len(custom_resources) == 1
+    deploy_task_id = next(iter(custom_resources))
+    services = template.find_resources("AWS::ECS::Service")
+    assert deploy_task_id in next(iter(services.values()))["DependsOn"]
+
+
+def test_workers_are_updated_after_the_deploy_commands(make_stage):
+    stage = make_stage()
+    assembly = stage.synth()
+
+    for workers in stage.workers_by_queue.values():
+        dependencies = assembly.get_stack_artifact(workers.artifact_id).dependencies
+        assert stage.django_app.artifact_id in [dependency.id for dependency in dependencies]
+
+
+def test_deploy_commands_disabled(make_stage):
+    stage = make_stage(app_deploy_commands=[])
+    template = assertions.Template.from_stack(stage.django_app)
+
+    template.resource_count_is("AWS::CloudFormation::CustomResource", 0)
@@ -0,0 +1,31 @@
+import aws_cdk.assertions as assertions
+from aws_cdk.assertions import Match
+
+
+def test_static_files_cached_and_compressed(make_stage):
+    stage = make_stage()
+    template = assertions.Template.from_stack(stage.static_files)
+
+    template.has_resource_properties("AWS::CloudFront::CachePolicy", {
+        "CachePolicyConfig": Match.object_like({
+            "MaxTTL": 31536000,
+            "ParametersInCacheKeyAndForwardedToOrigin": Match.object_like({
+                "EnableAcceptEncodingGzip": True,
+                "EnableAcceptEncodingBrotli": True,
+            }),
+        }),
+    })
+    template.has_resource_properties("AWS::CloudFront::Distribution", {
+        "DistributionConfig": Match.object_like({
+            "CacheBehaviors": [
+                Match.object_like({
+                    "PathPattern": "static/*",
+                    "Compress": True,
+                    "CachePolicyId": Match.any_value(),
+                    "FunctionAssociations": [
+                        Match.object_like({"EventType": "viewer-request"}),
+                    ],
+                }),
+            ],
+        }),
+    })